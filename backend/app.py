@@ -1,9 +1,14 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from .src.sqldb.models import Base
 from .src.sqldb.db import engine
 from .src.routing import auth
 from .src.routing import ai
+from .src.routing import jobs
+from .src.core.usage import usage_scope
+from .src.core.executor import set_main_loop
+from .src.core.jobs import get_job_runner
+import asyncio
 
 # kreira tabele ako ne postoje
 Base.metadata.create_all(bind=engine)
@@ -25,5 +30,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def bind_event_loop():
+    # Coroutines started from job threads and sync routes run on this loop.
+    set_main_loop(asyncio.get_running_loop())
+
+
+@app.on_event("startup")
+def start_job_runner():
+    # Marks jobs left queued / running by a previous process as failed.
+    get_job_runner()
+
+
+@app.middleware("http")
+async def tag_usage_route(request: Request, call_next):
+    # LLM / embedding usage is aggregated per API route.
+    with usage_scope(route=request.url.path):
+        return await call_next(request)
+
+
 app.include_router(auth.router, prefix="/api")
 app.include_router(ai.router, prefix="/api")
+app.include_router(jobs.router, prefix="/api")
@@ -1,15 +1,45 @@
-from src.rag.retriever import answer_with_rag
-from chromadb import PersistentClient
-from src.core.config import get_settings
+from src.rag.retriever import answer_with_rag, answer_with_rag_async, answer_batch_with_rag, stream_answer_with_rag
+from src.core.executor import run_blocking
+from src.core.store import get_collection
+from src.core.usage import scoped_iter, usage_scope
+from src.rag.sessions import chat_with_rag, get_session_store
+from src.rag.slo import answer_with_deadline
 
 
 def answer(q):
-    settings = get_settings()
-    client = PersistentClient(path=settings.PERSIST_DIR)
-    collection = client.get_or_create_collection(
-        name=settings.COLLECTION_NAME
-    )
-    return answer_with_rag(collection, q)
+    collection = get_collection()
+    with usage_scope(stage="question"):
+        return answer_with_rag(collection, q)
+
+
+async def answer_async(q):
+    collection = await run_blocking(get_collection)
+    with usage_scope(stage="question"):
+        return await answer_with_rag_async(collection, q)
+
+
+async def answer_with_deadline_async(q):
+    collection = await run_blocking(get_collection)
+    with usage_scope(stage="question"):
+        return await answer_with_deadline(collection, q)
+
+
+async def answer_batch_async(questions):
+    collection = await run_blocking(get_collection)
+    with usage_scope(stage="question_batch"):
+        return await answer_batch_with_rag(collection, questions)
+
+
+async def chat_async(q, session_id=None):
+    collection = await run_blocking(get_collection)
+    session = get_session_store().get_or_create(session_id)
+    with usage_scope(stage="chat"):
+        return await chat_with_rag(collection, session, q)
+
+
+def stream_answer(q):
+    collection = get_collection()
+    yield from scoped_iter(stream_answer_with_rag(collection, q), stage="question")
 
 
 if __name__ == '__main__':
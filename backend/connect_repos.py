@@ -1,56 +1,69 @@
 import json
-from chromadb import PersistentClient
-from src.core.config import get_settings
+from src.core.store import collection_write_lock, get_collection
+from src.core.index_state import bump_index_generation
+from src.core.progress import check_cancelled, emit_progress, report_progress, set_stage_total
+from src.rag.graph_expansion import build_adjacency_map
+from src.utils.iterate_cloning_dir import iter_chroma_entries
 from urllib.parse import urlparse
 
 
-def second_pass():
-    settings = get_settings()
-    client = PersistentClient(path=settings.PERSIST_DIR)
-    collection = client.get_or_create_collection(
-        name=settings.COLLECTION_NAME
-    )
+def second_pass(collection_name=None):
+    """
+    Link HTTP calls to the routes they hit. Links are recomputed from the
+    routes indexed now, not added to the existing ones, so links into
+    routes that were removed since the collection was copied do not
+    survive an incremental run. Without a collection name the active
+    collection is updated in place and readers are notified through the
+    index generation; a shadow collection is made visible by activating it.
+    """
+    if collection_name is None:
+        with collection_write_lock():
+            _link_all(get_collection())
+            bump_index_generation()
+    else:
+        _link_all(get_collection(collection_name))
+
+
+def _link_all(collection):
+    results = collection.get(include=["metadatas"])
+    routes = _load_routes(results["metadatas"])
+
+    total = len(results["ids"])
+    set_stage_total("linked", total)
+    for i, (doc_id, metadata) in enumerate(zip(results["ids"], results["metadatas"])):
+        check_cancelled()
+        report_progress(i / max(total, 1), f"Linking repos ({i}/{total})")
 
-    results = collection.get(include=["documents", "metadatas"])
-
-    for doc_id, document, metadata in zip(
-        results["ids"],
-        results["documents"],
-        results["metadatas"]
-    ):
         http_calls = json.loads(metadata.get("http_calls", "[]"))
-        repo_http = json.loads(metadata.get("repo_http", "[]"))
-        print(http_calls, repo_http)
-
-        if not http_calls:
-            continue
-        new_nodes = find(http_calls)
+        old = json.loads(metadata.get("repo_http", "[]"))
+        emit_progress("linked")
 
-        if not new_nodes:
+        repo_http = _dedupe(_match_calls(http_calls, routes))
+        if repo_http == _dedupe(old):
             continue
 
-        repo_http.extend(new_nodes)
-
-        repo_http = list({
-            json.dumps(x, sort_keys=True)
-            for x in repo_http
-        })
-        repo_http = [json.loads(x) for x in repo_http]
-
         metadata["repo_http"] = json.dumps(repo_http)
         collection.update(
             ids=[doc_id],
             metadatas=[metadata]
         )
 
+    build_adjacency_map(collection)
+
+
+def _load_routes(metadatas):
+    routes = []
+    for metadata in metadatas:
+        if metadata.get("routes") in (None, "", "[]"):
+            continue
+        try:
+            routes.extend(json.loads(metadata.get("routes", "[]")))
+        except Exception:
+            continue
+    return routes
 
-def find(http_calls):
-    settings = get_settings()
-    client = PersistentClient(path=settings.PERSIST_DIR)
 
-    collection = client.get_or_create_collection(
-        name=settings.COLLECTION_NAME
-    )
+def _match_calls(http_calls, routes):
     new_nodes = []
     for call in http_calls:
         method = call.get("method")
@@ -59,30 +72,88 @@ def find(http_calls):
         if not url:
             continue
 
-        results = collection.get(include=["metadatas"])
-
-        for metadata in results["metadatas"]:
-            routes_raw = metadata.get("routes", "[]")
+        for route in routes:
+            path = route.get("path")
+            decorator = route.get("decorator")
 
-            try:
-                routes = json.loads(routes_raw)
-            except Exception:
+            if not path:
                 continue
 
-            for route in routes:
-                path = route.get("path")
-                decorator = route.get("decorator")
+            if decorator == method and match(url, path):
+                new_nodes.append({
+                    "target_file": route.get("file"),
+                    "url": url
+                })
 
-                if not path:
-                    continue
+    return new_nodes
 
-                if decorator == method and match(url, path):
-                    new_nodes.append({
-                        "target_file": route.get("file"),
-                        "url": url
-                    })
 
-    return new_nodes
+def find(http_calls, collection=None):
+    collection = collection or get_collection()
+    results = collection.get(include=["metadatas"])
+    return _match_calls(http_calls, _load_routes(results["metadatas"]))
+
+
+def _dedupe(repo_http):
+    unique = {json.dumps(x, sort_keys=True) for x in repo_http}
+    return [json.loads(x) for x in sorted(unique)]
+
+
+def relink(paths, collection=None, metadatas: dict = None, adjacency: bool = True):
+    """
+    Targeted second pass after `paths` changed (or were deleted): changed
+    files get their outgoing links recomputed against every route, and the
+    other callers only drop links into `paths` and are matched against the
+    routes those files define now. Updates the collection in place and,
+    with adjacency, rebuilds the adjacency map.
+
+    `metadatas` (node metadata by id) saves a scan of the collection; the
+    updated links are written into it as well. Returns how many nodes were
+    updated.
+    """
+    collection = collection or get_collection()
+    paths = {str(p) for p in paths}
+
+    if metadatas is None:
+        metadatas = {
+            entry["id"]: entry["metadata"] or {}
+            for entry in iter_chroma_entries(collection, include=("metadatas",))
+        }
+    all_routes = None
+    changed_routes = _load_routes(metadatas[p] for p in paths if p in metadatas)
+
+    updates = {}
+    for doc_id, metadata in metadatas.items():
+        if doc_id not in paths and metadata.get("repo_http") in (None, "", "[]") and (
+            not changed_routes or metadata.get("http_calls") in (None, "", "[]")
+        ):
+            continue  # no links to drop, none to add
+        http_calls = json.loads(metadata.get("http_calls", "[]"))
+        old = json.loads(metadata.get("repo_http", "[]"))
+
+        if doc_id in paths:
+            if all_routes is None:
+                all_routes = _load_routes(metadatas.values())
+            new = _match_calls(http_calls, all_routes)
+        else:
+            new = [x for x in old if x.get("target_file") not in paths]
+            new += _match_calls(http_calls, changed_routes)
+
+        new = _dedupe(new)
+        if new != _dedupe(old):
+            metadata["repo_http"] = json.dumps(new)
+            updates[doc_id] = metadata
+        emit_progress("linked")
+
+    if updates:
+        collection.update(
+            ids=list(updates),
+            metadatas=list(updates.values()),
+        )
+    if adjacency:
+        build_adjacency_map(collection)
+    return len(updates)
+
 
 def match(url: str, route_path: str) -> bool:
     if not url or not route_path:
@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+from src.core.checkpoint import checkpointed_collections
+from src.core.config import get_settings
+from src.core.index_state import bump_index_generation, load_index_state
+from src.core.progress import check_cancelled, report_progress
+from src.core.store import (
+    activate_collection,
+    collection_info,
+    collection_paths,
+    collection_write_lock,
+    copy_collection,
+    create_shadow_collection,
+    drop_collection,
+    drop_retired_collections,
+    get_collection,
+    prune_nodes,
+    strip_references,
+    update_collection_info,
+    vacuum_store,
+)
+from src.core.usage import write_run_report
+from src.rag.graph_expansion import build_adjacency_map
+from src.rag.lexical_index import build_lexical_index
+from src.utils.iterate_cloning_dir import iter_chroma_entries
+
+
+GC_BATCH_SIZE = 500
+
+
+def _dir_size(path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _collection_sizes() -> dict:
+    """
+    Bytes on disk (segment directories and artifacts) of every collection
+    the index state knows and has not deleted.
+    """
+    collections = load_index_state().get("collections", {})
+    return {
+        name: sum(_dir_size(path) for path in collection_paths(name))
+        for name, entry in sorted(collections.items())
+        if entry.get("status") != "deleted"
+    }
+
+
+def _timed_scan(collection) -> float:
+    # Full metadata scan, the access pattern of linking, facts and the
+    # adjacency build; used to measure what compaction buys.
+    started = time.perf_counter()
+    for _ in iter_chroma_entries(collection, include=("metadatas",)):
+        pass
+    return time.perf_counter() - started
+
+
+def _exists(doc_id: str, metadata: dict) -> bool:
+    path = Path(metadata.get("path") or doc_id)
+    if metadata.get("type") in ("dir", "repo"):
+        return path.is_dir()
+    return path.is_file()
+
+
+def find_orphans(collection) -> dict:
+    """
+    Ids of indexed nodes whose file or directory no longer exists,
+    mapped to their node type.
+    """
+    orphans = {}
+    for entry in iter_chroma_entries(collection, include=("metadatas",)):
+        metadata = entry["metadata"] or {}
+        if not _exists(entry["id"], metadata):
+            orphans[entry["id"]] = metadata.get("type", "file")
+    return orphans
+
+
+def _copy_live(source, target, orphans) -> int:
+    """
+    Copy every non-orphan node, with its embedding, from `source` into
+    `target`, fixing links on the way. Returns how many references were
+    removed.
+    """
+    references = 0
+
+    def strip(metadata):
+        nonlocal references
+        check_cancelled()
+        references += strip_references(metadata, orphans)
+        return metadata
+
+    copy_collection(source, target, exclude=orphans, transform=strip, batch_size=GC_BATCH_SIZE)
+    return references
+
+
+def collect_garbage(
+    run_id: str = None,
+    compact: bool = True,
+    keep: int = None,
+    vacuum: bool = False,
+) -> dict:
+    """
+    Remove index entries for files and directories deleted from
+    CLONING_DIR, then compact the store.
+
+    Chroma does not give back the space of deleted vectors, so compaction
+    copies the live nodes into a fresh collection and activates it like an
+    ingestion run would; the old one is retired, and retired collections
+    beyond `keep`, and collections of abandoned builds, are dropped with
+    their artifacts. Without compaction the orphans are deleted from the
+    active collection in place.
+
+    With vacuum, Chroma's SQLite file is rebuilt as well to give the space
+    back; that needs exclusive access to the store (see vacuum_store).
+
+    Writes a report to PERSIST_DIR/reports/<run_id>.json and returns it.
+    """
+    settings = get_settings()
+    run_id = run_id or time.strftime("gc-%Y%m%d-%H%M%S")
+    keep = settings.GC_KEEP_COLLECTIONS if keep is None else keep
+    started = time.perf_counter()
+
+    collection = get_collection()
+    nodes_before = collection.count()
+    scan_before = _timed_scan(collection)
+
+    report_progress(0.1, "Finding orphaned nodes")
+    orphans = find_orphans(collection)
+    by_type = {}
+    for node_type in orphans.values():
+        by_type[node_type] = by_type.get(node_type, 0) + 1
+    print(f"Orphaned nodes: {len(orphans)} {by_type}")
+    if compact and not orphans:
+        # A copy would hold the same nodes; retired collections are dropped
+        # below either way.
+        print("Nothing to remove, skipping the rebuild")
+        compact = False
+
+    report_progress(0.3, f"Removing {len(orphans)} orphaned nodes")
+    if compact:
+        target = create_shadow_collection(run_id)
+        try:
+            # From here on watch.py leaves the active collection alone; it
+            # may have indexed some of the orphans again before that.
+            orphans = {
+                doc_id: node_type for doc_id, node_type in orphans.items()
+                if not _exists(doc_id, {"type": node_type})
+            }
+            references = _copy_live(collection, target, orphans)
+            # Same content, so the commits it was indexed at still hold.
+            commits = collection_info(collection.name).get("commits")
+            if commits is not None:
+                update_collection_info(target.name, commits=commits)
+
+            report_progress(0.8, "Rebuilding lexical index and adjacency map")
+            build_lexical_index(target)
+            build_adjacency_map(target)
+        except BaseException:
+            # A build left behind would hold watch.py back until the next gc.
+            drop_collection(target.name)
+            update_collection_info(target.name, status="deleted", deleted_at=time.time())
+            raise
+        activate_collection(target.name)
+    else:
+        target = collection
+        references = 0
+        if orphans:
+            with collection_write_lock():
+                references = prune_nodes(collection, orphans, batch_size=GC_BATCH_SIZE)
+                report_progress(0.8, "Rebuilding lexical index and adjacency map")
+                build_lexical_index(target)
+                build_adjacency_map(target)
+                bump_index_generation()
+
+    report_progress(0.9, "Compacting the store")
+    sizes = _collection_sizes()
+    dropped = drop_retired_collections(keep, in_progress=checkpointed_collections())
+
+    # Chroma's SQLite file only shrinks when it is vacuumed.
+    database = Path(settings.PERSIST_DIR) / "chroma.sqlite3"
+    sqlite_before = database.stat().st_size if database.exists() else 0
+    vacuumed = vacuum_store() if vacuum else False
+    sqlite_after = database.stat().st_size if database.exists() else 0
+
+    scan_after = _timed_scan(target)
+
+    report = {
+        "kind": "gc",
+        "collection": target.name,
+        "compacted": compact,
+        "orphans_removed": len(orphans),
+        "orphans_by_type": by_type,
+        "references_removed": references,
+        "nodes_before": nodes_before,
+        "nodes_after": target.count(),
+        "collections_dropped": dropped,
+        # Segment directories and artifacts of the dropped collections
+        "bytes_freed": sum(sizes.get(name, 0) for name in dropped),
+        # Collections still on disk; a retired one is only freed once it
+        # falls outside `keep`.
+        "collection_bytes": _collection_sizes(),
+        "vacuumed": vacuumed,
+        "sqlite_bytes_freed": sqlite_before - sqlite_after,
+        "scan_seconds_before": round(scan_before, 4),
+        "scan_seconds_after": round(scan_after, 4),
+        "scan_seconds_recovered": round(scan_before - scan_after, 4),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
+    write_run_report(run_id, report)
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Remove nodes of deleted files from the index and compact the store"
+    )
+    parser.add_argument(
+        "--no-compact",
+        action="store_true",
+        help="delete orphans from the active collection in place instead of rebuilding it",
+    )
+    parser.add_argument(
+        "--keep",
+        type=int,
+        default=None,
+        help="retired collections to keep for rollback (default: GC_KEEP_COLLECTIONS)",
+    )
+    parser.add_argument(
+        "--vacuum",
+        action="store_true",
+        help="also rebuild the SQLite file; only while nothing else uses the store",
+    )
+    args = parser.parse_args()
+    collect_garbage(compact=not args.no_compact, keep=args.keep, vacuum=args.vacuum)
@@ -1,16 +1,21 @@
-from src.rag.summary_guide import generate_system_summary, build_system_context
-from chromadb import PersistentClient
-from src.core.config import get_settings
+from src.rag.summary_store import aget_system_summary, astream_system_summary, get_system_summary
+from src.core.store import get_collection
 
 
 def generate_summary():
-    settings = get_settings()
-    client = PersistentClient(path=settings.PERSIST_DIR)
-    collection = client.get_or_create_collection(
-        name=settings.COLLECTION_NAME
-    )
-    context = build_system_context(collection)
-    return generate_system_summary(context)
+    collection = get_collection()
+    return get_system_summary(collection)
+
+
+async def agenerate_summary():
+    collection = get_collection()
+    return await aget_system_summary(collection)
+
+
+async def astream_summary():
+    collection = get_collection()
+    async for chunk in astream_system_summary(collection):
+        yield chunk
 
 
 if __name__ == '__main__':
@@ -1,11 +1,25 @@
 from process_repos import main
 from connect_repos import second_pass
+from src.core.checkpoint import clear_ingest_checkpoint
+from src.core.progress import track_pipeline
+from src.core.store import activate_collection
+from src.core.usage import new_run_id
+import argparse
 
 
-def process():
-    main()
-    second_pass()
+def process(resume=False, full=False):
+    run_id = new_run_id()
+    with track_pipeline(run_id):
+        collection_name = main(run_id, resume=resume, full=full)
+        second_pass(collection_name)
+    activate_collection(collection_name)
+    clear_ingest_checkpoint(collection_name)
 
 
 if __name__ == '__main__':
-    process()
+    parser = argparse.ArgumentParser(description="Index and link the repos in CLONING_DIR.")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run")
+    parser.add_argument("--full", action="store_true", help="re-index every file, not only what git reports as changed")
+    args = parser.parse_args()
+
+    process(resume=args.resume, full=args.full)
@@ -1,52 +1,371 @@
-from chromadb import PersistentClient
+from src.core.checkpoint import IngestCheckpoint, clear_ingest_checkpoint
 from src.core.config import get_settings
+from src.core.store import activate_collection, collection_info, copy_collection, get_collection, prune_nodes, update_collection_info
+from src.core.progress import check_cancelled, emit_progress, report_progress, set_stage_total, track_pipeline
+from src.core.usage import new_run_id, usage_scope, write_run_report
 from src.rag.embedder import get_embedder
 from src.rag.llm import get_llm
+from src.rag.lexical_index import build_lexical_index
 from src.utils.iterate_cloning_dir import iter_files, iter_chroma_entries, iter_dirs_bottom_up
-from src.utils.process_file import get_description, get_embedding, get_connections,  add_to_base, process_directory, flush_file_buffer
+from src.utils.process_file import get_descriptions, get_embedding, get_connections,  add_to_base, process_directory, flush_file_buffer, repo_of
+from src.utils.git_changes import detect_changes, repo_state
+from pathlib import Path
+import argparse
 import os
 
 
-def main():
+def main(run_id=None, resume=False, full=False):
+    """
+    Index every repo in CLONING_DIR into a new shadow collection and return
+    its name; readers keep using the active collection until it is activated.
+    With resume=True, work recorded in the ingestion checkpoint of an
+    interrupted run is skipped.
+
+    When the active collection records the git commits it was indexed at,
+    only files git reports as changed since then are processed (see
+    plan_changes); full=True rebuilds everything.
+    """
+    run_id = run_id or new_run_id()
+    # Git state the new index corresponds to; a resumed run keeps the one
+    # recorded when it started.
+    checkpoint = IngestCheckpoint.resume_or_start(run_id, resume, commits=repo_states())
+
+    if checkpoint.indexed:
+        print("Indexing already completed in the checkpointed run")
+        return checkpoint.collection
+
+    try:
+        with usage_scope(run_id=run_id), track_pipeline(run_id):
+            index_repos(checkpoint, full=full)
+    except BaseException:
+        # Leave the run resumable by a later --resume in this process.
+        checkpoint.release()
+        raise
+
+    extra = {"resumed_from": checkpoint.run_id} if checkpoint.run_id != run_id else None
+    write_run_report(run_id, extra)
+    return checkpoint.collection
+
+
+def _repo_root(path: str, root: Path) -> str | None:
+    try:
+        rel = Path(path).relative_to(root)
+    except ValueError:
+        return None
+    return str(root / rel.parts[0]) if rel.parts else None
+
+
+def _move_node(collection, old: str, new: str) -> bool:
+    """
+    Re-key the node of a renamed file, keeping its description and
+    embedding; only the (local) connection parsing is redone.
+    """
+    entry = collection.get(ids=[old], include=["documents", "metadatas", "embeddings"])
+    if not entry["ids"]:
+        return False
+
+    connections = get_connections(new)
+    if connections["language"] == "unknown":
+        return False
+
+    add_to_base(
+        collection=collection,
+        detailed_description=entry["documents"][0],
+        short_description=entry["metadatas"][0].get("short", ""),
+        embedding=entry["embeddings"][0],
+        connections=connections,
+        path=new,
+    )
+    return True
+
+
+def _indexed_nodes(collection) -> dict:
+    return {
+        entry["id"]: entry["metadata"] or {}
+        for entry in iter_chroma_entries(collection, include=("metadatas",))
+    }
+
+
+def apply_changes(
+    collection,
+    changed,
+    renamed,
+    checkpoint: IngestCheckpoint = None,
+    indexed: dict = None,
+):
+    """
+    Apply the part of a set of path changes that needs no LLM, and return
+    the files to describe and the directories to summarize again
+    (bottom-up).
+
+    Renamed files are moved; nodes of deleted files and directories are
+    pruned, without touching the links into them: the caller relinks
+    (second_pass, relink). A changed or renamed directory stands for the
+    files under it.
+
+    `indexed` (node metadata by id) saves a scan of the collection; it is
+    kept up to date with the moves and deletions made here.
+    """
+    root = Path(get_settings().CLONING_DIR).resolve()
+    if indexed is None:
+        indexed = _indexed_nodes(collection)
+    changed = set(changed)
+
+    def indexed_under(prefix: str):
+        prefix = prefix.rstrip(os.sep) + os.sep
+        return [
+            doc_id for doc_id, meta in indexed.items()
+            if meta.get("type") == "file" and doc_id.startswith(prefix)
+        ]
+
+    for path in list(changed):
+        if Path(path).is_dir():
+            for dirpath, _, filenames in os.walk(path):
+                changed.update(str(Path(dirpath) / name) for name in filenames)
+        if path not in indexed and not Path(path).is_file():
+            changed.update(indexed_under(path))
+
+    pairs = []
+    for old, new in renamed:
+        if Path(new).is_dir():
+            pairs.extend((doc_id, new + doc_id[len(old):]) for doc_id in indexed_under(old))
+        else:
+            pairs.append((old, new))
+
+    deleted = set()
+    moved = []
+    for old, new in pairs:
+        check_cancelled()
+        if old in indexed and Path(new).is_file() and _move_node(collection, old, new):
+            deleted.add(old)
+            moved.append(new)
+            if checkpoint is not None:
+                checkpoint.record_written([new])
+        else:
+            changed.update((old, new))
+
+    files = []
+    for path in sorted(changed):
+        if Path(path).is_file():
+            files.append(Path(path))
+        elif path in indexed:
+            deleted.add(path)
+
+    # Every directory above a touched path is summarized again, deepest first.
+    dirs = set()
+    for path in changed | {p for pair in pairs for p in pair}:
+        parent = Path(path).parent
+        while parent == root or root in parent.parents:
+            dirs.add(parent)
+            parent = parent.parent
+    for dir_path in dirs:
+        if not dir_path.is_dir() and str(dir_path) in indexed:
+            deleted.add(str(dir_path))
+    dirs = sorted(
+        (d for d in dirs if d.is_dir()),
+        key=lambda d: (-len(d.parts), str(d)),
+    )
+
+    if deleted:
+        print(f"Removing {len(deleted)} deleted nodes")
+        prune_nodes(collection, deleted, strip_links=False)
+        for doc_id in deleted:
+            indexed.pop(doc_id, None)
+    if moved:
+        entries = collection.get(ids=moved, include=["metadatas"])
+        indexed.update(zip(entries["ids"], entries["metadatas"]))
+
+    return files, dirs
+
+
+def repo_states() -> dict:
+    """
+    Git state (see repo_state) of every repo in CLONING_DIR that is under git.
+    """
+    root = Path(get_settings().CLONING_DIR).resolve()
+    return {
+        str(repo): state
+        for repo in sorted(p for p in root.iterdir() if p.is_dir())
+        if (state := repo_state(repo)) is not None
+    }
+
+
+def find_changes(collection, previous: dict):
+    """
+    Paths changed since the commits in `previous`, as (changed, renamed).
+    Changed files come from git (detect_changes); repos without usable git
+    history have all their files checked.
+    """
+    root = Path(get_settings().CLONING_DIR).resolve()
+    indexed = _indexed_nodes(collection)
+
+    repos = sorted(p for p in root.iterdir() if p.is_dir())
+    changed = set()
+    renamed = []
+    for repo in repos:
+        changes = detect_changes(repo, previous.get(str(repo)))
+        if changes is None:
+            print(f"{repo.name}: no git history to diff against, checking every file")
+            for dirpath, _, filenames in os.walk(repo):
+                changed.update(str(Path(dirpath) / name) for name in filenames)
+            changed.update(
+                doc_id for doc_id, meta in indexed.items()
+                if meta.get("type") == "file" and _repo_root(doc_id, root) == str(repo)
+            )
+        else:
+            print(f"{repo.name}: {len(changes['changed'])} changed, {len(changes['renamed'])} renamed")
+            changed.update(changes["changed"])
+            renamed.extend(changes["renamed"])
+
+    # Repos removed from CLONING_DIR
+    live = {str(repo) for repo in repos}
+    changed.update(
+        doc_id for doc_id, meta in indexed.items()
+        if meta.get("type") == "file" and _repo_root(doc_id, root) not in live
+    )
+    return changed, renamed
+
+
+def plan_changes(collection, previous: dict, checkpoint: IngestCheckpoint):
+    """
+    Find what changed since the commits in `previous` (see find_changes)
+    and apply it (see apply_changes).
+    """
+    changed, renamed = find_changes(collection, previous)
+    return apply_changes(collection, changed, renamed, checkpoint)
+
+
+def index_repos(checkpoint: IngestCheckpoint, full: bool = False):
     settings = get_settings()
     llm = get_llm()
     embedder = get_embedder()
-    client = PersistentClient(path=settings.PERSIST_DIR)
-    collection = client.get_or_create_collection(
-        name=settings.COLLECTION_NAME
+    collection = get_collection(checkpoint.collection)
+
+    # Recorded once indexing is done. Checkpoints written before commits
+    # were stored in them fall back to the current state.
+    commits = checkpoint.commits if checkpoint.commits is not None else repo_states()
+
+    active = collection_info()
+    previous = active.get("commits")
+    # Only worth it when some repo has a recorded commit to diff against;
+    # repos without one are indexed in full by plan_changes.
+    incremental = checkpoint.seeded or (
+        not full and bool(previous) and not checkpoint.written and not checkpoint.dirs
     )
 
     buffer = []
+    pending = []
+
+    def describe_pending():
+        # One call per repo, so packed prompts never mix repositories.
+        by_repo = {}
+        for file, connections in pending:
+            by_repo.setdefault(repo_of(file), []).append(file)
+
+        # Files described before an interruption are not sent to the LLM again.
+        descriptions = {}
+        for repo, files in by_repo.items():
+            todo = [f for f in files if str(f) not in checkpoint.described]
+            if not todo:
+                continue
+            with usage_scope(stage="file_description", repo=repo):
+                described = get_descriptions(todo)
+            checkpoint.record_described(described)
+            descriptions.update(described)
+        for file, connections in pending:
+            if str(file) in checkpoint.described:
+                descriptions[str(file)] = checkpoint.described[str(file)]
+        emit_progress("described", len(descriptions))
+
+        for file, connections in pending:
+            if str(file) not in descriptions:
+                continue
+
+            buffer.append({
+                "file": file,
+                "description": descriptions[str(file)],
+                "connections": connections,
+            })
+
+            if len(buffer) >= settings.BATCH_SIZE:
+                flush()
+
+        pending.clear()
+
+    def flush():
+        flush_file_buffer(collection, buffer, embedder)
+        checkpoint.record_written(item["file"] for item in buffer)
+        buffer.clear()
+
+    if incremental:
+        if not checkpoint.seeded:
+            print("Incremental run: copying the active collection")
+            copy_collection(get_collection(), collection)
+            checkpoint.mark_seeded()
+        files, dirs = plan_changes(collection, previous, checkpoint)
+    else:
+        files = list(iter_files(settings.CLONING_DIR))
+        dirs = list(iter_dirs_bottom_up(settings.CLONING_DIR))
 
     # ---------- PASS 1: FILES ----------
-    for file in iter_files(settings.CLONING_DIR):
-        description = get_description(file)
+    set_stage_total("discovered", len(files))
+    emit_progress("discovered", len(files))
+
+    done = sum(1 for f in files if str(f) in checkpoint.written)
+    for stage in ("described", "embedded", "written"):
+        emit_progress(stage, done)
+
+    for i, file in enumerate(files):
+        check_cancelled()
+        report_progress(0.8 * i / max(len(files), 1), f"Indexing files ({i}/{len(files)})")
+
+        if str(file) in checkpoint.written:
+            continue
+
         connections = get_connections(file)
         if connections['language'] == 'unknown':
+            emit_progress("filtered")
             continue
 
-        buffer.append({
-            "file": file,
-            "description": description,
-            "connections": connections,
-        })
+        pending.append((file, connections))
 
-        if len(buffer) >= settings.BATCH_SIZE:
-            flush_file_buffer(collection, buffer, embedder)
-            buffer.clear()
+        if len(pending) >= settings.DESCRIBE_CHUNK_SIZE:
+            describe_pending()
+
+    if pending:
+        describe_pending()
 
     # flush remaining files
     if buffer:
-        flush_file_buffer(collection, buffer, embedder)
+        flush()
 
     # ---------- PASS 2: DIRECTORIES ----------
-    for dir_path in iter_dirs_bottom_up(settings.CLONING_DIR):
-        process_directory(collection, dir_path)
-
+    set_stage_total("dirs", len(dirs))
+    for i, dir_path in enumerate(dirs):
+        check_cancelled()
+        report_progress(0.8 + 0.15 * i / max(len(dirs), 1), f"Summarizing directories ({i}/{len(dirs)})")
 
+        if str(dir_path) not in checkpoint.dirs:
+            process_directory(collection, dir_path)
+            checkpoint.record_dir(dir_path)
+        emit_progress("dirs")
 
+    # ---------- PASS 3: LEXICAL INDEX ----------
+    check_cancelled()
+    report_progress(0.95, "Building lexical index")
+    build_lexical_index(collection)
 
+    update_collection_info(checkpoint.collection, commits=commits)
+    checkpoint.mark_indexed()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Index the repos in CLONING_DIR.")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run")
+    parser.add_argument("--full", action="store_true", help="re-index every file, not only what git reports as changed")
+    args = parser.parse_args()
+
+    collection_name = main(resume=args.resume, full=args.full)
+    activate_collection(collection_name)
+    clear_ingest_checkpoint(collection_name)
+
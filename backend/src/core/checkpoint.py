@@ -0,0 +1,287 @@
+import fcntl
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import IO, Dict, Iterable, List, Optional
+
+from .config import get_settings
+from .store import create_shadow_collection, shadow_collection_name
+
+
+CHECKPOINT_PREFIX = "ingest_checkpoint-"
+
+
+def _checkpoint_path(run_id: str) -> Path:
+    # One log per run, so two runs can never append to or truncate the same file.
+    safe = re.sub(r"[^a-zA-Z0-9._-]", "-", run_id)
+    return Path(get_settings().PERSIST_DIR) / f"{CHECKPOINT_PREFIX}{safe}.jsonl"
+
+
+def _checkpoint_paths() -> List[Path]:
+    """
+    Checkpoints of unfinished runs, newest first.
+    """
+    paths = Path(get_settings().PERSIST_DIR).glob(f"{CHECKPOINT_PREFIX}*.jsonl")
+    return sorted(paths, key=lambda p: p.stat().st_mtime, reverse=True)
+
+
+# Checkpoints whose run this process owns -> open file holding the owner lock.
+# The lock is released when the run finishes, fails, or its process dies, so
+# a checkpoint nobody holds belongs to an interrupted run.
+_owned: Dict[Path, IO] = {}
+_owned_lock = threading.Lock()
+
+
+def _claim(path: Path, create: bool = False) -> bool:
+    """
+    Take the owner lock of a checkpoint without waiting. False if another
+    run (in this or any other process) holds it, or the file is gone.
+    """
+    flags = os.O_RDWR | os.O_APPEND | (os.O_CREAT if create else 0)
+    try:
+        f = os.fdopen(os.open(path, flags, 0o644), "a")
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return False
+    # Removed by its owner between listing and locking
+    if os.fstat(f.fileno()).st_nlink == 0:
+        f.close()
+        return False
+    with _owned_lock:
+        _owned[path] = f
+    return True
+
+
+def _release(path: Path):
+    with _owned_lock:
+        f = _owned.pop(path, None)
+    if f is not None:
+        f.close()
+
+
+class IngestCheckpoint:
+    """
+    Append-only log of completed ingestion work, fsynced after every entry:
+
+      {"event": "start", "run_id": ..., "collection": ..., "commits": ...}
+      {"event": "seeded"}
+      {"event": "described", "items": {path: {"short", "detailed"}}}
+      {"event": "written", "paths": [...]}
+      {"event": "dir", "path": ...}
+      {"event": "indexed"}
+
+    A torn last line (crash mid-write) is ignored when the log is loaded.
+    The run that writes a checkpoint holds a lock on it (see _claim), so a
+    resume only ever takes over the checkpoint of a run that is gone.
+    """
+
+    def __init__(self, path: Path, run_id: str, collection: str, commits: Dict = None):
+        self.path = path
+        self.run_id = run_id
+        # Shadow collection the run builds into
+        self.collection = collection
+        # Git state of the repos when the run started, recorded on the
+        # collection once it is indexed
+        self.commits = commits
+        # Incremental run: the shadow was seeded with the active collection
+        self.seeded = False
+        self.described: Dict[str, Dict] = {}
+        self.written: set = set()
+        self.dirs: set = set()
+        self.indexed = False
+
+    # ---------- lifecycle ----------
+
+    @classmethod
+    def start(cls, run_id: str, collection: str, commits: Dict = None) -> "IngestCheckpoint":
+        """
+        Begin a fresh run, discarding any previous checkpoint.
+        """
+        checkpoint = cls(_checkpoint_path(run_id), run_id, collection, commits)
+        checkpoint.path.parent.mkdir(parents=True, exist_ok=True)
+        # Owned before the start entry is written, so no resume can take it.
+        if not _claim(checkpoint.path, create=True):
+            raise RuntimeError(f"Run {run_id} is already in progress")
+        with open(checkpoint.path, "w", encoding="utf-8") as f:
+            entry = {"event": "start", "run_id": run_id, "collection": collection, "commits": commits}
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return checkpoint
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["IngestCheckpoint"]:
+        """
+        Read a checkpoint; None if it is missing or has no start entry yet.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return None
+
+        checkpoint = None
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            event = entry.get("event")
+            if event == "start":
+                checkpoint = cls(
+                    path,
+                    entry["run_id"],
+                    entry.get("collection") or get_settings().COLLECTION_NAME,
+                    entry.get("commits"),
+                )
+            elif checkpoint is None:
+                continue
+            elif event == "seeded":
+                checkpoint.seeded = True
+            elif event == "described":
+                checkpoint.described.update(entry["items"])
+            elif event == "written":
+                checkpoint.written.update(entry["paths"])
+            elif event == "dir":
+                checkpoint.dirs.add(entry["path"])
+            elif event == "indexed":
+                checkpoint.indexed = True
+
+        return checkpoint
+
+    @classmethod
+    def claim_abandoned(cls) -> Optional["IngestCheckpoint"]:
+        """
+        Take over the most recent checkpoint whose run is no longer active.
+        """
+        for path in _checkpoint_paths():
+            if not _claim(path):
+                continue
+            checkpoint = cls.load(path)
+            if checkpoint is not None:
+                return checkpoint
+            _release(path)
+        return None
+
+    @classmethod
+    def resume_or_start(
+        cls,
+        run_id: str = None,
+        resume: bool = False,
+        commits: Dict = None,
+    ) -> "IngestCheckpoint":
+        """
+        Take over the latest abandoned checkpoint with resume=True, or start a
+        run into a new shadow collection; `commits` is only recorded for a
+        new run. Checkpoints of runs still in progress are never resumed.
+        """
+        if resume:
+            checkpoint = cls.claim_abandoned()
+            if checkpoint is not None:
+                print(
+                    f"Resuming run {checkpoint.run_id}: "
+                    f"{len(checkpoint.written)} files, {len(checkpoint.dirs)} dirs done"
+                )
+                return checkpoint
+            print("No interrupted run found, starting a new run")
+        # The checkpoint exists before its collection, so garbage collection
+        # never takes a collection being built for an abandoned one.
+        checkpoint = cls.start(run_id, shadow_collection_name(run_id), commits)
+        create_shadow_collection(run_id)
+        return checkpoint
+
+    def release(self):
+        """
+        Give up ownership (the run failed), leaving the checkpoint resumable.
+        """
+        _release(self.path)
+
+    # ---------- recording ----------
+
+    def _append(self, entry: Dict):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def mark_seeded(self):
+        self.seeded = True
+        self._append({"event": "seeded"})
+
+    def record_described(self, descriptions: Dict[str, Dict]):
+        if not descriptions:
+            return
+        self.described.update(descriptions)
+        self._append({"event": "described", "items": descriptions})
+
+    def record_written(self, paths: Iterable[str]):
+        paths = [str(p) for p in paths]
+        if not paths:
+            return
+        self.written.update(paths)
+        self._append({"event": "written", "paths": paths})
+
+    def record_dir(self, path: str):
+        self.dirs.add(str(path))
+        self._append({"event": "dir", "path": str(path)})
+
+    def mark_indexed(self):
+        self.indexed = True
+        self._append({"event": "indexed"})
+
+
+def clear_ingest_checkpoint(collection: str):
+    """
+    Drop the checkpoint of the run that built `collection`, once the whole
+    ingestion (indexing and linking) succeeded, along with unreadable ones
+    no run owns. Checkpoints of other runs in progress are left alone.
+    """
+    for path in _checkpoint_paths():
+        with _owned_lock:
+            owned = path in _owned
+        if not owned and not _claim(path):
+            continue
+        checkpoint = IngestCheckpoint.load(path)
+        if checkpoint is None and owned:
+            # A run of this process that is just starting
+            continue
+        if checkpoint is None or checkpoint.collection == collection:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            _release(path)
+        elif not owned:
+            _release(path)
+
+
+def release_ingest_checkpoint(collection: str):
+    """
+    Give up this process's ownership of the run building `collection` after
+    it failed, so the run can be resumed without a restart.
+    """
+    with _owned_lock:
+        paths = list(_owned)
+    for path in paths:
+        checkpoint = IngestCheckpoint.load(path)
+        if checkpoint is not None and checkpoint.collection == collection:
+            _release(path)
+
+
+def checkpointed_collections() -> set:
+    """
+    Collections of runs that have a checkpoint: being built, or resumable.
+    """
+    collections = set()
+    for path in _checkpoint_paths():
+        checkpoint = IngestCheckpoint.load(path)
+        if checkpoint is not None:
+            collections.add(checkpoint.collection)
+    return collections
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 
 class Settings(BaseSettings):
@@ -14,16 +15,130 @@ class Settings(BaseSettings):
     # === Embeddings ===
     EMBEDDER_MODEL_NAME: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
 
+    # === Providers ===
+    # "groq" | "fake" and "cohere" | "local" | "fake"; the fakes are
+    # deterministic offline stand-ins for benchmarking.
+    LLM_PROVIDER: str = "groq"
+    EMBEDDER_PROVIDER: str = "cohere"
+    FAKE_LATENCY_MS: float = 0.0
+    FAKE_ERROR_RATE: float = 0.0
+    FAKE_EMBEDDING_DIM: int = 1024
+    FAKE_SEED: int = 0
+
     # === Groq ===
-    GROQ_API_KEY: str
+    GROQ_API_KEY: str = ""
     GROQ_MODEL: str = "openai/gpt-oss-120b"
+    # Faster model used to hedge slow /api/ask generations when ASK_DEADLINE
+    # is set, e.g. "llama-3.1-8b-instant" ("" disables hedging)
+    GROQ_SECONDARY_MODEL: str = ""
     TEMPERATURE: float = 0.2
 
+    # === LLM resilience ===
+    LLM_MAX_RETRIES: int = 5
+    LLM_BACKOFF_BASE: float = 1.0
+    LLM_BACKOFF_MAX: float = 30.0
+    LLM_CALL_TIMEOUT: float = 60.0
+    LLM_REQUESTS_PER_MINUTE: float = 30
+    LLM_TOKENS_PER_MINUTE: float = 8000
+    LLM_EXPECTED_OUTPUT_TOKENS: int = 300
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    LLM_CIRCUIT_RESET_TIMEOUT: float = 30.0
+
+    # === Cost accounting (USD per million tokens) ===
+    LLM_INPUT_COST_PER_MTOK: float = 0.15
+    LLM_OUTPUT_COST_PER_MTOK: float = 0.75
+    EMBED_COST_PER_MTOK: float = 0.10
+
     # === Cohere ===
-    COHERE_API_KEY: str
+    COHERE_API_KEY: str = ""
     COHERE_EMBEDDER_MODEL: str = "embed-english-v3.0"
     BATCH_SIZE: int = 3
 
+    # === Ingestion prompt packing ===
+    SMALL_FILE_TOKENS: int = 600
+    PACK_TOKEN_BUDGET: int = 3000
+    PACK_MAX_FILES: int = 8
+    DESCRIBE_CHUNK_SIZE: int = 32
+
+    # === Structured output ===
+    STRUCTURED_MAX_RETRIES: int = 1
+
+    # === Query embedding cache ===
+    QUERY_CACHE_SIZE: int = 1024
+    QUERY_CACHE_TTL: float = 3600.0
+
+    # === Semantic answer cache ===
+    ANSWER_CACHE_SIZE: int = 512
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+
+    # === Hybrid retrieval ===
+    HYBRID_RETRIEVAL: bool = True
+    LEXICAL_TOP_K: int = 8
+    RRF_K: int = 60
+
+    # === Graph expansion ===
+    GRAPH_EXPANSION: bool = False
+    GRAPH_EXPANSION_MAX: int = 4
+    GRAPH_EXPANSION_DECAY: float = 0.5
+
+    # === Context packing ===
+    CONTEXT_TOKEN_BUDGET: int = 2000
+
+    # === Async request path ===
+    BLOCKING_POOL_SIZE: int = 8
+
+    # === Batch questions ===
+    BATCH_LLM_CONCURRENCY: int = 4
+    MAX_BATCH_QUESTIONS: int = 64
+
+    # === Chat sessions ===
+    CHAT_SESSION_TTL: float = 1800.0
+    CHAT_MAX_SESSIONS: int = 1000
+    CHAT_HISTORY_TOKEN_BUDGET: int = 1500
+    CHAT_DRIFT_THRESHOLD: float = 0.75
+
+    # === System summary (map-reduce over repos) ===
+    SUMMARY_CONCURRENCY: int = 4
+    REPO_CONTEXT_TOKEN_BUDGET: int = 1500
+    SUMMARY_LEVEL_TOKEN_BUDGET: int = 3000
+
+    # === Background jobs ===
+    JOB_WORKERS: int = 2
+    JOB_PROGRESS_INTERVAL: float = 1.0
+    # Sliding window (s) for throughput / ETA, and push interval of the progress stream
+    PROGRESS_WINDOW: float = 30.0
+    PROGRESS_STREAM_INTERVAL: float = 0.5
+    # A progress socket for a run that has not started by then is closed
+    PROGRESS_PENDING_TIMEOUT: float = 30.0
+
+    # === Garbage collection ===
+    # Retired collections kept for rollback; older ones are deleted by GC
+    GC_KEEP_COLLECTIONS: int = 2
+
+    # === Watch mode (seconds) ===
+    # A batch is indexed once no change arrived for WATCH_DEBOUNCE, or at
+    # the latest WATCH_MAX_DELAY after its first change
+    WATCH_DEBOUNCE: float = 2.0
+    WATCH_MAX_DELAY: float = 10.0
+    # Scan interval when watchdog (inotify) is not installed
+    WATCH_POLL_INTERVAL: float = 2.0
+    # The BM25 index and adjacency map are rebuilt at most this often
+    WATCH_REBUILD_INTERVAL: float = 30.0
+
+    # === Latency SLO for /api/ask (seconds) ===
+    # Unset (or 0) keeps the plain answer path. When set, /api/ask answers
+    # within the deadline and its response gains these fields:
+    #   degraded:   true if the answer was built from source summaries
+    #               because generation failed or ran out of time
+    #   retrieval:  "hybrid" | "vector" | "lexical" | "cache"
+    #   model:      "primary" | "secondary" (hedge winner), null if no
+    #               generation produced the answer
+    #   elapsed_ms: time spent answering
+    ASK_DEADLINE: Optional[float] = None
+    ASK_RETRIEVAL_SHARE: float = 0.4
+    ASK_HEDGE_DELAY: float = 2.0
+    DEGRADED_MAX_SOURCES: int = 5
+
 
 
     class Config:
@@ -0,0 +1,72 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from .config import get_settings
+
+
+@lru_cache(maxsize=1)
+def get_blocking_pool() -> ThreadPoolExecutor:
+    """
+    Bounded pool for blocking store / SDK calls made from async code, so a
+    burst of requests cannot spawn an unbounded number of threads.
+    """
+    settings = get_settings()
+    return ThreadPoolExecutor(
+        max_workers=settings.BLOCKING_POOL_SIZE,
+        thread_name_prefix="blocking",
+    )
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Run a blocking callable on the bounded pool without stalling the event
+    loop. Context variables are carried over to the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await loop.run_in_executor(get_blocking_pool(), call)
+
+
+# ---------- Running coroutines from sync code ----------
+
+# Async provider clients (httpx pools) are bound to the loop that first
+# used them, so every coroutine of the process runs on one loop: the
+# server's when there is one, otherwise a long-lived background loop.
+_main_loop = None
+
+
+def set_main_loop(loop: asyncio.AbstractEventLoop):
+    global _main_loop
+    _main_loop = loop
+
+
+@lru_cache(maxsize=1)
+def _background_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="async-bridge", daemon=True).start()
+    return loop
+
+
+def run_async(coro):
+    """
+    Run a coroutine from synchronous code (job threads, sync routes, CLI
+    scripts) and wait for its result. Context variables of the caller are
+    visible to the coroutine. Must not be called from the loop's own thread.
+    """
+    loop = _main_loop if _main_loop is not None and _main_loop.is_running() else _background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_async() called from the event loop thread; await the coroutine instead")
+
+    # call_soon_threadsafe copies the current context, and the task created
+    # from the callback inherits it.
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
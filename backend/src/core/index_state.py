@@ -0,0 +1,111 @@
+import copy
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator
+
+from .config import get_settings
+
+
+STATE_FILENAME = "index_state.json"
+LOCK_FILENAME = "index_state.lock"
+
+_lock = threading.Lock()
+_cache: Dict = {"mtime": None, "state": None}
+
+
+def _state_path() -> Path:
+    return Path(get_settings().PERSIST_DIR) / STATE_FILENAME
+
+
+def _cached_state() -> Dict:
+    """
+    Persisted state, re-read only when the file changes. Shared between
+    threads: callers must not modify it.
+    """
+    path = _state_path()
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {"generation": 0}
+
+    with _lock:
+        if _cache["mtime"] != mtime:
+            with open(path, "r", encoding="utf-8") as f:
+                _cache["state"] = json.load(f)
+            _cache["mtime"] = mtime
+        return _cache["state"]
+
+
+def load_index_state() -> Dict:
+    """
+    Read the persisted index state. The file is re-read only when it changes,
+    so this is cheap enough to call on every request. The result is a copy;
+    to change the state use edit_index_state().
+    """
+    return copy.deepcopy(_cached_state())
+
+
+def save_index_state(state: Dict):
+    """
+    Atomically replace the persisted index state. Writers normally go
+    through edit_index_state() so concurrent updates are not lost.
+    """
+    path = _state_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{STATE_FILENAME}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+@contextmanager
+def edit_index_state() -> Iterator[Dict]:
+    """
+    Read-modify-write of the index state under an exclusive file lock, so
+    job threads, the API and separate processes (watch.py, the CLI
+    scripts) never overwrite each other's updates. The state yielded is
+    read fresh from disk and saved when the block exits without error.
+    Not reentrant.
+    """
+    path = _state_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path.parent / LOCK_FILENAME, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except FileNotFoundError:
+                state = {"generation": 0}
+            yield state
+            save_index_state(state)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def get_index_generation() -> int:
+    return int(_cached_state().get("generation", 0))
+
+
+def bump_index_generation() -> int:
+    """
+    Mark the collection as changed. Anything cached per generation
+    (answers, summaries, ...) is invalidated by this.
+    """
+    with edit_index_state() as state:
+        state["generation"] = int(state.get("generation", 0)) + 1
+    return state["generation"]
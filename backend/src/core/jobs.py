@@ -0,0 +1,176 @@
+import hashlib
+import json
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from .config import get_settings
+from .progress import JobCancelled, JobContext, job_context
+from ..sqldb.db import SessionLocal
+from ..sqldb.models import Job
+from ..sqldb.crud import (
+    ACTIVE_JOB_STATUSES,
+    create_job,
+    fail_active_jobs,
+    get_active_job,
+    get_job,
+    update_job,
+)
+
+
+# kind -> handler(job_id, params) -> result dict
+JOB_HANDLERS: Dict[str, Callable[[str, Dict], Optional[Dict]]] = {}
+# Kinds of which at most one job may be queued or running, whatever its params
+SINGLETON_KINDS = set()
+
+
+def register_job_handler(
+    kind: str,
+    handler: Callable[[str, Dict], Optional[Dict]],
+    singleton: bool = False,
+):
+    JOB_HANDLERS[kind] = handler
+    if singleton:
+        SINGLETON_KINDS.add(kind)
+
+
+def job_dedup_key(kind: str, params: Dict) -> str:
+    if kind in SINGLETON_KINDS:
+        params = {}
+    payload = kind + "\x1f" + json.dumps(params, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class JobRunner:
+    """
+    Runs jobs on a bounded worker pool, off the HTTP workers. Job state is
+    persisted in the jobs table; progress is written at most every
+    `progress_interval` seconds.
+    """
+
+    def __init__(self, workers: int = 2, progress_interval: float = 1.0):
+        self.progress_interval = progress_interval
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._contexts: Dict[str, JobContext] = {}
+        self._last_write: Dict[str, float] = {}
+
+    def submit(self, kind: str, params: Dict = None) -> Tuple[Job, bool]:
+        """
+        Queue a job. If an identical job (same kind and params, or any job of
+        a singleton kind) is queued or running, that job is returned instead;
+        the unique Job.active_key makes this hold across server workers and
+        CLI processes too. Returns (job, created).
+        """
+        if kind not in JOB_HANDLERS:
+            raise KeyError(kind)
+
+        params = params or {}
+        key = job_dedup_key(kind, params)
+
+        with self._lock:
+            with SessionLocal() as db:
+                while True:
+                    active = get_active_job(db, key)
+                    if active is not None:
+                        return active, False
+                    try:
+                        job = create_job(db, uuid.uuid4().hex, kind, params, key)
+                        break
+                    except IntegrityError:
+                        # Another process queued it first; return that job,
+                        # or try again if it finished meanwhile.
+                        db.rollback()
+
+            ctx = JobContext(job.jobID, on_progress=self._on_progress)
+            self._contexts[job.jobID] = ctx
+
+        self._pool.submit(self._run, ctx, kind, params)
+        return job, True
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Request cancellation. Queued jobs are cancelled immediately; running
+        jobs stop at their next check_cancelled().
+        """
+        with SessionLocal() as db:
+            job = get_job(db, job_id)
+            if job is None:
+                return None
+
+            if job.status in ACTIVE_JOB_STATUSES:
+                fields = {"cancel_requested": True}
+                if job.status == "queued":
+                    fields.update(status="cancelled", finished_at=datetime.utcnow())
+                update_job(db, job_id, **fields)
+                db.refresh(job)
+
+        ctx = self._contexts.get(job_id)
+        if ctx is not None:
+            ctx.cancelled.set()
+        return job
+
+    # ---------- worker side ----------
+
+    def _on_progress(self, ctx: JobContext, fraction: float, message: str = None):
+        now = time.monotonic()
+        if fraction < 1.0 and now - self._last_write.get(ctx.job_id, 0.0) < self.progress_interval:
+            return
+        self._last_write[ctx.job_id] = now
+
+        fields = {"progress": round(fraction, 4)}
+        if message is not None:
+            fields["message"] = message[:255]
+        with SessionLocal() as db:
+            update_job(db, ctx.job_id, **fields)
+
+    def _finish(self, job_id: str, status: str, **fields):
+        with SessionLocal() as db:
+            update_job(db, job_id, status=status, finished_at=datetime.utcnow(), **fields)
+
+    def _run(self, ctx: JobContext, kind: str, params: Dict):
+        try:
+            if ctx.cancelled.is_set():
+                self._finish(ctx.job_id, "cancelled")
+                return
+
+            with SessionLocal() as db:
+                update_job(db, ctx.job_id, status="running", started_at=datetime.utcnow())
+
+            try:
+                with job_context(ctx):
+                    result = JOB_HANDLERS[kind](ctx.job_id, params) or {}
+            except JobCancelled:
+                self._finish(ctx.job_id, "cancelled")
+            except Exception as e:
+                traceback.print_exc()
+                self._finish(ctx.job_id, "failed", error=f"{type(e).__name__}: {e}")
+            else:
+                self._finish(ctx.job_id, "succeeded", progress=1.0, message="Done", result=result)
+        finally:
+            with self._lock:
+                self._contexts.pop(ctx.job_id, None)
+                self._last_write.pop(ctx.job_id, None)
+
+
+@lru_cache(maxsize=1)
+def get_job_runner() -> JobRunner:
+    settings = get_settings()
+
+    # Jobs that were queued or running when the process stopped never finish.
+    with SessionLocal() as db:
+        stale = fail_active_jobs(db, "Interrupted by a server restart")
+    if stale:
+        print(f"Marked {stale} interrupted job(s) as failed")
+
+    return JobRunner(
+        workers=settings.JOB_WORKERS,
+        progress_interval=settings.JOB_PROGRESS_INTERVAL,
+    )
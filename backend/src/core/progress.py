@@ -0,0 +1,256 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+
+from .config import get_settings
+
+
+class JobCancelled(Exception):
+    """Raised by check_cancelled inside a job whose cancellation was requested."""
+
+
+class JobContext:
+    """
+    Progress / cancellation handle of a running job. Long-running code does
+    not receive it explicitly; it calls report_progress / check_cancelled,
+    which find the job of the current context.
+    """
+
+    def __init__(self, job_id: str, on_progress: Callable = None):
+        self.job_id = job_id
+        self.cancelled = threading.Event()
+        self._on_progress = on_progress
+
+    def progress(self, fraction: float, message: str = None):
+        if self._on_progress is not None:
+            self._on_progress(self, fraction, message)
+
+
+_job = contextvars.ContextVar("current_job", default=None)
+# (start, end) of the overall progress range the current phase maps onto.
+_phase = contextvars.ContextVar("progress_phase", default=(0.0, 1.0))
+
+
+@contextmanager
+def job_context(ctx: JobContext):
+    token = _job.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _job.reset(token)
+
+
+def current_job() -> Optional[JobContext]:
+    return _job.get()
+
+
+@contextmanager
+def progress_phase(start: float, end: float):
+    """
+    Map progress reported inside the block (0..1) onto [start, end] of the
+    enclosing phase, so steps can report progress without knowing how they
+    are composed into a job.
+    """
+    lo, hi = _phase.get()
+    token = _phase.set((lo + (hi - lo) * start, lo + (hi - lo) * end))
+    try:
+        yield
+    finally:
+        _phase.reset(token)
+
+
+def report_progress(fraction: float, message: str = None):
+    """
+    Report progress of the current phase. No-op outside a job.
+    """
+    job = _job.get()
+    if job is None:
+        return
+    lo, hi = _phase.get()
+    fraction = min(max(fraction, 0.0), 1.0)
+    job.progress(lo + (hi - lo) * fraction, message)
+
+
+def check_cancelled():
+    """
+    Cooperative cancellation point. No-op outside a job.
+    """
+    job = _job.get()
+    if job is not None and job.cancelled.is_set():
+        raise JobCancelled(job.job_id)
+
+
+# ---------- Pipeline progress ----------
+
+PIPELINE_STAGES = (
+    "discovered",
+    "filtered",
+    "described",
+    "embedded",
+    "written",
+    "dirs",
+    "linked",
+)
+
+
+class PipelineProgress:
+    """
+    Per-stage counters of one ingestion run. Emitting only bumps a counter
+    under a lock; throughput and ETA are computed when a snapshot is taken,
+    from the last `window` seconds of activity.
+    """
+
+    def __init__(self, run_id: str, window: float = 30.0):
+        self.run_id = run_id
+        self.window = window
+        self.state = "running"
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+        self._counts = {stage: 0 for stage in PIPELINE_STAGES}
+        self._totals: Dict[str, int] = {}
+        self._history = {stage: deque() for stage in PIPELINE_STAGES}
+
+    def emit(self, stage: str, n: int = 1):
+        now = time.monotonic()
+        with self._lock:
+            self._counts[stage] += n
+            history = self._history[stage]
+            history.append((now, self._counts[stage]))
+            while history and now - history[0][0] > self.window:
+                history.popleft()
+
+    def set_total(self, stage: str, total: int):
+        with self._lock:
+            self._totals[stage] = total
+
+    def finish(self, state: str = "done"):
+        with self._lock:
+            self.state = state
+            self.finished = time.time()
+
+    def _expected(self, stage: str) -> Optional[int]:
+        if stage in self._totals:
+            return self._totals[stage]
+        # Every discovered file that is not filtered out goes through these.
+        if stage in ("described", "embedded", "written") and "discovered" in self._totals:
+            return self._totals["discovered"] - self._counts["filtered"]
+        return None
+
+    def _rate(self, stage: str, now: float) -> float:
+        # Items per second since the oldest sample in the window; measured up
+        # to `now` so the rate decays while a stage is stalled.
+        history = self._history[stage]
+        if len(history) < 2:
+            return 0.0
+        t0, c0 = history[0]
+        _, c1 = history[-1]
+        span = now - t0
+        return (c1 - c0) / span if span > 0 else 0.0
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            stages = {}
+            for stage in PIPELINE_STAGES:
+                count = self._counts[stage]
+                total = self._expected(stage)
+                rate = self._rate(stage, now)
+                eta = None
+                if total is not None and rate > 0:
+                    eta = round(max(total - count, 0) / rate, 1)
+                stages[stage] = {
+                    "count": count,
+                    "total": total,
+                    "rate_per_sec": round(rate, 3),
+                    "eta_seconds": eta,
+                }
+
+            end = self.finished or time.time()
+            return {
+                "run_id": self.run_id,
+                "state": self.state,
+                "started_at": self.started,
+                "elapsed_seconds": round(end - self.started, 1),
+                "stages": stages,
+            }
+
+
+class ProgressRegistry:
+    """
+    Progress of the most recent `max_runs` ingestion runs, by run id.
+    """
+
+    def __init__(self, max_runs: int = 20, window: float = 30.0):
+        self.max_runs = max_runs
+        self.window = window
+        self._runs: "OrderedDict[str, PipelineProgress]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, run_id: str) -> PipelineProgress:
+        with self._lock:
+            progress = self._runs.get(run_id)
+            if progress is None:
+                progress = PipelineProgress(run_id, window=self.window)
+                self._runs[run_id] = progress
+                while len(self._runs) > self.max_runs:
+                    self._runs.popitem(last=False)
+            return progress
+
+    def get(self, run_id: str) -> Optional[PipelineProgress]:
+        with self._lock:
+            return self._runs.get(run_id)
+
+
+@lru_cache(maxsize=1)
+def get_progress_registry() -> ProgressRegistry:
+    return ProgressRegistry(window=get_settings().PROGRESS_WINDOW)
+
+
+_pipeline = contextvars.ContextVar("current_pipeline", default=None)
+
+
+@contextmanager
+def track_pipeline(run_id: str):
+    """
+    Collect stage events emitted inside the block under `run_id`. Nested
+    blocks with the same run id share one tracker; the outermost one marks
+    the run finished.
+    """
+    progress = get_progress_registry().get_or_create(run_id)
+    outer = _pipeline.get() is not progress
+    token = _pipeline.set(progress)
+    try:
+        yield progress
+    except JobCancelled:
+        if outer:
+            progress.finish("cancelled")
+        raise
+    except Exception:
+        if outer:
+            progress.finish("failed")
+        raise
+    else:
+        if outer:
+            progress.finish("done")
+    finally:
+        _pipeline.reset(token)
+
+
+def emit_progress(stage: str, n: int = 1):
+    """
+    Count `n` items through a pipeline stage. No-op outside track_pipeline.
+    """
+    progress = _pipeline.get()
+    if progress is not None and n:
+        progress.emit(stage, n)
+
+
+def set_stage_total(stage: str, total: int):
+    progress = _pipeline.get()
+    if progress is not None:
+        progress.set_total(stage, total)
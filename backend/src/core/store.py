@@ -0,0 +1,370 @@
+import fcntl
+import json
+import re
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from chromadb import PersistentClient
+
+from .config import get_settings
+from .index_state import edit_index_state, load_index_state
+from .progress import check_cancelled
+from ..utils.iterate_cloning_dir import iter_chroma_entries
+
+
+WRITE_LOCK_FILENAME = "collections.lock"
+
+
+@lru_cache(maxsize=1)
+def get_client() -> PersistentClient:
+    settings = get_settings()
+    return PersistentClient(path=settings.PERSIST_DIR)
+
+
+def active_collection_name() -> str:
+    """
+    Name of the collection readers should use. Ingestion builds into a
+    shadow collection and switches this alias when it is done.
+    """
+    return load_index_state().get("active_collection") or get_settings().COLLECTION_NAME
+
+
+def get_collection(name: str = None):
+    return get_client().get_or_create_collection(
+        name=name or active_collection_name()
+    )
+
+
+def collection_artifacts_dir(name: str) -> Path:
+    """
+    Directory for files derived from one collection (lexical index,
+    adjacency map), so a shadow build never touches the live ones.
+    """
+    return Path(get_settings().PERSIST_DIR) / "collections" / name
+
+
+def collection_info(name: str = None) -> Dict:
+    """
+    Entry of a collection in the index state (run id, status, indexed
+    commits, ...).
+    """
+    name = name or active_collection_name()
+    return load_index_state().get("collections", {}).get(name, {})
+
+
+def update_collection_info(name: str, **fields):
+    with edit_index_state() as state:
+        state.setdefault("collections", {}).setdefault(name, {}).update(fields)
+
+
+@contextmanager
+def collection_write_lock() -> Iterator[None]:
+    """
+    Exclusive lock, across threads and processes, held by writers that
+    change the active collection in place (watch.py, linking it, gc without
+    compaction) and while a build that will replace it is started
+    (create_shadow_collection). An in-place writer that finds a collection
+    being built must leave the active one alone: the build copied or read
+    what it replaces before the write, and would drop it on activation.
+    Not reentrant.
+    """
+    root = Path(get_settings().PERSIST_DIR)
+    root.mkdir(parents=True, exist_ok=True)
+
+    with open(root / WRITE_LOCK_FILENAME, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def building_collections() -> list:
+    """
+    Collections being built to replace the active one (status "building").
+    """
+    collections = load_index_state().get("collections", {})
+    return sorted(name for name, entry in collections.items() if entry.get("status") == "building")
+
+
+def copy_collection(
+    source,
+    target,
+    exclude: Iterable[str] = (),
+    transform: Callable[[Dict], Dict] = None,
+    batch_size: int = 500,
+) -> int:
+    """
+    Copy nodes with their embeddings from `source` into `target`, skipping
+    `exclude` and passing each metadata through `transform`. Returns the
+    number of nodes copied.
+    """
+    exclude = set(exclude)
+    copied = 0
+    batch = []
+
+    def flush():
+        if batch:
+            target.upsert(
+                ids=[e["id"] for e in batch],
+                documents=[e["document"] for e in batch],
+                metadatas=[e["metadata"] for e in batch],
+                embeddings=[e["embedding"] for e in batch],
+            )
+            batch.clear()
+
+    for entry in iter_chroma_entries(
+        source,
+        batch_size=batch_size,
+        include=("documents", "metadatas", "embeddings"),
+    ):
+        if entry["id"] in exclude:
+            continue
+        metadata = entry["metadata"] or {}
+        entry["metadata"] = transform(metadata) if transform else metadata
+        batch.append(entry)
+        copied += 1
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return copied
+
+
+def strip_references(metadata: Dict, removed) -> int:
+    """
+    Drop repo_http links pointing at `removed` ids. Returns how many were
+    removed.
+    """
+    try:
+        repo_http = json.loads(metadata.get("repo_http", "[]"))
+    except Exception:
+        return 0
+
+    kept = [call for call in repo_http if call.get("target_file") not in removed]
+    dropped = len(repo_http) - len(kept)
+    if dropped:
+        metadata["repo_http"] = json.dumps(kept)
+    return dropped
+
+
+def prune_nodes(
+    collection,
+    ids: Iterable[str],
+    batch_size: int = 500,
+    strip_links: bool = True,
+) -> int:
+    """
+    Delete `ids` from `collection` and drop the links of the surviving
+    nodes that point at them. Returns how many references were removed.
+    Callers that relink afterwards pass strip_links=False to skip the scan.
+    """
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        check_cancelled()
+        collection.delete(ids=ids[start:start + batch_size])
+    if not strip_links:
+        return 0
+
+    removed_ids = set(ids)
+    references = 0
+    updates = {}
+    for entry in iter_chroma_entries(collection, include=("metadatas",)):
+        metadata = entry["metadata"] or {}
+        removed = strip_references(metadata, removed_ids)
+        if removed:
+            references += removed
+            updates[entry["id"]] = metadata
+
+    pending = list(updates.items())
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        collection.update(
+            ids=[doc_id for doc_id, _ in batch],
+            metadatas=[metadata for _, metadata in batch],
+        )
+    return references
+
+
+# ---------- Blue-green collections ----------
+
+def shadow_collection_name(run_id: str) -> str:
+    suffix = re.sub(r"[^a-zA-Z0-9._-]", "-", run_id).strip("-._")
+    return f"{get_settings().COLLECTION_NAME}-{suffix}"
+
+
+def create_shadow_collection(run_id: str):
+    """
+    Create an empty collection for a new ingestion run.
+    """
+    name = shadow_collection_name(run_id)
+    client = get_client()
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    collection = client.create_collection(name=name)
+
+    # Not while an in-place write to the active collection is under way.
+    with collection_write_lock(), edit_index_state() as state:
+        state.setdefault("collections", {})[name] = {
+            "run_id": run_id,
+            "status": "building",
+            "created_at": time.time(),
+        }
+    return collection
+
+
+def activate_collection(name: str) -> int:
+    """
+    Atomically point readers at `name` and bump the index generation.
+    The previously active collection is kept (status "retired") for
+    rollback until it is garbage-collected.
+    """
+    with edit_index_state() as state:
+        collections = state.setdefault("collections", {})
+        previous = state.get("active_collection") or get_settings().COLLECTION_NAME
+
+        if previous != name:
+            collections.setdefault(previous, {})["status"] = "retired"
+            collections[previous]["retired_at"] = time.time()
+
+        entry = collections.setdefault(name, {})
+        entry["status"] = "active"
+        entry["activated_at"] = time.time()
+
+        state["active_collection"] = name
+        state["generation"] = int(state.get("generation", 0)) + 1
+
+    print(f"Active collection -> {name} (generation {state['generation']})")
+    return state["generation"]
+
+
+def previous_collection_name() -> Optional[str]:
+    """
+    Newest retired collection built before the active one that still exists
+    in the store, so repeated rollbacks walk back through older builds.
+    """
+    state = load_index_state()
+    collections = state.get("collections", {})
+    active = collections.get(active_collection_name(), {})
+    cutoff = active.get("created_at", float("inf"))
+
+    existing = {c.name if hasattr(c, "name") else c for c in get_client().list_collections()}
+    candidates = [
+        (entry.get("created_at", 0), name)
+        for name, entry in collections.items()
+        if entry.get("status") == "retired"
+        and name in existing
+        and entry.get("created_at", 0) < cutoff
+    ]
+    return max(candidates)[1] if candidates else None
+
+
+def rollback_collection() -> Optional[str]:
+    name = previous_collection_name()
+    if name is not None:
+        activate_collection(name)
+    return name
+
+
+def _chroma_database() -> Path:
+    return Path(get_settings().PERSIST_DIR) / "chroma.sqlite3"
+
+
+def _segment_ids(name: str) -> list:
+    """
+    Ids of the segments of collection `name`, which are also the names of
+    their directories under PERSIST_DIR.
+    """
+    database = _chroma_database()
+    if not database.exists():
+        return []
+    with sqlite3.connect(database) as conn:
+        rows = conn.execute(
+            "SELECT s.id FROM segments s JOIN collections c ON s.collection = c.id WHERE c.name = ?",
+            (name,),
+        )
+        return [row[0] for row in rows]
+
+
+def collection_paths(name: str) -> list:
+    """
+    Directories holding collection `name` on disk: its segment directories
+    and its artifacts. Its rows in Chroma's SQLite file are not included.
+    """
+    root = Path(get_settings().PERSIST_DIR)
+    return [root / segment for segment in _segment_ids(name)] + [collection_artifacts_dir(name)]
+
+
+def drop_collection(name: str):
+    """
+    Delete collection `name` with its artifacts. Chroma leaves the HNSW
+    directories of a deleted collection behind, so the segment directories
+    it had are removed as well.
+    """
+    root = Path(get_settings().PERSIST_DIR)
+    segments = _segment_ids(name)
+    try:
+        get_client().delete_collection(name)
+    except Exception:
+        pass
+    for segment in segments:
+        shutil.rmtree(root / segment, ignore_errors=True)
+    shutil.rmtree(collection_artifacts_dir(name), ignore_errors=True)
+
+
+def drop_retired_collections(keep: int, in_progress: Iterable[str] = ()) -> list:
+    """
+    Delete all but the `keep` newest retired collections, and the
+    collections of abandoned builds (status "building" but not in
+    `in_progress`), with their artifacts. Returns the names that were
+    dropped.
+    """
+    in_progress = set(in_progress)
+    dropped = []
+    with edit_index_state() as state:
+        collections = state.get("collections", {})
+        retired = sorted(
+            (name for name, entry in collections.items() if entry.get("status") == "retired"),
+            key=lambda name: collections[name].get("created_at", 0),
+            reverse=True,
+        )
+        abandoned = [
+            name for name, entry in collections.items()
+            if entry.get("status") == "building" and name not in in_progress
+        ]
+
+        for name in retired[keep:] + abandoned:
+            drop_collection(name)
+            collections[name]["status"] = "deleted"
+            collections[name]["deleted_at"] = time.time()
+            dropped.append(name)
+    return dropped
+
+
+def vacuum_store() -> bool:
+    """
+    Rebuild Chroma's SQLite file, which never shrinks on its own, to give
+    the space of deleted collections back. VACUUM needs the database to
+    itself: writers in other processes fail with "database is locked"
+    while it runs, so only call it when nothing else is using the store.
+    Returns whether it ran.
+    """
+    database = _chroma_database()
+    if not database.exists():
+        return False
+
+    conn = sqlite3.connect(database, isolation_level=None)
+    try:
+        conn.execute("VACUUM")
+        return True
+    except sqlite3.OperationalError as e:
+        print(f"Skipping VACUUM: {e}")
+        return False
+    finally:
+        conn.close()
@@ -0,0 +1,210 @@
+import contextvars
+import json
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict
+
+from .config import get_settings
+
+
+_stage = contextvars.ContextVar("usage_stage", default="unknown")
+_repo = contextvars.ContextVar("usage_repo", default=None)
+_route = contextvars.ContextVar("usage_route", default=None)
+_run_id = contextvars.ContextVar("usage_run_id", default=None)
+
+# Filled in by providers that know the exact token counts of the call in progress.
+_call_usage = contextvars.ContextVar("usage_call", default=None)
+
+
+@contextmanager
+def usage_scope(stage: str = None, repo: str = None, route: str = None, run_id: str = None):
+    """
+    Tag every LLM / embedding call made inside the block.
+    Only the given tags are changed; the others are inherited.
+    """
+    tokens = []
+    for var, value in ((_stage, stage), (_repo, repo), (_route, route), (_run_id, run_id)):
+        if value is not None:
+            tokens.append((var, var.set(value)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def scoped_iter(iterator, **tags):
+    """
+    Apply usage_scope to each step of an iterator. Generators can be resumed
+    from different threads, so a scope cannot stay open across yields.
+    """
+    iterator = iter(iterator)
+    while True:
+        with usage_scope(**tags):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+
+
+@contextmanager
+def provider_call():
+    """
+    Collect exact usage reported by the provider during one call.
+    Yields a dict that report_provider_usage fills in.
+    """
+    holder: Dict = {}
+    token = _call_usage.set(holder)
+    try:
+        yield holder
+    finally:
+        _call_usage.reset(token)
+
+
+def report_provider_usage(input_tokens: int = None, output_tokens: int = None):
+    holder = _call_usage.get()
+    if holder is None:
+        return
+    if input_tokens is not None:
+        holder["input_tokens"] = int(input_tokens)
+    if output_tokens is not None:
+        holder["output_tokens"] = int(output_tokens)
+
+
+def _empty_bucket() -> Dict:
+    return {
+        "calls": 0,
+        "errors": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "latency_ms": 0.0,
+        "cost": 0.0,
+    }
+
+
+class UsageRecorder:
+    """
+    Aggregates token usage, latency and estimated cost of every provider
+    call by stage, repo, API route and ingestion run.
+    """
+
+    DIMENSIONS = ("stage", "repo", "route", "run")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict] = defaultdict(_empty_bucket)
+        self._by: Dict[str, Dict] = {
+            dim: defaultdict(lambda: defaultdict(_empty_bucket)) for dim in self.DIMENSIONS
+        }
+        # run_id -> stage / repo -> kind -> bucket
+        self._runs: Dict[str, Dict] = defaultdict(
+            lambda: {
+                "by_stage": defaultdict(lambda: defaultdict(_empty_bucket)),
+                "by_repo": defaultdict(lambda: defaultdict(_empty_bucket)),
+            }
+        )
+
+    def cost(self, kind: str, input_tokens: int, output_tokens: int) -> float:
+        settings = get_settings()
+        if kind == "embed":
+            return input_tokens * settings.EMBED_COST_PER_MTOK / 1e6
+        return (
+            input_tokens * settings.LLM_INPUT_COST_PER_MTOK
+            + output_tokens * settings.LLM_OUTPUT_COST_PER_MTOK
+        ) / 1e6
+
+    def record(
+        self,
+        kind: str,
+        input_tokens: int,
+        output_tokens: int,
+        latency_ms: float,
+        error: bool = False,
+    ):
+        cost = self.cost(kind, input_tokens, output_tokens)
+        keys = {
+            "stage": _stage.get(),
+            "repo": _repo.get(),
+            "route": _route.get(),
+            "run": _run_id.get(),
+        }
+
+        with self._lock:
+            buckets = [self._totals[kind]]
+            for dim, key in keys.items():
+                if key is not None:
+                    buckets.append(self._by[dim][key][kind])
+
+            if keys["run"] is not None:
+                run = self._runs[keys["run"]]
+                buckets.append(run["by_stage"][keys["stage"]][kind])
+                if keys["repo"] is not None:
+                    buckets.append(run["by_repo"][keys["repo"]][kind])
+
+            for bucket in buckets:
+                bucket["calls"] += 1
+                bucket["errors"] += int(error)
+                bucket["input_tokens"] += input_tokens
+                bucket["output_tokens"] += output_tokens
+                bucket["latency_ms"] += latency_ms
+                bucket["cost"] += cost
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return json.loads(json.dumps({
+                "totals": self._totals,
+                **{f"by_{dim}": self._by[dim] for dim in self.DIMENSIONS},
+            }))
+
+    def run_report(self, run_id: str) -> Dict:
+        """
+        Usage of a single ingestion run, broken down by stage and repo.
+        """
+        with self._lock:
+            return json.loads(json.dumps({
+                "run_id": run_id,
+                "totals": self._by["run"].get(run_id, {}),
+                **self._runs.get(run_id, {"by_stage": {}, "by_repo": {}}),
+            }))
+
+
+@lru_cache(maxsize=1)
+def get_usage_recorder() -> UsageRecorder:
+    return UsageRecorder()
+
+
+def _reports_dir() -> Path:
+    return Path(get_settings().PERSIST_DIR) / "reports"
+
+
+def read_run_report(run_id: str) -> Dict:
+    path = _reports_dir() / f"{Path(run_id).name}.json"
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_run_report(run_id: str, extra: Dict = None) -> Path:
+    """
+    Write the usage of an ingestion run to PERSIST_DIR/reports/<run_id>.json.
+    """
+    report = get_usage_recorder().run_report(run_id)
+    if extra:
+        report.update(extra)
+
+    path = _reports_dir() / f"{run_id}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Run report written -> {path}")
+    return path
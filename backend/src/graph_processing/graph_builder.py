@@ -1,6 +1,6 @@
 import json
-from chromadb import PersistentClient
 from ..core.config import get_settings
+from ..core.store import get_collection
 from pathlib import Path
 
 
@@ -21,10 +21,7 @@ def extract_name(path: str) -> str:
 def build_graph():
     settings = get_settings()
     cloning_dir = Path(settings.CLONING_DIR)
-    client = PersistentClient(path=settings.PERSIST_DIR)
-    collection = client.get_or_create_collection(
-        name=settings.COLLECTION_NAME
-    )
+    collection = get_collection()
 
     results = collection.get(include=["documents", "metadatas"])
 
@@ -0,0 +1,147 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..core.config import get_settings
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache keyed by question embedding and scope.
+
+    Embeddings are kept in a preallocated matrix so a lookup is a single
+    matrix-vector product over all cached entries. An entry only matches
+    lookups with the same scope (see answer_scope), so answers from one
+    collection or model are never served for another. Entries are evicted
+    in LRU order, and the whole cache is dropped when the index generation
+    changes.
+    """
+
+    def __init__(self, maxsize: int = 512, threshold: float = 0.95):
+        self.maxsize = maxsize
+        self.threshold = threshold
+
+        self._matrix: Optional[np.ndarray] = None
+        self._answers: List[Optional[str]] = [None] * maxsize
+        # Scope id of each slot, -1 for free slots.
+        self._slot_scopes = np.full(maxsize, -1, dtype=np.int32)
+        self._scope_ids: Dict[str, int] = {}
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self._free = list(range(maxsize - 1, -1, -1))
+        self._generation: Optional[int] = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # ---------- internal helpers (call with lock held) ----------
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _sync_generation(self, generation: int):
+        if self._generation == generation:
+            return
+        if self._lru:
+            self.invalidations += 1
+        self._reset()
+        self._generation = generation
+
+    def _reset(self):
+        self._answers = [None] * self.maxsize
+        self._slot_scopes.fill(-1)
+        self._scope_ids.clear()
+        self._lru.clear()
+        self._free = list(range(self.maxsize - 1, -1, -1))
+        if self._matrix is not None:
+            self._matrix.fill(0.0)
+
+    # ---------- public API ----------
+
+    def lookup(self, embedding, generation: int, scope: str) -> Optional[str]:
+        with self._lock:
+            self._sync_generation(generation)
+
+            scope_id = self._scope_ids.get(scope)
+            if scope_id is None:
+                self.misses += 1
+                return None
+
+            query = self._normalize(embedding)
+            # Free slots and other scopes can never beat a positive threshold.
+            sims = np.where(self._slot_scopes == scope_id, self._matrix @ query, -1.0)
+            slot = int(np.argmax(sims))
+
+            if sims[slot] < self.threshold or slot not in self._lru:
+                self.misses += 1
+                return None
+
+            self._lru.move_to_end(slot)
+            self.hits += 1
+            return self._answers[slot]
+
+    def store(self, embedding, answer: str, generation: int, scope: str):
+        with self._lock:
+            self._sync_generation(generation)
+
+            vec = self._normalize(embedding)
+            if self._matrix is None:
+                self._matrix = np.zeros((self.maxsize, vec.shape[0]), dtype=np.float32)
+
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot, _ = self._lru.popitem(last=False)
+                self.evictions += 1
+
+            self._matrix[slot] = vec
+            self._answers[slot] = answer
+            self._slot_scopes[slot] = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            self._lru[slot] = None
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._lru),
+                "scopes": len(self._scope_ids),
+                "maxsize": self.maxsize,
+                "threshold": self.threshold,
+                "generation": self._generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def answer_scope(collection, model: str = None) -> str:
+    """
+    Cache scope of answers generated from `collection` by `model`
+    (the primary model by default).
+    """
+    if model is None:
+        model = get_settings().GROQ_MODEL
+    return f"{collection.name}:{model}"
+
+
+@lru_cache(maxsize=1)
+def get_answer_cache() -> SemanticAnswerCache:
+    settings = get_settings()
+    return SemanticAnswerCache(
+        maxsize=settings.ANSWER_CACHE_SIZE,
+        threshold=settings.ANSWER_CACHE_THRESHOLD,
+    )
@@ -0,0 +1,106 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .tokens import estimate_tokens
+
+
+def render_context_block(node_type: str, path: str, document: str, metadata: Dict) -> str:
+    """
+    Render the context block shown to the LLM for a single node.
+
+    This runs once per node at ingestion time (the result is stored in the
+    node metadata), so packing a prompt at query time is just concatenation.
+    """
+    short = metadata.get("short", "")
+
+    if node_type == "repo":
+        return f"""
+REPOSITORY:
+{Path(path)}
+
+Purpose:
+{short}
+""".strip()
+
+    if node_type == "dir":
+        return f"""
+DIRECTORY: {Path(path)}
+Purpose: {short}
+""".strip()
+
+    http_calls = []
+    try:
+        http_calls = json.loads(metadata.get("http_calls", "[]"))
+    except Exception:
+        pass
+
+    http_block = ""
+    if http_calls:
+        http_block = "\nHTTP Calls:\n" + "\n".join(
+            f"- {c.get('method', '').upper()} {c.get('url', '')}"
+            for c in http_calls[:2]
+        )
+
+    return f"""
+FILE: {Path(path)}
+Purpose: {short}
+
+Details:
+{document}
+{http_block}
+""".strip()
+
+
+def context_block_metadata(node_type: str, path: str, document: str, metadata: Dict) -> Dict:
+    """
+    Metadata fields holding the pre-rendered block and its token count.
+    """
+    block = render_context_block(node_type, path, document, metadata)
+    return {
+        "context_block": block,
+        "context_tokens": estimate_tokens(block),
+    }
+
+
+def get_context_block(item: Dict) -> Tuple[str, int]:
+    """
+    Pre-rendered block of a retrieved node, rendered on the fly for nodes
+    indexed before blocks were stored.
+    """
+    meta = item["metadata"]
+    block = meta.get("context_block")
+    if block:
+        return block, int(meta.get("context_tokens") or estimate_tokens(block))
+
+    block = render_context_block(meta.get("type"), item["path"], item["document"] or "", meta)
+    return block, estimate_tokens(block)
+
+
+def pack_blocks(
+    retrieved: List[Dict],
+    token_budget: int,
+    rrf_k: int = 60,
+) -> List[Dict]:
+    """
+    Greedy knapsack: take nodes in order of relevance per token while they
+    fit in the budget. Returns the chosen items in their original order.
+    """
+    candidates = []
+    for position, item in enumerate(retrieved):
+        block, tokens = get_context_block(item)
+        relevance = item.get("rank_score") or 1.0 / (rrf_k + position + 1)
+        candidates.append((relevance / max(tokens, 1), position, item, block, tokens))
+
+    candidates.sort(key=lambda c: c[0], reverse=True)
+
+    chosen = []
+    remaining = token_budget
+    for _, position, item, block, tokens in candidates:
+        if tokens > remaining:
+            continue
+        remaining -= tokens
+        chosen.append((position, {**item, "context_block": block}))
+
+    chosen.sort(key=lambda c: c[0])
+    return [item for _, item in chosen]
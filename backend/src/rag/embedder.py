@@ -1,8 +1,9 @@
 from functools import lru_cache
-from sentence_transformers import SentenceTransformer
 from abc import ABC, abstractmethod
 from typing import List
 from ..core.config import get_settings
+from ..core.executor import run_blocking
+from ..core.usage import report_provider_usage
 import cohere
 from typing import List, Union
 
@@ -12,9 +13,20 @@ class Embedder(ABC):
     def embed(self, texts: List[str]) -> List[List[float]]:
         pass
 
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Async variant of embed. Defaults to running embed on the bounded
+        blocking pool; providers with a native async client override it.
+        """
+        return await run_blocking(self.embed, texts)
+
 
 class LocalEmbedder(Embedder):
     def __init__(self, model_name: str):
+        # Imported lazily: sentence-transformers pulls in torch, which API and
+        # offline setups do not need.
+        from sentence_transformers import SentenceTransformer
+
         self.model = SentenceTransformer(model_name)
 
     def embed(self, texts):
@@ -29,6 +41,7 @@ class APIEmbedder(Embedder):
         input_type: str = "search_document",
     ):
         self.client = cohere.Client(api_key)
+        self.async_client = cohere.AsyncClient(api_key)
         self.model = model
         self.input_type = input_type
 
@@ -46,14 +59,54 @@ class APIEmbedder(Embedder):
             input_type=self.input_type,
         )
 
+        return self._embeddings(response)
+
+    async def aembed(self, texts: Union[str, List[str]]) -> List[List[float]]:
+        if isinstance(texts, str):
+            texts = [texts]
+
+        response = await self.async_client.embed(
+            texts=texts,
+            model=self.model,
+            input_type=self.input_type,
+        )
+
+        return self._embeddings(response)
+
+    @staticmethod
+    def _embeddings(response) -> List[List[float]]:
+        billed = getattr(getattr(response, "meta", None), "billed_units", None)
+        if billed is not None and billed.input_tokens is not None:
+            report_provider_usage(input_tokens=billed.input_tokens)
         return response.embeddings
 
 
-@lru_cache(maxsize=1)
+@lru_cache(maxsize=None)
 def get_embedder(input_type="search_document"):
+    from .metering import MeteredEmbedder
+
+    return MeteredEmbedder(_provider_embedder(input_type))
+
+
+def _provider_embedder(input_type: str) -> Embedder:
     settings = get_settings()
+
+    if settings.EMBEDDER_PROVIDER == "fake":
+        from .fakes import FakeEmbedder
+
+        return FakeEmbedder(
+            dim=settings.FAKE_EMBEDDING_DIM,
+            latency_ms=settings.FAKE_LATENCY_MS,
+            error_rate=settings.FAKE_ERROR_RATE,
+            seed=settings.FAKE_SEED,
+            input_type=input_type,
+        )
+
+    if settings.EMBEDDER_PROVIDER == "local":
+        return LocalEmbedder(settings.EMBEDDER_MODEL_NAME)
+
     return APIEmbedder(
         settings.COHERE_API_KEY,
         settings.COHERE_EMBEDDER_MODEL,
         input_type=input_type,
-    )
\ No newline at end of file
+    )
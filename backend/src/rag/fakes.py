@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Union
+
+import numpy as np
+
+from .embedder import Embedder
+from .llm import LLM
+
+
+_WORDS = (
+    "module service handler request response client server route config "
+    "model data parser index query cache graph node file directory repository "
+    "function class endpoint helper utility pipeline vector embedding summary "
+    "loads stores returns builds computes validates exposes wraps calls reads"
+).split()
+
+_FILE_HEADER_RE = re.compile(r"=== FILE: (.+?) ===")
+
+
+class FakeProviderError(RuntimeError):
+    """Injected provider failure; looks like a rate limit to the retry logic."""
+
+    status_code = 429
+
+
+def _seed(*parts: str) -> int:
+    digest = hashlib.sha256("\x1f".join(parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+class _FaultInjector:
+    """
+    Shared latency / error behaviour. Errors are drawn from a seeded RNG, so
+    a given sequence of calls fails at the same points on every run.
+    """
+
+    def __init__(self, latency_ms: float, error_rate: float, seed: int):
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.calls += 1
+            return self._rng.random() < self.error_rate
+
+    def before_call(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self._should_fail():
+            raise FakeProviderError("injected provider error")
+
+    async def abefore_call(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._should_fail():
+            raise FakeProviderError("injected provider error")
+
+
+class FakeLLM(LLM):
+    """
+    Offline LLM for benchmarking: output is a deterministic function of the
+    prompt (and seed), so runs are reproducible without network access.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.seed = seed
+        self.faults = _FaultInjector(latency_ms, error_rate, seed)
+
+    def _text(self, prompt: str, n_words: int = 40) -> str:
+        rng = random.Random(_seed(str(self.seed), prompt))
+        words = [rng.choice(_WORDS) for _ in range(n_words)]
+        sentences = [" ".join(words[i:i + 10]) for i in range(0, n_words, 10)]
+        return ". ".join(s.capitalize() for s in sentences) + "."
+
+    def _description(self, key: str) -> Dict[str, str]:
+        return {
+            "short": self._text("short:" + key, 10),
+            "detailed": self._text("detailed:" + key, 60),
+        }
+
+    def _json(self, prompt: str) -> str:
+        paths = _FILE_HEADER_RE.findall(prompt)
+        if paths:
+            return json.dumps({
+                "files": [
+                    {"path": path, **self._description(prompt + path)}
+                    for path in paths
+                ]
+            })
+        return json.dumps(self._description(prompt))
+
+    def generate(self, prompt: str) -> str:
+        self.faults.before_call()
+        return self._text(prompt)
+
+    def chat(self, messages: List[Dict[str, str]]) -> str:
+        self.faults.before_call()
+        return self._text("\n".join(m.get("content", "") for m in messages))
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        self.faults.before_call()
+        for word in self._text(prompt).split(" "):
+            yield word + " "
+
+    async def agenerate(self, prompt: str) -> str:
+        await self.faults.abefore_call()
+        return self._text(prompt)
+
+    async def achat(self, messages: List[Dict[str, str]]) -> str:
+        await self.faults.abefore_call()
+        return self._text("\n".join(m.get("content", "") for m in messages))
+
+    def generate_json_text(self, prompt: str) -> str:
+        self.faults.before_call()
+        return self._json(prompt)
+
+
+class FakeEmbedder(Embedder):
+    """
+    Offline embedder: each text maps to a fixed unit vector seeded by its
+    hash, so identical texts always get identical embeddings.
+    """
+
+    def __init__(
+        self,
+        dim: int = 1024,
+        latency_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        input_type: str = "search_document",
+    ):
+        self.dim = dim
+        self.seed = seed
+        self.input_type = input_type
+        self.faults = _FaultInjector(latency_ms, error_rate, seed)
+
+    def _vector(self, text: str) -> List[float]:
+        rng = np.random.default_rng(_seed(str(self.seed), text))
+        vec = rng.standard_normal(self.dim).astype(np.float32)
+        return (vec / np.linalg.norm(vec)).tolist()
+
+    def embed(self, texts: Union[str, List[str]]) -> List[List[float]]:
+        if isinstance(texts, str):
+            texts = [texts]
+        self.faults.before_call()
+        return [self._vector(t) for t in texts]
+
+    async def aembed(self, texts: Union[str, List[str]]) -> List[List[float]]:
+        if isinstance(texts, str):
+            texts = [texts]
+        await self.faults.abefore_call()
+        return [self._vector(t) for t in texts]
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from ..core.store import active_collection_name, collection_artifacts_dir
+from ..utils.iterate_cloning_dir import iter_chroma_entries
+
+
+ADJACENCY_FILENAME = "adjacency.json"
+
+
+def _adjacency_path(collection_name: str = None) -> Path:
+    return collection_artifacts_dir(collection_name or active_collection_name()) / ADJACENCY_FILENAME
+
+
+def build_adjacency_map(collection) -> Path:
+    """
+    Precompute one-hop outgoing edges for every node:
+    { node_id: [[neighbor_id, "import" | "http"], ...] }
+
+    Only edges whose target is itself indexed are kept.
+    """
+    metadatas = {
+        entry["id"]: entry["metadata"] or {}
+        for entry in iter_chroma_entries(collection, include=("metadatas",))
+    }
+
+    adjacency: Dict[str, List[List[str]]] = {}
+
+    for doc_id, meta in metadatas.items():
+        edges = []
+        seen = set()
+
+        try:
+            imports = json.loads(meta.get("imports", "[]"))
+        except Exception:
+            imports = []
+
+        for target in imports:
+            if target in metadatas and target != doc_id and target not in seen:
+                seen.add(target)
+                edges.append([target, "import"])
+
+        try:
+            repo_http = json.loads(meta.get("repo_http", "[]"))
+        except Exception:
+            repo_http = []
+
+        for call in repo_http:
+            target = call.get("target_file")
+            if target in metadatas and target != doc_id and target not in seen:
+                seen.add(target)
+                edges.append([target, "http"])
+
+        if edges:
+            adjacency[doc_id] = edges
+
+    path = _adjacency_path(collection.name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(adjacency, f)
+    os.replace(tmp, path)
+
+    print(f"Adjacency map written: {len(adjacency)} nodes with edges -> {path}")
+    return path
+
+
+_lock = threading.Lock()
+_loaded: Dict[Path, Tuple[int, Dict]] = {}
+
+
+def get_adjacency_map(collection_name: str = None) -> Dict[str, List[List[str]]]:
+    path = _adjacency_path(collection_name)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {}
+
+    with _lock:
+        loaded = _loaded.get(path)
+        if loaded is None or loaded[0] != mtime:
+            with open(path, "r", encoding="utf-8") as f:
+                loaded = (mtime, json.load(f))
+            _loaded[path] = loaded
+        return loaded[1]
+
+
+def expand_with_neighbors(
+    collection,
+    retrieved: List[Dict],
+    max_neighbors: int = 4,
+    decay: float = 0.5,
+) -> List[Dict]:
+    """
+    Add one-hop import / HTTP neighbors of the retrieved nodes.
+
+    A neighbor scores `decay * rank_score` of the node that pulled it in;
+    nodes reached more than once keep their best score. The result is
+    deduplicated and sorted by rank_score.
+    """
+    adjacency = get_adjacency_map(collection.name)
+    if not adjacency or not retrieved:
+        return retrieved
+
+    by_id = {item["id"]: item for item in retrieved}
+    candidates: Dict[str, Dict] = {}
+
+    for item in retrieved:
+        for neighbor_id, edge_type in adjacency.get(item["id"], []):
+            if neighbor_id in by_id:
+                continue
+
+            score = decay * item.get("rank_score", 0.0)
+            best = candidates.get(neighbor_id)
+            if best is None or score > best["rank_score"]:
+                candidates[neighbor_id] = {
+                    "rank_score": score,
+                    "expanded_from": item["id"],
+                    "edge": edge_type,
+                }
+
+    if not candidates:
+        return retrieved
+
+    chosen = sorted(
+        candidates.items(),
+        key=lambda kv: kv[1]["rank_score"],
+        reverse=True,
+    )[:max_neighbors]
+
+    res = collection.get(
+        ids=[neighbor_id for neighbor_id, _ in chosen],
+        include=["documents", "metadatas"],
+    )
+    found = {
+        doc_id: (doc, meta)
+        for doc_id, doc, meta in zip(res["ids"], res["documents"], res["metadatas"])
+    }
+
+    expanded = list(retrieved)
+    for neighbor_id, info in chosen:
+        if neighbor_id not in found:
+            continue
+        doc, meta = found[neighbor_id]
+        expanded.append({
+            "id": neighbor_id,
+            "type": meta.get("type"),
+            "path": meta.get("path"),
+            "document": doc,
+            "metadata": meta,
+            "score": None,
+            **info,
+        })
+
+    expanded.sort(key=lambda item: item.get("rank_score", 0.0), reverse=True)
+    return expanded
@@ -0,0 +1,211 @@
+import json
+import math
+import os
+import re
+import shutil
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.store import active_collection_name, collection_artifacts_dir
+from ..utils.iterate_cloning_dir import iter_chroma_entries
+
+
+LEXICON_FILE = "lexicon.json"
+DOC_IDS_FILE = "postings_docs.npy"
+WEIGHTS_FILE = "postings_weights.npy"
+
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Identifier-aware tokenizer: "get_file_info" and "ChromaRetriever" are
+    indexed both whole and split into their parts.
+    """
+    tokens = []
+    for word in _WORD_RE.findall(text or ""):
+        tokens.append(word.lower())
+
+        parts = [p for chunk in word.split("_") for p in _CAMEL_RE.findall(chunk)]
+        if len(parts) > 1:
+            tokens.extend(p.lower() for p in parts)
+
+    return tokens
+
+
+def _index_dir(collection_name: str = None) -> Path:
+    return collection_artifacts_dir(collection_name or active_collection_name()) / "lexical"
+
+
+def _node_text(document: str, metadata: Dict) -> str:
+    """
+    Text indexed for a node: the description plus the fields that carry
+    exact identifiers (path, defined symbols, route paths).
+    """
+    fields = [document or "", metadata.get("path", "")]
+
+    try:
+        fields.extend(json.loads(metadata.get("symbols_defined", "[]")))
+    except Exception:
+        pass
+
+    try:
+        for route in json.loads(metadata.get("routes", "[]")):
+            fields.append(route.get("path") or "")
+            fields.append(route.get("function_name") or "")
+    except Exception:
+        pass
+
+    return "\n".join(fields)
+
+
+def build_lexical_index(collection, k1: float = 1.2, b: float = 0.75) -> Path:
+    """
+    Build an inverted BM25 index over the collection and write it next to
+    the collection's other artifacts (PERSIST_DIR/collections/<name>/lexical).
+
+    Postings store the final BM25 weight of each (term, doc) pair, so a query
+    is just a sum over the postings of its terms.
+    """
+    ids: List[str] = []
+    doc_lengths: List[int] = []
+    postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+
+    for entry in iter_chroma_entries(collection):
+        doc_idx = len(ids)
+        ids.append(entry["id"])
+
+        tokens = tokenize(_node_text(entry["document"], entry["metadata"] or {}))
+        doc_lengths.append(len(tokens))
+
+        for term, tf in Counter(tokens).items():
+            postings[term].append((doc_idx, tf))
+
+    n_docs = len(ids)
+    avgdl = (sum(doc_lengths) / n_docs) if n_docs else 0.0
+    avgdl = avgdl or 1.0
+
+    terms: Dict[str, List[int]] = {}
+    doc_chunks = []
+    weight_chunks = []
+    offset = 0
+
+    for term in sorted(postings):
+        plist = postings[term]
+        df = len(plist)
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+        docs = np.fromiter((d for d, _ in plist), dtype=np.uint32, count=df)
+        tfs = np.fromiter((tf for _, tf in plist), dtype=np.float32, count=df)
+        dl = np.asarray([doc_lengths[d] for d, _ in plist], dtype=np.float32)
+
+        weights = idf * tfs * (k1 + 1) / (tfs + k1 * (1 - b + b * dl / avgdl))
+
+        doc_chunks.append(docs)
+        weight_chunks.append(weights.astype(np.float32))
+        terms[term] = [offset, offset + df]
+        offset += df
+
+    out_dir = _index_dir(collection.name)
+    tmp_dir = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    np.save(
+        tmp_dir / DOC_IDS_FILE,
+        np.concatenate(doc_chunks) if doc_chunks else np.zeros(0, dtype=np.uint32),
+    )
+    np.save(
+        tmp_dir / WEIGHTS_FILE,
+        np.concatenate(weight_chunks) if weight_chunks else np.zeros(0, dtype=np.float32),
+    )
+    with open(tmp_dir / LEXICON_FILE, "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "terms": terms, "k1": k1, "b": b}, f)
+
+    old_dir = out_dir.with_name(out_dir.name + ".old")
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if out_dir.exists():
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    print(f"Lexical index written: {n_docs} docs, {len(terms)} terms -> {out_dir}")
+    return out_dir
+
+
+class LexicalIndex:
+    """
+    Read side of the BM25 index. Posting arrays are memory-mapped, so opening
+    the index is cheap and only the pages touched by a query are read.
+    """
+
+    def __init__(self, index_dir: Path):
+        with open(index_dir / LEXICON_FILE, "r", encoding="utf-8") as f:
+            lexicon = json.load(f)
+
+        self.ids: List[str] = lexicon["ids"]
+        self.terms: Dict[str, List[int]] = lexicon["terms"]
+        self.doc_ids = np.load(index_dir / DOC_IDS_FILE, mmap_mode="r")
+        self.weights = np.load(index_dir / WEIGHTS_FILE, mmap_mode="r")
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        if not self.ids:
+            return []
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            span = self.terms.get(term)
+            if span is None:
+                continue
+            start, end = span
+            np.add.at(scores, self.doc_ids[start:end], self.weights[start:end])
+
+        hits = np.flatnonzero(scores)
+        if hits.size == 0:
+            return []
+
+        if hits.size > top_k:
+            hits = hits[np.argpartition(scores[hits], -top_k)[-top_k:]]
+        hits = hits[np.argsort(-scores[hits])]
+
+        return [(self.ids[i], float(scores[i])) for i in hits]
+
+
+_lock = threading.Lock()
+_loaded: Dict[Path, Tuple[int, "LexicalIndex"]] = {}
+
+
+def get_lexical_index(collection_name: str = None) -> Optional[LexicalIndex]:
+    """
+    Return the lexical index of a collection (the active one by default),
+    reopening it after a rebuild. Returns None when no index has been built.
+    """
+    index_dir = _index_dir(collection_name)
+    try:
+        mtime = (index_dir / LEXICON_FILE).stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _lock:
+        loaded = _loaded.get(index_dir)
+        if loaded is None or loaded[0] != mtime:
+            loaded = (mtime, LexicalIndex(index_dir))
+            _loaded[index_dir] = loaded
+        return loaded[1]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several ranked id lists: score(d) = sum over lists of 1 / (k + rank).
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
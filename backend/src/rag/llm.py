@@ -1,10 +1,14 @@
 from abc import ABC, abstractmethod
 from functools import lru_cache
-from typing import List, Dict
+from typing import Any, List, Dict, Iterator, Optional
 
+from groq import BadRequestError
 from langchain_groq import ChatGroq
 
 from ..core.config import get_settings
+from ..core.executor import run_blocking
+from ..core.usage import report_provider_usage
+from .structured import StructuredOutputError, correction_prompt, parse_structured
 
 
 class LLM(ABC):
@@ -18,29 +22,161 @@ class LLM(ABC):
         """Generate a response from chat messages"""
         pass
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Yield the response to a single prompt in chunks as they arrive"""
+        yield self.generate(prompt)
+
+    async def agenerate(self, prompt: str) -> str:
+        """Async variant of generate (runs generate on the blocking pool by default)"""
+        return await run_blocking(self.generate, prompt)
+
+    async def achat(self, messages: List[Dict[str, str]]) -> str:
+        """Async variant of chat (runs chat on the blocking pool by default)"""
+        return await run_blocking(self.chat, messages)
+
+    def generate_json_text(self, prompt: str) -> str:
+        """Raw response to a prompt that asks for a JSON object; providers with a JSON mode override this"""
+        return self.generate(prompt)
+
+    def generate_json(self, prompt: str, schema: Any, max_retries: int = 2) -> Any:
+        """
+        Generate a JSON object matching `schema`.
+
+        Near-JSON output is repaired locally first; only if that fails is the
+        same prompt re-asked, at most `max_retries` times.
+        """
+        attempt_prompt = prompt
+        for attempt in range(max_retries + 1):
+            try:
+                try:
+                    response = self.generate_json_text(attempt_prompt)
+                except StructuredOutputError as e:
+                    # Rejected by the provider's JSON mode; what the model
+                    # generated may still be repairable.
+                    if e.failed_generation is None:
+                        raise
+                    response = e.failed_generation
+                return parse_structured(response, schema)
+            except StructuredOutputError as e:
+                if attempt == max_retries:
+                    raise
+                attempt_prompt = correction_prompt(prompt, e)
+
 
 class GroqLLM(LLM):
-    def __init__(self, model: str, temperature: float, api_key: str):
+    def __init__(
+        self,
+        model: str,
+        temperature: float,
+        api_key: str,
+        timeout: float = None,
+        max_retries: int = 2,
+    ):
         self._llm = ChatGroq(
             model=model,
             temperature=temperature,
-            api_key=api_key
+            api_key=api_key,
+            timeout=timeout,
+            max_retries=max_retries,
         )
+        self._json_llm = self._llm.bind(response_format={"type": "json_object"})
 
-    def generate(self, prompt: str) -> str:
-        response = self._llm.invoke(prompt)
+    @staticmethod
+    def _content(response) -> str:
+        usage = getattr(response, "usage_metadata", None) or {}
+        report_provider_usage(usage.get("input_tokens"), usage.get("output_tokens"))
         return response.content
 
+    def generate(self, prompt: str) -> str:
+        return self._content(self._llm.invoke(prompt))
+
+    def generate_json_text(self, prompt: str) -> str:
+        try:
+            return self._content(self._json_llm.invoke(prompt))
+        except BadRequestError as e:
+            # JSON mode answers invalid JSON with a 400 that carries the output.
+            body = e.body if isinstance(e.body, dict) else {}
+            error = body.get("error", body)
+            if not isinstance(error, dict) or error.get("code") != "json_validate_failed":
+                raise
+            raise StructuredOutputError(
+                "output is not valid JSON",
+                failed_generation=error.get("failed_generation"),
+            ) from e
+
     def chat(self, messages: List[Dict[str, str]]) -> str:
-        response = self._llm.invoke(messages)
-        return response.content
+        return self._content(self._llm.invoke(messages))
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._llm.stream(prompt):
+            usage = getattr(chunk, "usage_metadata", None)
+            if usage:
+                report_provider_usage(usage.get("input_tokens"), usage.get("output_tokens"))
+            if chunk.content:
+                yield chunk.content
+
+    async def agenerate(self, prompt: str) -> str:
+        return self._content(await self._llm.ainvoke(prompt))
+
+    async def achat(self, messages: List[Dict[str, str]]) -> str:
+        return self._content(await self._llm.ainvoke(messages))
+
+
+def _build_llm(model: str, seed: int) -> LLM:
+    from .resilience import ResilientLLM, CircuitBreaker
+    from .metering import MeteredLLM
+
+    settings = get_settings()
+    requests_per_minute = settings.LLM_REQUESTS_PER_MINUTE
+    tokens_per_minute = settings.LLM_TOKENS_PER_MINUTE
+    if settings.LLM_PROVIDER == "fake":
+        from .fakes import FakeLLM
+
+        provider = FakeLLM(
+            latency_ms=settings.FAKE_LATENCY_MS,
+            error_rate=settings.FAKE_ERROR_RATE,
+            seed=seed,
+        )
+        # The provider's quota does not apply; retries and the breaker still do.
+        requests_per_minute = tokens_per_minute = None
+    else:
+        provider = GroqLLM(
+            model=model,
+            temperature=settings.TEMPERATURE,
+            api_key=settings.GROQ_API_KEY,
+            timeout=settings.LLM_CALL_TIMEOUT,
+            # retries are handled by ResilientLLM
+            max_retries=0,
+        )
+    return ResilientLLM(
+        MeteredLLM(provider),
+        max_retries=settings.LLM_MAX_RETRIES,
+        backoff_base=settings.LLM_BACKOFF_BASE,
+        backoff_max=settings.LLM_BACKOFF_MAX,
+        call_timeout=settings.LLM_CALL_TIMEOUT,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        expected_output_tokens=settings.LLM_EXPECTED_OUTPUT_TOKENS,
+        breaker=CircuitBreaker(
+            failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.LLM_CIRCUIT_RESET_TIMEOUT,
+        ),
+    )
 
 
 @lru_cache(maxsize=1)
 def get_llm() -> LLM:
     settings = get_settings()
-    return GroqLLM(
-        model=settings.GROQ_MODEL,
-        temperature=settings.TEMPERATURE,
-        api_key=settings.GROQ_API_KEY
-    )
+    return _build_llm(settings.GROQ_MODEL, settings.FAKE_SEED)
+
+
+@lru_cache(maxsize=1)
+def get_secondary_llm() -> Optional[LLM]:
+    """
+    Second model used to hedge slow generations. It has its own rate limiter
+    and circuit breaker, so an unhealthy primary does not trip it.
+    """
+    settings = get_settings()
+    if not settings.GROQ_SECONDARY_MODEL:
+        return None
+    return _build_llm(settings.GROQ_SECONDARY_MODEL, settings.FAKE_SEED + 1)
@@ -0,0 +1,126 @@
+import time
+from typing import Dict, Iterator, List, Union
+
+from ..core.usage import get_usage_recorder, provider_call
+from .embedder import Embedder
+from .llm import LLM
+from .tokens import estimate_tokens
+
+
+def _messages_text(messages: List[Dict[str, str]]) -> str:
+    return "\n".join(m.get("content", "") for m in messages)
+
+
+class MeteredLLM(LLM):
+    """
+    Records tokens, latency and cost of every provider call under the
+    current usage scope. Exact counts are used when the provider reports
+    them, estimates otherwise.
+    """
+
+    def __init__(self, inner: LLM):
+        self.inner = inner
+
+    def _record(self, usage: Dict, prompt_text: str, output: str, started: float, error: bool):
+        get_usage_recorder().record(
+            "llm",
+            input_tokens=usage.get("input_tokens", estimate_tokens(prompt_text)),
+            output_tokens=usage.get("output_tokens", estimate_tokens(output)),
+            latency_ms=(time.perf_counter() - started) * 1000,
+            error=error,
+        )
+
+    def _metered(self, fn, payload, prompt_text: str):
+        started = time.perf_counter()
+        with provider_call() as usage:
+            try:
+                output = fn(payload)
+            except Exception:
+                self._record(usage, prompt_text, "", started, error=True)
+                raise
+            self._record(usage, prompt_text, output, started, error=False)
+            return output
+
+    async def _ametered(self, fn, payload, prompt_text: str):
+        started = time.perf_counter()
+        with provider_call() as usage:
+            try:
+                output = await fn(payload)
+            except Exception:
+                self._record(usage, prompt_text, "", started, error=True)
+                raise
+            self._record(usage, prompt_text, output, started, error=False)
+            return output
+
+    def generate(self, prompt: str) -> str:
+        return self._metered(self.inner.generate, prompt, prompt)
+
+    def chat(self, messages: List[Dict[str, str]]) -> str:
+        return self._metered(self.inner.chat, messages, _messages_text(messages))
+
+    def generate_json_text(self, prompt: str) -> str:
+        return self._metered(self.inner.generate_json_text, prompt, prompt)
+
+    async def agenerate(self, prompt: str) -> str:
+        return await self._ametered(self.inner.agenerate, prompt, prompt)
+
+    async def achat(self, messages: List[Dict[str, str]]) -> str:
+        return await self._ametered(self.inner.achat, messages, _messages_text(messages))
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        # A generator may be resumed from different threads / contexts, so
+        # it cannot hold a provider_call scope open; tokens are estimated.
+        started = time.perf_counter()
+        parts = []
+        try:
+            for chunk in self.inner.stream(prompt):
+                parts.append(chunk)
+                yield chunk
+        except Exception:
+            self._record({}, prompt, "".join(parts), started, error=True)
+            raise
+        self._record({}, prompt, "".join(parts), started, error=False)
+
+
+class MeteredEmbedder(Embedder):
+    """
+    Records input tokens, latency and cost of every embedding call.
+    """
+
+    def __init__(self, inner: Embedder):
+        self.inner = inner
+
+    def _record(self, usage: Dict, texts: List[str], started: float, error: bool):
+        get_usage_recorder().record(
+            "embed",
+            input_tokens=usage.get("input_tokens", sum(estimate_tokens(t) for t in texts)),
+            output_tokens=0,
+            latency_ms=(time.perf_counter() - started) * 1000,
+            error=error,
+        )
+
+    def embed(self, texts: Union[str, List[str]]) -> List[List[float]]:
+        if isinstance(texts, str):
+            texts = [texts]
+        started = time.perf_counter()
+        with provider_call() as usage:
+            try:
+                embeddings = self.inner.embed(texts)
+            except Exception:
+                self._record(usage, texts, started, error=True)
+                raise
+            self._record(usage, texts, started, error=False)
+            return embeddings
+
+    async def aembed(self, texts: Union[str, List[str]]) -> List[List[float]]:
+        if isinstance(texts, str):
+            texts = [texts]
+        started = time.perf_counter()
+        with provider_call() as usage:
+            try:
+                embeddings = await self.inner.aembed(texts)
+            except Exception:
+                self._record(usage, texts, started, error=True)
+                raise
+            self._record(usage, texts, started, error=False)
+            return embeddings
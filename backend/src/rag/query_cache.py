@@ -0,0 +1,295 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from ..core.config import get_settings
+from .embedder import Embedder, get_embedder
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form used as the cache key: case-folded, whitespace collapsed.
+    Only the key; the query is embedded as written.
+    """
+    return " ".join(query.casefold().split())
+
+
+class _Flight:
+    """
+    A single in-progress embed request that concurrent callers can wait on.
+    Ends with a result, an error, or neither when the leader was cancelled.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[List[float]] = None
+        self.error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._futures: List[tuple] = []
+
+    def set(self, result, error):
+        with self._lock:
+            self.result = result
+            self.error = error
+            self.done.set()
+            futures, self._futures = self._futures, []
+        # Async waiters may sit on other event loops than the leader's.
+        for loop, future in futures:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass  # loop already closed
+
+    def future(self) -> asyncio.Future:
+        """
+        A future of the running loop, resolved once the flight is done.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if not self.done.is_set():
+                self._futures.append((loop, future))
+                return future
+        future.set_result(None)
+        return future
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class QueryEmbeddingCache:
+    """
+    Size-bounded LRU cache with TTL for query embeddings.
+
+    Concurrent misses for the same normalized query are coalesced into a
+    single embed request (single-flight).
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        maxsize: int = 1024,
+        ttl: float = 3600.0,
+        clock=time.monotonic,
+    ):
+        self.embedder = embedder
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+
+        self._entries: "OrderedDict[str, tuple[float, List[float]]]" = OrderedDict()
+        self._inflight: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # ---------- internal helpers (call with lock held) ----------
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, embedding = entry
+        if self._clock() >= expires_at:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+
+        self._entries.move_to_end(key)
+        return embedding
+
+    def _store(self, key: str, embedding: List[float]):
+        self._entries[key] = (self._clock() + self.ttl, embedding)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # ---------- single-flight ----------
+
+    def _begin(self, key: str):
+        """
+        Returns (cached_embedding, flight, is_leader). Exactly one caller per
+        missing key becomes the leader and must call _finish.
+        """
+        with self._lock:
+            cached = self._lookup(key)
+            if cached is not None:
+                self.hits += 1
+                return cached, None, False
+
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return None, flight, False
+
+            self.misses += 1
+            flight = _Flight()
+            self._inflight[key] = flight
+            return None, flight, True
+
+    def _finish(self, key: str, flight: _Flight, embedding=None, error=None):
+        """
+        Publish the leader's outcome. Only ordinary exceptions are passed on
+        to the waiters: a cancelled or interrupted leader abandons the
+        flight, and its waiters start over (see _wait).
+        """
+        if error is not None and not isinstance(error, Exception):
+            error = None
+        with self._lock:
+            if error is None and embedding is not None:
+                self._store(key, embedding)
+            self._inflight.pop(key, None)
+        flight.set(embedding, error)
+
+    @staticmethod
+    def _outcome(flight: _Flight) -> Optional[List[float]]:
+        """
+        The flight's embedding, or None if its leader was cancelled and the
+        caller should look the key up again.
+        """
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def _wait(self, flight: _Flight) -> Optional[List[float]]:
+        flight.done.wait()
+        return self._outcome(flight)
+
+    async def _await(self, flight: _Flight) -> Optional[List[float]]:
+        await flight.future()
+        return self._outcome(flight)
+
+    # ---------- public API ----------
+
+    def get(self, query: str) -> List[float]:
+        key = normalize_query(query)
+
+        while True:
+            cached, flight, leader = self._begin(key)
+            if cached is not None:
+                return cached
+            if leader:
+                break
+            embedding = self._wait(flight)
+            if embedding is not None:
+                return embedding
+
+        try:
+            embedding = self.embedder.embed([query])[0]
+        except BaseException as e:
+            self._finish(key, flight, error=e)
+            raise
+
+        self._finish(key, flight, embedding=embedding)
+        return embedding
+
+    async def aget(self, query: str) -> List[float]:
+        """
+        Async variant of get. The leader embeds with Embedder.aembed;
+        coalesced waiters await the flight without holding a thread.
+        """
+        key = normalize_query(query)
+
+        while True:
+            cached, flight, leader = self._begin(key)
+            if cached is not None:
+                return cached
+            if leader:
+                break
+            embedding = await self._await(flight)
+            if embedding is not None:
+                return embedding
+
+        try:
+            embedding = (await self.embedder.aembed([query]))[0]
+        except BaseException as e:
+            self._finish(key, flight, error=e)
+            raise
+
+        self._finish(key, flight, embedding=embedding)
+        return embedding
+
+    async def aget_many(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed several queries at once: every miss not already in flight is
+        sent in a single Embedder.aembed call.
+        """
+        keys = [normalize_query(q) for q in queries]
+        # Queries with the same key share one embedding, of the first one.
+        texts = {}
+        for key, query in zip(keys, queries):
+            texts.setdefault(key, query)
+
+        resolved: Dict[str, List[float]] = {}
+        waiting: Dict[str, _Flight] = {}
+        leading: Dict[str, _Flight] = {}
+
+        for key in texts:
+            cached, flight, leader = self._begin(key)
+            if cached is not None:
+                resolved[key] = cached
+            elif leader:
+                leading[key] = flight
+            else:
+                waiting[key] = flight
+
+        if leading:
+            try:
+                embeddings = await self.embedder.aembed([texts[key] for key in leading])
+            except BaseException as e:
+                for key, flight in leading.items():
+                    self._finish(key, flight, error=e)
+                raise
+
+            for (key, flight), embedding in zip(leading.items(), embeddings):
+                self._finish(key, flight, embedding=embedding)
+                resolved[key] = embedding
+
+        for key, flight in waiting.items():
+            embedding = await self._await(flight)
+            resolved[key] = embedding if embedding is not None else await self.aget(texts[key])
+
+        return [resolved[key] for key in keys]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": (
+                    (self.hits + self.coalesced) / lookups if lookups else 0.0
+                ),
+            }
+
+
+@lru_cache(maxsize=1)
+def get_query_cache() -> QueryEmbeddingCache:
+    settings = get_settings()
+    return QueryEmbeddingCache(
+        get_embedder("search_query"),
+        maxsize=settings.QUERY_CACHE_SIZE,
+        ttl=settings.QUERY_CACHE_TTL,
+    )
@@ -0,0 +1,412 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from .llm import LLM
+from .tokens import estimate_tokens
+
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the provider while the circuit is open."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call (including its retries) runs past its deadline."""
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Rate limits, timeouts, connection errors and 5xx are worth retrying;
+    anything else (bad request, auth, ...) is not.
+    """
+    if isinstance(exc, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+
+    name = type(exc).__name__
+    return any(k in name for k in ("RateLimit", "Timeout", "Connection", "ServiceUnavailable"))
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """
+    The provider is up but throttling us (429 or Retry-After). This is
+    what retries absorb, so it does not count against the circuit breaker.
+    """
+    if _status_code(exc) == 429 or retry_after(exc) is not None:
+        return True
+    return "RateLimit" in type(exc).__name__
+
+
+def trips_breaker(exc: BaseException) -> bool:
+    return is_retryable(exc) and not is_rate_limited(exc)
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds requested by the provider's Retry-After header, if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `rate` tokens are added per second up to
+    `capacity`; callers wait until enough tokens are available.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waits = 0
+
+    def _reserve(self, amount: float) -> float:
+        """
+        Take `amount` tokens (possibly going negative) and return how long
+        the caller has to wait before it may proceed.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            self.waits += 1
+            return -self._tokens / self.rate
+
+    def acquire(self, amount: float = 1.0):
+        delay = self._reserve(amount)
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self, amount: float = 1.0):
+        delay = self._reserve(amount)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failed calls and rejects
+    calls for `reset_timeout` seconds, then lets a single trial call through:
+    its outcome closes or re-opens the circuit, and other calls are rejected
+    while it is in flight.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+        self.opens = 0
+
+    def before_call(self) -> bool:
+        """
+        Admit a call or raise CircuitOpenError. Returns True if the call is
+        the half-open trial.
+        """
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError("LLM provider circuit is open")
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._trial:
+                    raise CircuitOpenError("LLM provider circuit is half-open, trial call in flight")
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial = False
+            self.state = "closed"
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opens += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def release_trial(self):
+        """
+        The trial call ended without an outcome (cancelled): admit another.
+        """
+        with self._lock:
+            self._trial = False
+
+
+class ResilientLLM(LLM):
+    """
+    Wraps a provider LLM with a shared request/token rate limiter, retries
+    with jittered exponential backoff, per-call deadlines and a circuit
+    breaker. Used by both ingestion and the query path.
+    """
+
+    def __init__(
+        self,
+        inner: LLM,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        call_timeout: float = 60.0,
+        requests_per_minute: Optional[float] = 30,
+        tokens_per_minute: Optional[float] = 8000,
+        expected_output_tokens: int = 300,
+        breaker: CircuitBreaker = None,
+    ):
+        self.inner = inner
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.call_timeout = call_timeout
+        self.expected_output_tokens = expected_output_tokens
+
+        # None disables the corresponding limit
+        self.request_bucket = (
+            TokenBucket(requests_per_minute / 60.0, max(requests_per_minute / 10.0, 1.0))
+            if requests_per_minute is not None else None
+        )
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+            if tokens_per_minute is not None else None
+        )
+        self.breaker = breaker or CircuitBreaker()
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.deadline_exceeded = 0
+
+    # ---------- helpers ----------
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _cost(self, payload) -> int:
+        if isinstance(payload, str):
+            text = payload
+        else:
+            text = "".join(m.get("content", "") for m in payload)
+        return estimate_tokens(text) + self.expected_output_tokens
+
+    def _throttle(self, payload):
+        if self.request_bucket is not None:
+            self.request_bucket.acquire()
+        if self.token_bucket is not None:
+            self.token_bucket.acquire(self._cost(payload))
+
+    async def _athrottle(self, payload):
+        if self.request_bucket is not None:
+            await self.request_bucket.aacquire()
+        if self.token_bucket is not None:
+            await self.token_bucket.aacquire(self._cost(payload))
+
+    def _next_delay(self, exc: BaseException, attempt: int, deadline: float) -> Optional[float]:
+        """
+        Delay before the next attempt, or None if the error should propagate.
+        """
+        if not is_retryable(exc) or attempt >= self.max_retries:
+            return None
+        delay = retry_after(exc)
+        if delay is None:
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _record_outcome(self, exc: BaseException = None):
+        """
+        Feed the breaker once per call, not per attempt. Only provider
+        failures count; a rate limit or a rejected request means the
+        provider answered.
+        """
+        if exc is not None and trips_breaker(exc):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _call(self, fn, payload):
+        deadline = time.monotonic() + self.call_timeout * (self.max_retries + 1)
+        attempt = 0
+        self._count("calls")
+        trial = self.breaker.before_call()
+
+        try:
+            while True:
+                self._throttle(payload)
+
+                try:
+                    result = fn(payload)
+                except Exception as e:
+                    delay = self._next_delay(e, attempt, deadline)
+                    if delay is None:
+                        self._count("failures")
+                        self._record_outcome(e)
+                        trial = False
+                        raise
+                    self._count("retries")
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+
+                self._record_outcome()
+                trial = False
+                self._count("successes")
+                return result
+        finally:
+            if trial:
+                self.breaker.release_trial()
+
+    async def _acall(self, fn, payload):
+        deadline = time.monotonic() + self.call_timeout * (self.max_retries + 1)
+        attempt = 0
+        self._count("calls")
+        trial = self.breaker.before_call()
+
+        try:
+            while True:
+                await self._athrottle(payload)
+
+                timeout = min(self.call_timeout, max(deadline - time.monotonic(), 0.0))
+                try:
+                    result = await asyncio.wait_for(fn(payload), timeout=timeout)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        self._count("deadline_exceeded")
+                    delay = self._next_delay(e, attempt, deadline)
+                    if delay is None:
+                        self._count("failures")
+                        self._record_outcome(e)
+                        trial = False
+                        if isinstance(e, asyncio.TimeoutError):
+                            raise DeadlineExceeded("LLM call exceeded its deadline") from e
+                        raise
+                    self._count("retries")
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+
+                self._record_outcome()
+                trial = False
+                self._count("successes")
+                return result
+        finally:
+            if trial:
+                self.breaker.release_trial()
+
+    # ---------- LLM interface ----------
+
+    def generate(self, prompt: str) -> str:
+        return self._call(self.inner.generate, prompt)
+
+    def chat(self, messages: List[Dict[str, str]]) -> str:
+        return self._call(self.inner.chat, messages)
+
+    def generate_json_text(self, prompt: str) -> str:
+        return self._call(self.inner.generate_json_text, prompt)
+
+    async def agenerate(self, prompt: str) -> str:
+        return await self._acall(self.inner.agenerate, prompt)
+
+    async def achat(self, messages: List[Dict[str, str]]) -> str:
+        return await self._acall(self.inner.achat, messages)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """
+        Retries are only possible until the first chunk has been yielded.
+        """
+        deadline = time.monotonic() + self.call_timeout * (self.max_retries + 1)
+        attempt = 0
+        self._count("calls")
+        trial = self.breaker.before_call()
+
+        try:
+            while True:
+                self._throttle(prompt)
+
+                started = False
+                try:
+                    for chunk in self.inner.stream(prompt):
+                        started = True
+                        yield chunk
+                except Exception as e:
+                    delay = None if started else self._next_delay(e, attempt, deadline)
+                    if delay is None:
+                        self._count("failures")
+                        self._record_outcome(e)
+                        trial = False
+                        raise
+                    self._count("retries")
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+
+                self._record_outcome()
+                trial = False
+                self._count("successes")
+                return
+        finally:
+            # Also reached when the consumer stops reading early.
+            if trial:
+                self.breaker.release_trial()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "successes": self.successes,
+                "failures": self.failures,
+                "retries": self.retries,
+                "deadline_exceeded": self.deadline_exceeded,
+                "rate_limited_waits": sum(
+                    bucket.waits
+                    for bucket in (self.request_bucket, self.token_bucket)
+                    if bucket is not None
+                ),
+                "circuit_state": self.breaker.state,
+                "circuit_opens": self.breaker.opens,
+            }
@@ -1,8 +1,14 @@
-from typing import List, Dict
-from .embedder import get_embedder
-import json
+import asyncio
+import time
+from typing import List, Dict, Iterator, Tuple
+from .query_cache import get_query_cache, normalize_query
+from .lexical_index import get_lexical_index, reciprocal_rank_fusion
+from .graph_expansion import expand_with_neighbors
+from ..core.config import get_settings
+from ..core.executor import run_blocking
+from .context_packing import pack_blocks
+from .tokens import estimate_tokens
 from pathlib import Path
-from typing import List, Dict
 
 
 ENTRYPOINT_KEYWORDS = {
@@ -19,117 +25,77 @@ def is_entrypoint_query(query: str) -> bool:
 def build_rag_context(
     retrieved: List[Dict],
     prefer_entrypoints: bool,
-    max_files: int = 4,
-    max_dirs: int = 2,
+    token_budget: int = None,
 ) -> str:
+    settings = get_settings()
+    if token_budget is None:
+        token_budget = settings.CONTEXT_TOKEN_BUDGET
 
-    entrypoints = []
-    files = []
-    dirs = []
-    repos = []
-
-    for item in retrieved:
-        meta = item["metadata"]
-        node_type = meta.get("type")
-
-        if node_type == "file" and meta.get("role") == "entrypoint":
-            entrypoints.append(item)
-        elif node_type == "file":
-            files.append(item)
-        elif node_type == "dir":
-            dirs.append(item)
-        elif node_type == "repo":
-            repos.append(item)
-
-    blocks = []
-
-    # ---------- Repos ----------
-    for r in repos[:1]:
-        blocks.append(
-            f"""
-REPOSITORY:
-{Path(r['path'])}
-
-Purpose:
-{r['metadata'].get('short', '')}
-""".strip()
-        )
+    entrypoints = [
+        item for item in retrieved
+        if item["metadata"].get("type") == "file"
+        and item["metadata"].get("role") == "entrypoint"
+    ]
+
+    header = []
 
     # ---------- Entrypoints ----------
     if prefer_entrypoints:
         if entrypoints:
-            blocks.append(
+            header.append(
                 "ENTRYPOINTS:\n" + "\n".join(
                     f"- {Path(ep['path'])}: {ep['metadata'].get('short', '')}"
                     for ep in entrypoints[:3]
                 )
             )
         else:
-            blocks.append(
+            header.append(
                 "ENTRYPOINTS:\n- (No explicit entrypoints detected in retrieved context)"
             )
 
-    # ---------- Files ----------
-    for f in files[:max_files]:
-        meta = f["metadata"]
-
-        http_calls = []
-        try:
-            http_calls = json.loads(meta.get("http_calls", "[]"))
-        except Exception:
-            pass
-
-        http_block = ""
-        if http_calls:
-            http_block = "\nHTTP Calls:\n" + "\n".join(
-                f"- {c.get('method', '').upper()} {c.get('url', '')}"
-                for c in http_calls[:2]
-            )
+    remaining = token_budget - sum(estimate_tokens(b) for b in header)
+    packed = pack_blocks(retrieved, max(remaining, 0), rrf_k=settings.RRF_K)
 
-        blocks.append(
-            f"""
-FILE: {Path(f['path'])}
-Purpose: {meta.get('short', '')}
+    # Keep the familiar layout: repos, then the entrypoint list, files, dirs.
+    order = {"repo": 0, "file": 1, "dir": 2}
+    packed.sort(key=lambda item: order.get(item["metadata"].get("type"), 3))
 
-Details:
-{f['document'][:800]}
-{http_block}
-""".strip()
-        )
+    repo_blocks = [i["context_block"] for i in packed if i["metadata"].get("type") == "repo"]
+    other_blocks = [i["context_block"] for i in packed if i["metadata"].get("type") != "repo"]
 
-    # ---------- Directories ----------
-    for d in dirs[:max_dirs]:
-        blocks.append(
-            f"""
-DIRECTORY: {Path(d['path'])}
-Purpose: {d['metadata'].get('short', '')}
-""".strip()
-        )
-
-    return "\n\n".join(blocks)
+    return "\n\n".join(repo_blocks + header + other_blocks)
 
 
 class ChromaRetriever:
-    def __init__(self, collection, top_k: int = 8):
+    def __init__(self, collection, top_k: int = 8, expand_neighbors: bool = None):
         self.collection = collection
         self.top_k = top_k
-        self.embedder = get_embedder('search_query')
+        if expand_neighbors is None:
+            expand_neighbors = get_settings().GRAPH_EXPANSION
+        self.expand_neighbors = expand_neighbors
+        self.query_cache = get_query_cache()
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.query_cache.get(query)
 
-    def retrieve(self, query: str) -> List[Dict]:
+    def retrieve(self, query: str, query_embedding: List[float] = None) -> List[Dict]:
         """
         Returns a list of retrieved nodes:
         [
           {
+            "id": "...",
             "type": "file" | "dir" | "repo",
             "path": "...",
             "document": "...",
             "metadata": {...},
-            "score": float
+            "score": float | None,   # vector distance, None for lexical-only hits
+            "rank_score": float      # fused relevance, higher is better
           }
         ]
         """
 
-        query_embedding = self.embedder.embed([query])[0]
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
 
         results = self.collection.query(
             query_embeddings=[query_embedding],
@@ -137,42 +103,164 @@ class ChromaRetriever:
             include=["documents", "metadatas", "distances"],
         )
 
-        items = []
-        for doc, meta, dist in zip(
-            results["documents"][0],
-            results["metadatas"][0],
-            results["distances"][0],
+        return self._expand(self._fuse(query, results))
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return await self.query_cache.aget(query)
+
+    async def aretrieve(self, query: str, query_embedding: List[float] = None) -> List[Dict]:
+        """
+        Async variant of retrieve: the embedding goes through the async
+        client and the blocking store calls run on the bounded pool.
+        """
+        if query_embedding is None:
+            query_embedding = await self.aembed_query(query)
+
+        results = await run_blocking(
+            self.collection.query,
+            query_embeddings=[query_embedding],
+            n_results=self.top_k,
+            include=["documents", "metadatas", "distances"],
+        )
+
+        items = await run_blocking(self._fuse, query, results)
+        return await run_blocking(self._expand, items)
+
+    async def aretrieve_many(
+        self,
+        queries: List[str],
+        query_embeddings: List[List[float]],
+    ) -> List[List[Dict]]:
+        """
+        Retrieve for several queries with a single multi-query Chroma call.
+        """
+        if not queries:
+            return []
+
+        results = await run_blocking(
+            self.collection.query,
+            query_embeddings=query_embeddings,
+            n_results=self.top_k,
+            include=["documents", "metadatas", "distances"],
+        )
+
+        def fuse_all():
+            return [
+                self._expand(self._fuse(query, results, i))
+                for i, query in enumerate(queries)
+            ]
+
+        return await run_blocking(fuse_all)
+
+    def lexical_retrieve(self, query: str) -> List[Dict]:
+        """
+        BM25-only retrieval from the local index, without an embedding call.
+        Used when the embedding provider is too slow to answer in time.
+        """
+        lexical = get_lexical_index(self.collection.name)
+        if lexical is None:
+            return []
+
+        rrf_k = get_settings().RRF_K
+        ranking = [doc_id for doc_id, _ in lexical.search(query, self.top_k)]
+        if not ranking:
+            return []
+
+        found = self.collection.get(ids=ranking, include=["documents", "metadatas"])
+        items = {
+            doc_id: _make_item(doc_id, doc, meta, None)
+            for doc_id, doc, meta in zip(found["ids"], found["documents"], found["metadatas"])
+        }
+
+        retrieved = []
+        for rank, doc_id in enumerate(ranking, start=1):
+            item = items.get(doc_id)
+            if item is None:
+                continue
+            item["rank_score"] = 1.0 / (rrf_k + rank)
+            retrieved.append(item)
+        return retrieved
+
+    def _fuse(self, query: str, results: Dict, i: int = 0) -> List[Dict]:
+        """
+        Turn the i-th result set of a Chroma query into retrieved nodes,
+        fused with BM25 hits by reciprocal rank when hybrid retrieval is on.
+        """
+        items = {}
+        for doc_id, doc, meta, dist in zip(
+            results["ids"][i],
+            results["documents"][i],
+            results["metadatas"][i],
+            results["distances"][i],
         ):
-            items.append({
-                "type": meta.get("type"),
-                "path": meta.get("path"),
-                "document": doc,
-                "metadata": meta,
-                "score": float(dist),
-            })
+            items[doc_id] = _make_item(doc_id, doc, meta, float(dist))
 
-        return items
+        vector_ranking = list(items)
 
+        settings = get_settings()
+        lexical = get_lexical_index(self.collection.name) if settings.HYBRID_RETRIEVAL else None
+        if lexical is None:
+            for rank, doc_id in enumerate(vector_ranking, start=1):
+                items[doc_id]["rank_score"] = 1.0 / (settings.RRF_K + rank)
+            return list(items.values())
 
-from .llm import get_llm
+        lexical_ranking = [
+            doc_id for doc_id, _ in lexical.search(query, settings.LEXICAL_TOP_K)
+        ]
+        fused = reciprocal_rank_fusion(
+            [vector_ranking, lexical_ranking],
+            k=settings.RRF_K,
+        )[: self.top_k]
+
+        # Lexical-only hits are fetched from the local store by id.
+        missing = [doc_id for doc_id, _ in fused if doc_id not in items]
+        if missing:
+            extra = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, doc, meta in zip(extra["ids"], extra["documents"], extra["metadatas"]):
+                items[doc_id] = _make_item(doc_id, doc, meta, None)
+
+        retrieved = []
+        for doc_id, rank_score in fused:
+            item = items.get(doc_id)
+            if item is None:
+                continue
+            item["rank_score"] = rank_score
+            retrieved.append(item)
+
+        return retrieved
+
+    def _expand(self, items: List[Dict]) -> List[Dict]:
+        if not self.expand_neighbors:
+            return items
+        settings = get_settings()
+        return expand_with_neighbors(
+            self.collection,
+            items,
+            max_neighbors=settings.GRAPH_EXPANSION_MAX,
+            decay=settings.GRAPH_EXPANSION_DECAY,
+        )
 
 
-def answer_with_rag(
-    collection,
-    question: str,
-    top_k: int = 8,
-) -> str:
-    retriever = ChromaRetriever(collection, top_k=top_k)
-    llm = get_llm()
+def _make_item(doc_id: str, doc: str, meta: Dict, dist) -> Dict:
+    return {
+        "id": doc_id,
+        "type": meta.get("type"),
+        "path": meta.get("path"),
+        "document": doc,
+        "metadata": meta,
+        "score": dist,
+    }
 
-    retrieved = retriever.retrieve(question)
-    print("RETRIEVED NODES:")
-    for r in retrieved:
-        print(r["metadata"].get("type"), r["metadata"].get("role"), r["path"])
 
-    if not retrieved:
-        return "I could not find relevant information in the codebase."
+from .llm import get_llm
+from .answer_cache import answer_scope, get_answer_cache
+from ..core.index_state import get_index_generation
+
+
+NO_CONTEXT_ANSWER = "I could not find relevant information in the codebase."
+
 
+def build_rag_prompt(question: str, retrieved: List[Dict]) -> str:
     prefer_entrypoints = is_entrypoint_query(question)
 
     context = build_rag_context(
@@ -180,7 +268,7 @@ def answer_with_rag(
         prefer_entrypoints=prefer_entrypoints,
     )
 
-    prompt = f"""
+    return f"""
 You are a senior software engineer helping a developer understand a codebase.
 
 The following context was retrieved from the repository.
@@ -201,7 +289,230 @@ INSTRUCTIONS:
 
 ANSWER:
 """
+
+
+def describe_sources(retrieved: List[Dict]) -> List[Dict]:
+    """
+    Compact view of the retrieved nodes, sent to clients ahead of the answer.
+    """
+    return [
+        {
+            "id": r.get("id"),
+            "type": r["metadata"].get("type"),
+            "role": r["metadata"].get("role"),
+            "path": r["path"],
+            "short": r["metadata"].get("short", ""),
+            "rank_score": r.get("rank_score"),
+        }
+        for r in retrieved
+    ]
+
+
+def answer_with_rag(
+    collection,
+    question: str,
+    top_k: int = 8,
+) -> str:
+    retriever = ChromaRetriever(collection, top_k=top_k)
+    llm = get_llm()
+    answer_cache = get_answer_cache()
+    scope = answer_scope(collection)
+
+    query_embedding = retriever.embed_query(question)
+    generation = get_index_generation()
+
+    cached = answer_cache.lookup(query_embedding, generation, scope)
+    if cached is not None:
+        return cached
+
+    retrieved = retriever.retrieve(question, query_embedding=query_embedding)
+    print("RETRIEVED NODES:")
+    for r in retrieved:
+        print(r["metadata"].get("type"), r["metadata"].get("role"), r["path"])
+
+    if not retrieved:
+        return NO_CONTEXT_ANSWER
+
+    prompt = build_rag_prompt(question, retrieved)
     print(prompt)
 
-    return llm.generate(prompt)
+    answer = llm.generate(prompt)
+    answer_cache.store(query_embedding, answer, generation, scope)
+
+    return answer
+
+
+async def answer_with_rag_async(
+    collection,
+    question: str,
+    top_k: int = 8,
+) -> str:
+    """
+    Async variant of answer_with_rag that never blocks the event loop.
+    """
+    retriever = ChromaRetriever(collection, top_k=top_k)
+    llm = get_llm()
+    answer_cache = get_answer_cache()
+    scope = answer_scope(collection)
+
+    query_embedding = await retriever.aembed_query(question)
+    generation = get_index_generation()
+
+    cached = answer_cache.lookup(query_embedding, generation, scope)
+    if cached is not None:
+        return cached
+
+    retrieved = await retriever.aretrieve(question, query_embedding=query_embedding)
+
+    if not retrieved:
+        return NO_CONTEXT_ANSWER
+
+    prompt = build_rag_prompt(question, retrieved)
+
+    answer = await llm.agenerate(prompt)
+    answer_cache.store(query_embedding, answer, generation, scope)
+
+    return answer
+
+
+async def answer_batch_with_rag(
+    collection,
+    questions: List[str],
+    top_k: int = 8,
+    concurrency: int = None,
+) -> Dict:
+    """
+    Answer many questions at once: one embed call for all questions, one
+    multi-query retrieval, then LLM generations run concurrently under a cap.
+    Questions that are the same after normalize_query are answered once.
+    """
+    if concurrency is None:
+        concurrency = get_settings().BATCH_LLM_CONCURRENCY
+
+    retriever = ChromaRetriever(collection, top_k=top_k)
+    llm = get_llm()
+    answer_cache = get_answer_cache()
+    scope = answer_scope(collection)
+    generation = get_index_generation()
+
+    started = time.perf_counter()
+
+    query_embeddings = await retriever.query_cache.aget_many(questions)
+    embedded = time.perf_counter()
+
+    results: List[Dict] = [None] * len(questions)
+    # normalized question -> indices of the uncached questions asking it
+    pending: Dict[str, List[int]] = {}
+    for i, (question, embedding) in enumerate(zip(questions, query_embeddings)):
+        cached = answer_cache.lookup(embedding, generation, scope)
+        if cached is not None:
+            results[i] = {
+                "question": question,
+                "status": "success",
+                "answer": cached,
+                "cached": True,
+                "generation_ms": 0.0,
+            }
+        else:
+            pending.setdefault(normalize_query(question), []).append(i)
+
+    groups = list(pending.values())
+    retrieved_sets = await retriever.aretrieve_many(
+        [questions[indices[0]] for indices in groups],
+        [query_embeddings[indices[0]] for indices in groups],
+    )
+    retrieved_at = time.perf_counter()
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def generate(indices: List[int], retrieved: List[Dict]):
+        i = indices[0]
+        question = questions[i]
+        t0 = time.perf_counter()
+        result = None
+
+        if not retrieved:
+            answer = NO_CONTEXT_ANSWER
+        else:
+            async with semaphore:
+                try:
+                    answer = await llm.agenerate(build_rag_prompt(question, retrieved))
+                except Exception as e:
+                    result = {
+                        "status": "error",
+                        "detail": str(e),
+                        "generation_ms": (time.perf_counter() - t0) * 1000,
+                    }
+            if result is None:
+                answer_cache.store(query_embeddings[i], answer, generation, scope)
+
+        if result is None:
+            result = {
+                "status": "success",
+                "answer": answer,
+                "cached": False,
+                "sources": describe_sources(retrieved),
+                "generation_ms": (time.perf_counter() - t0) * 1000,
+            }
+        for j in indices:
+            results[j] = {"question": questions[j], **result}
+
+    await asyncio.gather(*(
+        generate(indices, retrieved) for indices, retrieved in zip(groups, retrieved_sets)
+    ))
+
+    finished = time.perf_counter()
+
+    return {
+        "results": results,
+        "timing": {
+            "embedding_ms": (embedded - started) * 1000,
+            "retrieval_ms": (retrieved_at - embedded) * 1000,
+            "generation_ms": (finished - retrieved_at) * 1000,
+            "total_ms": (finished - started) * 1000,
+        },
+    }
+
+
+def stream_answer_with_rag(
+    collection,
+    question: str,
+    top_k: int = 8,
+) -> Iterator[Tuple[str, object]]:
+    """
+    Streaming variant of answer_with_rag. Yields (event, data) pairs:
+    one "sources" event as soon as retrieval is done, then "token" events
+    as the LLM produces them, then a final "done" event.
+    """
+    retriever = ChromaRetriever(collection, top_k=top_k)
+    llm = get_llm()
+    answer_cache = get_answer_cache()
+    scope = answer_scope(collection)
+
+    query_embedding = retriever.embed_query(question)
+    generation = get_index_generation()
+
+    cached = answer_cache.lookup(query_embedding, generation, scope)
+    if cached is not None:
+        yield "sources", []
+        yield "token", cached
+        yield "done", {"cached": True}
+        return
+
+    retrieved = retriever.retrieve(question, query_embedding=query_embedding)
+    yield "sources", describe_sources(retrieved)
+
+    if not retrieved:
+        yield "token", NO_CONTEXT_ANSWER
+        yield "done", {"cached": False}
+        return
+
+    prompt = build_rag_prompt(question, retrieved)
+
+    parts = []
+    for token in llm.stream(prompt):
+        parts.append(token)
+        yield "token", token
 
+    answer_cache.store(query_embedding, "".join(parts), generation, scope)
+    yield "done", {"cached": False}
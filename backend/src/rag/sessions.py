@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ..core.config import get_settings
+from ..core.index_state import get_index_generation
+from .llm import get_llm
+from .retriever import ChromaRetriever, build_rag_context, is_entrypoint_query, NO_CONTEXT_ANSWER
+from .tokens import estimate_tokens
+
+
+def build_chat_system_prompt(context: str) -> str:
+    return f"""
+You are a senior software engineer helping a developer understand a codebase.
+This is a multi-turn conversation; follow-up questions refer to earlier turns.
+
+The following context was retrieved from the repository.
+It includes file purposes, architecture summaries, and known interactions.
+
+CONTEXT:
+{context}
+
+INSTRUCTIONS:
+- Answer strictly based on the provided context and the conversation so far.
+- If information is missing, say so explicitly.
+- When relevant, explain execution flow and entrypoints.
+- Be concise but precise.
+- Do NOT invent APIs, functions, or behavior.
+""".strip()
+
+
+def _cosine(a, b) -> float:
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(a @ b) / denom if denom else 0.0
+
+
+class ChatSession:
+    """
+    One conversation: rolling history plus the nodes retrieved for it.
+    The retrieved context is reused until a follow-up drifts away from the
+    question it was retrieved for, or the index it came from changes.
+    """
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.history: List[Dict[str, str]] = []
+        self.retrieved: Optional[List[Dict]] = None
+        self.context: str = ""
+        self.anchor_embedding = None
+        # Index generation the retrieved context was read from.
+        self.generation: Optional[int] = None
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def trim_history(self, token_budget: int):
+        """
+        Drop the oldest turns (user + assistant pairs) until the history fits.
+        """
+        while self.history and sum(
+            estimate_tokens(m["content"]) for m in self.history
+        ) > token_budget:
+            del self.history[:2]
+
+
+class SessionStore:
+    """
+    In-process session registry with idle expiry and an upper bound on the
+    number of live sessions (least recently used are dropped first).
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 1800.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used < self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+
+    def get_or_create(self, session_id: Optional[str] = None) -> ChatSession:
+        with self._lock:
+            self._expire()
+
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = ChatSession(session_id or uuid.uuid4().hex)
+                self._sessions[session.id] = session
+
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session.id)
+            self._expire()
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+@lru_cache(maxsize=1)
+def get_session_store() -> SessionStore:
+    settings = get_settings()
+    return SessionStore(
+        max_sessions=settings.CHAT_MAX_SESSIONS,
+        ttl=settings.CHAT_SESSION_TTL,
+    )
+
+
+async def chat_with_rag(
+    collection,
+    session: ChatSession,
+    question: str,
+    top_k: int = 8,
+) -> Dict:
+    """
+    Answer a follow-up within a session via LLM.chat.
+
+    Retrieval runs on the first turn, after the index generation changes,
+    and when the new question's embedding falls below CHAT_DRIFT_THRESHOLD
+    similarity to the question the current context was retrieved for.
+    """
+    settings = get_settings()
+    retriever = ChromaRetriever(collection, top_k=top_k)
+    llm = get_llm()
+
+    async with session.lock:
+        query_embedding = await retriever.aembed_query(question)
+        generation = get_index_generation()
+
+        drifted = (
+            session.retrieved is None
+            or session.generation != generation
+            or _cosine(query_embedding, session.anchor_embedding) < settings.CHAT_DRIFT_THRESHOLD
+        )
+
+        if drifted:
+            session.retrieved = await retriever.aretrieve(question, query_embedding=query_embedding)
+            session.context = build_rag_context(
+                session.retrieved,
+                prefer_entrypoints=is_entrypoint_query(question),
+            )
+            session.anchor_embedding = query_embedding
+            session.generation = generation
+
+        if not session.retrieved:
+            answer = NO_CONTEXT_ANSWER
+        else:
+            session.trim_history(settings.CHAT_HISTORY_TOKEN_BUDGET)
+            messages = (
+                [{"role": "system", "content": build_chat_system_prompt(session.context)}]
+                + session.history
+                + [{"role": "user", "content": question}]
+            )
+            answer = await llm.achat(messages)
+
+        session.history.append({"role": "user", "content": question})
+        session.history.append({"role": "assistant", "content": answer})
+        session.trim_history(settings.CHAT_HISTORY_TOKEN_BUDGET)
+
+        return {
+            "session_id": session.id,
+            "answer": answer,
+            "retrieved": drifted,
+        }
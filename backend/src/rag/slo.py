@@ -0,0 +1,212 @@
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..core.config import get_settings
+from ..core.executor import run_blocking
+from ..core.index_state import get_index_generation
+from .answer_cache import answer_scope, get_answer_cache
+from .llm import LLM, get_llm, get_secondary_llm
+from .retriever import ChromaRetriever, NO_CONTEXT_ANSWER, build_rag_prompt
+
+
+DEGRADED_HEADER = (
+    "The answer could not be generated in time. "
+    "These parts of the codebase look most relevant:"
+)
+
+
+_lock = threading.Lock()
+_stats = {
+    "requests": 0,
+    "cache_hits": 0,
+    "lexical_fallbacks": 0,
+    "hedged": 0,
+    "secondary_wins": 0,
+    "degraded": 0,
+}
+
+
+def _count(field: str):
+    with _lock:
+        _stats[field] += 1
+
+
+def slo_stats() -> Dict:
+    with _lock:
+        return dict(_stats)
+
+
+def build_degraded_answer(retrieved: List[Dict], max_sources: int = 5) -> str:
+    """
+    Answer built from the stored node summaries only, without generation.
+    """
+    if not retrieved:
+        return NO_CONTEXT_ANSWER
+
+    lines = []
+    for item in retrieved[:max_sources]:
+        meta = item["metadata"]
+        short = meta.get("short") or ""
+        line = f"- {item['path']} ({meta.get('type')})"
+        lines.append(f"{line}: {short}" if short else line)
+
+    return DEGRADED_HEADER + "\n" + "\n".join(lines)
+
+
+async def hedged_generate(
+    prompt: str,
+    primary: LLM,
+    secondary: Optional[LLM],
+    hedge_delay: float,
+) -> Tuple[str, str]:
+    """
+    Start the primary generation; if it has not finished after `hedge_delay`
+    seconds, or fails, race it against the secondary model. The first
+    successful answer wins and the other call is cancelled.
+
+    Returns (answer, "primary" | "secondary").
+    """
+    tasks = {asyncio.ensure_future(primary.agenerate(prompt)): "primary"}
+    pending = set(tasks)
+    hedged = secondary is None
+    error = None
+
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=None if hedged else hedge_delay,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), tasks[task]
+                error = task.exception()
+
+            if not hedged:
+                hedged = True
+                _count("hedged")
+                task = asyncio.ensure_future(secondary.agenerate(prompt))
+                tasks[task] = "secondary"
+                pending.add(task)
+
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def answer_with_deadline(
+    collection,
+    question: str,
+    top_k: int = 8,
+    deadline: float = None,
+) -> Dict:
+    """
+    Answer within `deadline` seconds covering embedding, retrieval and
+    generation:
+    - a slow embedding falls back to BM25-only retrieval
+    - a slow generation is hedged to the secondary model
+    - if time still runs out, the answer is built from the retrieved
+      nodes' short summaries and marked as degraded
+    """
+    settings = get_settings()
+    if deadline is None:
+        deadline = settings.ASK_DEADLINE
+    if not deadline:
+        raise ValueError("No deadline given and ASK_DEADLINE is not set")
+
+    started = time.monotonic()
+
+    def remaining() -> float:
+        return max(deadline - (time.monotonic() - started), 0.0)
+
+    def result(answer: str, degraded: bool, retrieval: str, model: str = None) -> Dict:
+        if degraded:
+            _count("degraded")
+        return {
+            "answer": answer,
+            "degraded": degraded,
+            "retrieval": retrieval,
+            "model": model,
+            "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+
+    _count("requests")
+    retriever = ChromaRetriever(collection, top_k=top_k)
+    answer_cache = get_answer_cache()
+    scope = answer_scope(collection)
+    generation = get_index_generation()
+
+    # ---------- Retrieval ----------
+    query_embedding = None
+    retrieved = None
+    try:
+        query_embedding = await asyncio.wait_for(
+            retriever.aembed_query(question),
+            timeout=deadline * settings.ASK_RETRIEVAL_SHARE,
+        )
+    except asyncio.CancelledError:
+        # Our own cancellation propagates; one that comes out of the
+        # embedding step (a cancelled call it was waiting on) is a failure.
+        if asyncio.current_task().cancelling():
+            raise
+        print("Query embedding was cancelled, using lexical retrieval")
+    except Exception as e:
+        print(f"Query embedding failed ({type(e).__name__}), using lexical retrieval")
+
+    if query_embedding is not None:
+        cached = answer_cache.lookup(query_embedding, generation, scope)
+        if cached is not None:
+            _count("cache_hits")
+            return result(cached, False, "cache")
+
+        try:
+            retrieved = await asyncio.wait_for(
+                retriever.aretrieve(question, query_embedding=query_embedding),
+                timeout=remaining(),
+            )
+        except asyncio.TimeoutError:
+            print("Vector retrieval exceeded the deadline, using lexical retrieval")
+
+    retrieval = "hybrid" if settings.HYBRID_RETRIEVAL else "vector"
+    if retrieved is None:
+        retrieval = "lexical"
+        _count("lexical_fallbacks")
+        try:
+            retrieved = await asyncio.wait_for(
+                run_blocking(retriever.lexical_retrieve, question),
+                timeout=remaining(),
+            )
+        except asyncio.TimeoutError:
+            return result(NO_CONTEXT_ANSWER, True, retrieval)
+
+    if not retrieved:
+        return result(NO_CONTEXT_ANSWER, False, retrieval)
+
+    # ---------- Generation ----------
+    prompt = build_rag_prompt(question, retrieved)
+    try:
+        answer, model = await asyncio.wait_for(
+            hedged_generate(prompt, get_llm(), get_secondary_llm(), settings.ASK_HEDGE_DELAY),
+            timeout=remaining(),
+        )
+    except Exception as e:
+        print(f"Generation failed ({type(e).__name__}), returning a degraded answer")
+        return result(
+            build_degraded_answer(retrieved, settings.DEGRADED_MAX_SOURCES),
+            True,
+            retrieval,
+        )
+
+    if model == "secondary":
+        _count("secondary_wins")
+        scope = answer_scope(collection, settings.GROQ_SECONDARY_MODEL)
+    if query_embedding is not None:
+        answer_cache.store(query_embedding, answer, generation, scope)
+
+    return result(answer, False, retrieval, model)
@@ -0,0 +1,118 @@
+import json
+import re
+from typing import Any
+
+
+DESCRIPTION_SCHEMA = {
+    "short": str,
+    "detailed": str,
+}
+
+PACKED_DESCRIPTION_SCHEMA = {
+    "files": [
+        {
+            "path": str,
+            "short": str,
+            "detailed": str,
+        }
+    ],
+}
+
+
+class StructuredOutputError(ValueError):
+    """
+    The model output could not be parsed or did not match the schema.
+    `failed_generation` holds the raw output when a provider rejected it
+    before returning it, so it can still be repaired.
+    """
+
+    def __init__(self, message: str, failed_generation: str = None):
+        super().__init__(message)
+        self.failed_generation = failed_generation
+
+
+def validate(value: Any, schema: Any, where: str = "$"):
+    """
+    Check a parsed value against a minimal schema:
+    - a type (str, int, ...) must match with isinstance
+    - a dict maps required keys to sub-schemas (extra keys are allowed)
+    - a one-element list means "list of items matching that element"
+    """
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            raise StructuredOutputError(f"{where}: expected an object")
+        for key, sub in schema.items():
+            if key not in value:
+                raise StructuredOutputError(f"{where}: missing field '{key}'")
+            validate(value[key], sub, f"{where}.{key}")
+    elif isinstance(schema, list):
+        if not isinstance(value, list):
+            raise StructuredOutputError(f"{where}: expected an array")
+        for i, item in enumerate(value):
+            validate(item, schema[0], f"{where}[{i}]")
+    elif not isinstance(value, schema):
+        raise StructuredOutputError(f"{where}: expected {schema.__name__}")
+
+
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def _try_load(text: str):
+    try:
+        return True, json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return False, None
+
+
+def repair_json(text: str) -> Any:
+    """
+    Parse near-JSON model output without another LLM call: strips markdown
+    fences and surrounding prose, trailing commas and typographic quotes.
+    Raises StructuredOutputError if nothing parses.
+    """
+    text = (text or "").strip()
+
+    ok, value = _try_load(text)
+    if ok:
+        return value
+
+    text = _FENCE_RE.sub("", text).strip()
+    ok, value = _try_load(text)
+    if ok:
+        return value
+
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if starts:
+        start = min(starts)
+        end = max(text.rfind("}"), text.rfind("]"))
+        if end > start:
+            text = text[start:end + 1]
+
+    for candidate in (
+        text,
+        _TRAILING_COMMA_RE.sub(r"\1", text),
+        _TRAILING_COMMA_RE.sub(r"\1", text.replace("“", '"').replace("”", '"')),
+    ):
+        ok, value = _try_load(candidate)
+        if ok:
+            return value
+
+    raise StructuredOutputError("output is not valid JSON")
+
+
+def parse_structured(text: str, schema: Any) -> Any:
+    value = repair_json(text)
+    validate(value, schema)
+    return value
+
+
+def correction_prompt(prompt: str, error: Exception) -> str:
+    """
+    Re-ask for the same item after a failed parse, stating what was wrong.
+    """
+    return f"""{prompt}
+
+    Your previous answer could not be used: {error}.
+    Return ONLY the JSON object, with every required field, and nothing else.
+    """
@@ -1,162 +1,248 @@
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Iterator, Optional
 from chromadb.api.models.Collection import Collection
 from .llm import get_llm
+from .tokens import estimate_tokens
+from ..core.index_state import get_index_generation
+from ..core.usage import scoped_iter, usage_scope
+from ..utils.iterate_cloning_dir import iter_chroma_entries
+import itertools
 import json
+import threading
 
 
-def build_http_interactions(collection, repo_path: str) -> List[str]:
+_facts_lock = threading.Lock()
+_facts_cache: Dict = {"key": None, "facts": None}
+
+
+def _http_interactions(meta: Dict) -> List[str]:
     """
-    Returns compact descriptions of HTTP interactions originating from this repo.
+    Compact descriptions of the HTTP calls made by one file.
     """
-    res = collection.get(
-        where={"type": "file"},
-        include=["metadatas"],
-    )
+    repo_http_raw = meta.get("repo_http")
+    if not repo_http_raw:
+        return []
+
+    try:
+        repo_http = json.loads(repo_http_raw)
+    except Exception:
+        return []
 
+    source_file = Path(meta.get("path", "")).name
     interactions = []
 
-    for meta in res.get("metadatas", []):
-        path = meta.get("path", "")
-        if not path.startswith(repo_path + "/"):
+    for edge in repo_http:
+        target = edge.get("target_file")
+        url = edge.get("url")
+
+        if not target or not url:
             continue
 
-        repo_http_raw = meta.get("repo_http")
-        if not repo_http_raw:
+        target_repo = Path(target).parents[2].name  # repo folder name
+        target_file = Path(target).name
+
+        interactions.append(
+            f"- {source_file} calls {target_repo}/{target_file} via {url}"
+        )
+
+    return interactions
+
+
+def _owning_repo(path: str, repo_paths: Dict[str, Dict]) -> Optional[str]:
+    for parent in Path(path).parents:
+        if str(parent) in repo_paths:
+            return str(parent)
+    return None
+
+
+def scan_system_facts(collection: Collection) -> Dict[str, Dict]:
+    """
+    One paginated pass over the collection, grouping what the system
+    summary needs by repo path:
+    {repo_path: {"meta", "entrypoints", "dirs", "http"}}
+    """
+    repos: Dict[str, Dict] = {}
+    candidates = []
+
+    for entry in iter_chroma_entries(collection, include=("metadatas",)):
+        meta = entry["metadata"] or {}
+        node_type = meta.get("type")
+
+        if node_type == "repo":
+            repos[meta["path"]] = {
+                "meta": meta,
+                "entrypoints": [],
+                "dirs": [],
+                "http": [],
+            }
+        elif node_type == "dir" or (
+            node_type == "file"
+            and (meta.get("role") == "entrypoint" or meta.get("repo_http"))
+        ):
+            candidates.append(meta)
+
+    for meta in candidates:
+        path = meta.get("path", "")
+
+        if meta.get("type") == "dir":
+            facts = repos.get(meta.get("parent"))
+            if facts is not None:
+                facts["dirs"].append(meta)
             continue
 
-        try:
-            repo_http = json.loads(repo_http_raw)
-        except Exception:
+        repo_path = _owning_repo(path, repos)
+        if repo_path is None:
             continue
 
-        source_file = Path(path).name
+        facts = repos[repo_path]
+        if meta.get("role") == "entrypoint":
+            facts["entrypoints"].append(meta)
+        facts["http"].extend(_http_interactions(meta))
 
-        for edge in repo_http:
-            target = edge.get("target_file")
-            url = edge.get("url")
+    return repos
 
-            if not target or not url:
-                continue
 
-            target_repo = Path(target).parents[2].name  # repo folder name
-            target_file = Path(target).name
+def load_system_facts(collection: Collection) -> Dict[str, Dict]:
+    """
+    scan_system_facts, cached until the index generation changes.
+    """
+    key = (collection.name, get_index_generation())
+    with _facts_lock:
+        if _facts_cache["key"] == key:
+            return _facts_cache["facts"]
 
-            interactions.append(
-                f"- {source_file} calls {target_repo}/{target_file} via {url}"
-            )
+    facts = scan_system_facts(collection)
 
-    return interactions
+    with _facts_lock:
+        _facts_cache["key"] = key
+        _facts_cache["facts"] = facts
+    return facts
 
 
-def build_system_context(
-    collection: Collection,
+def build_http_interactions(collection, repo_path: str) -> List[str]:
+    """
+    Returns compact descriptions of HTTP interactions originating from this repo.
+    """
+    facts = load_system_facts(collection).get(repo_path)
+    return list(facts["http"]) if facts else []
+
+
+def _fit_lines(sections: List[List[str]], token_budget: int) -> List[List[str]]:
+    """
+    Keep lines from all sections round-robin until the token budget is used,
+    so no section is dropped entirely in favour of another.
+    """
+    kept: List[List[str]] = [[] for _ in sections]
+    used = 0
+    for row in itertools.zip_longest(*sections):
+        for i, line in enumerate(row):
+            if line is None:
+                continue
+            cost = estimate_tokens(line) + 1
+            if used + cost > token_budget:
+                return kept
+            kept[i].append(line)
+            used += cost
+    return kept
+
+
+def build_repo_block(
+    repo_path: str,
+    facts: Dict,
     max_dirs_per_repo: int = 5,
     max_entrypoints_per_repo: int = 3,
+    token_budget: int = None,
 ) -> str:
+    """
+    Context block of one repo. With a token budget, the per-section limits
+    are replaced by filling the budget evenly across sections.
+    """
+    repo_meta = facts["meta"]
+    repo_name = Path(repo_path).name
+    repo_short = repo_meta.get("short", "Repository component.")
+
+    entrypoints = [
+        f"- {Path(m['path']).name}: {m.get('short', '')}"
+        for m in facts["entrypoints"]
+    ]
+    dirs = [
+        f"- {Path(m['path']).name}: {m.get('short', '')}"
+        for m in facts["dirs"]
+    ]
+    http_interactions = facts["http"]
+
+    if token_budget is None:
+        entrypoints = entrypoints[:max_entrypoints_per_repo]
+        dirs = dirs[:max_dirs_per_repo]
+        http_interactions = http_interactions[:5]
+    else:
+        remaining = token_budget - estimate_tokens(repo_short) - 40
+        entrypoints, dirs, http_interactions = _fit_lines(
+            [entrypoints, dirs, http_interactions],
+            max(remaining, 0),
+        )
 
-    # ---------- Load repos ----------
-    repo_res = collection.get(
-        where={"type": "repo"},
-        include=["metadatas"],
+    # ---------- Entrypoints ----------
+    ep_block = (
+        "\n".join(entrypoints)
+        if entrypoints
+        else "- (No explicit entrypoints detected)"
     )
 
-    repos = repo_res.get("metadatas", [])
-    if not repos:
-        return "No repositories found."
-
-    system_blocks: List[str] = []
-
-    for repo_meta in repos:
-        repo_path = repo_meta["path"]
-        repo_name = Path(repo_path).name
-        repo_short = repo_meta.get("short", "Repository component.")
-
-        # ---------- Entrypoints ----------
-        ep_res = collection.get(
-            where={
-                "$and": [
-                    {"type": "file"},
-                    {"role": "entrypoint"},
-                ]
-            },
-            include=["metadatas"],
-        )
-
-        entrypoints = [
-                          f"- {Path(m['path']).name}: {m.get('short', '')}"
-                          for m in ep_res.get("metadatas", [])
-                          if m.get("path", "").startswith(repo_path + "/")
-                      ][:max_entrypoints_per_repo]
+    # ---------- HTTP interactions ----------
+    http_block = (
+        "\n".join(http_interactions)
+        if http_interactions
+        else "- (No detected HTTP interactions)"
+    )
 
-        # ---------- HTTP interactions ----------
-        http_interactions = build_http_interactions(collection, repo_path)
+    # ---------- Top-level directories ----------
+    dir_block = (
+        "\n".join(dirs)
+        if dirs
+        else "- (No top-level directories)"
+    )
 
-        http_block = (
-            "\n".join(http_interactions[:5])
-            if http_interactions
-            else "- (No detected HTTP interactions)"
-        )
+    # ---------- Build repo block ----------
+    return f"""
+    REPOSITORY: {repo_name}
 
-        ep_block = (
-            "\n".join(entrypoints)
-            if entrypoints
-            else "- (No explicit entrypoints detected)"
-        )
+    Purpose:
+    {repo_short}
 
-        # ---------- Top-level directories ----------
-        dir_res = collection.get(
-            where={
-                "$and": [
-                    {"type": "dir"},
-                    {"parent": repo_path},
-                ]
-            },
-            include=["metadatas"],
-        )
+    Entrypoints:
+    {ep_block}
 
-        dirs = []
-        for m in dir_res.get("metadatas", [])[:max_dirs_per_repo]:
-            dirs.append(
-                f"- {Path(m['path']).name}: {m.get('short', '')}"
-            )
+    Architecture:
+    {dir_block}
 
-        dir_block = (
-            "\n".join(dirs)
-            if dirs
-            else "- (No top-level directories)"
-        )
+    HTTP Interactions:
+    {http_block}
+    """.strip()
 
-        # ---------- Build repo block ----------
-        repo_block = f"""
-        REPOSITORY: {repo_name}
 
-        Purpose:
-        {repo_short}
-
-        Entrypoints:
-        {ep_block}
-
-        Architecture:
-        {dir_block}
+def build_system_context(
+    collection: Collection,
+    max_dirs_per_repo: int = 5,
+    max_entrypoints_per_repo: int = 3,
+) -> str:
 
-        HTTP Interactions:
-        {http_block}
-        """.strip()
+    # ---------- Load repos ----------
+    repos = load_system_facts(collection)
+    if not repos:
+        return "No repositories found."
 
-        system_blocks.append(repo_block)
+    system_blocks = [
+        build_repo_block(repo_path, facts, max_dirs_per_repo, max_entrypoints_per_repo)
+        for repo_path, facts in repos.items()
+    ]
 
     return "\n\n".join(system_blocks)
 
 
 
-def generate_system_summary(system_context: str) -> str:
-    """
-    Generate a high-level system summary from structured repository context.
-    """
-    llm = get_llm()
-
-    prompt = f"""
+def build_system_summary_prompt(system_context: str) -> str:
+    return f"""
         You are a senior software architect writing documentation for a multi-repository system.
         
         Below is structured information extracted from the codebase.
@@ -184,4 +270,70 @@ def generate_system_summary(system_context: str) -> str:
         Write in professional technical documentation style.
         """
 
-    return llm.generate(prompt)
+
+def build_repo_summary_prompt(repo_block: str) -> str:
+    return f"""
+        You are a senior software architect documenting one repository of a multi-repository system.
+        
+        REPOSITORY CONTEXT:
+        {repo_block}
+        
+        TASK:
+        Write a concise summary (at most 200 words) of this repository covering:
+        
+        1) Its purpose
+        2) Its entrypoints and how execution starts
+        3) Its main components
+        4) Which other repositories it calls, and how
+        
+        RULES:
+        - Base your explanation STRICTLY on the provided context.
+        - Do NOT invent functionality, APIs, or integrations.
+        - Start with the repository name.
+        """
+
+
+def build_group_summary_prompt(summaries: List[str]) -> str:
+    joined = "\n\n---\n\n".join(summaries)
+    return f"""
+        You are a senior software architect documenting a large multi-repository system.
+        
+        Below are summaries of several parts of the system (single repositories
+        or groups of repositories).
+        
+        SUMMARIES:
+        {joined}
+        
+        TASK:
+        Combine them into one summary (at most 300 words) that keeps:
+        
+        1) The name and role of every repository
+        2) Entrypoints and how execution starts
+        3) Every interaction between repositories
+        
+        RULES:
+        - Base your explanation STRICTLY on the provided summaries.
+        - Do NOT invent functionality, APIs, or integrations.
+        - Drop detail before dropping a repository.
+        """
+
+
+def generate_system_summary(system_context: str) -> str:
+    """
+    Generate a high-level system summary from structured repository context.
+    """
+    llm = get_llm()
+    with usage_scope(stage="system_summary"):
+        return llm.generate(build_system_summary_prompt(system_context))
+
+
+def stream_system_summary(system_context: str) -> Iterator[str]:
+    """
+    Streaming variant of generate_system_summary.
+    """
+    llm = get_llm()
+    yield from scoped_iter(
+        llm.stream(build_system_summary_prompt(system_context)),
+        stage="system_summary",
+    )
+
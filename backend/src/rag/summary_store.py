@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Tuple
+
+from chromadb.api.models.Collection import Collection
+
+from ..core.config import get_settings
+from ..core.executor import run_async, run_blocking
+from ..core.index_state import get_index_generation
+from ..core.progress import check_cancelled, report_progress
+from ..core.usage import scoped_iter, usage_scope
+from .llm import get_llm
+from .tokens import estimate_tokens
+from .summary_guide import (
+    build_group_summary_prompt,
+    build_repo_block,
+    build_repo_summary_prompt,
+    build_system_summary_prompt,
+    load_system_facts,
+)
+
+
+SUMMARY_FILENAME = "system_summary.json"
+
+# All summary work runs on one event loop (see run_async), so an asyncio
+# lock serializes it.
+_lock = None
+
+
+def _get_lock() -> asyncio.Lock:
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    return _lock
+
+
+def _summary_path() -> Path:
+    return Path(get_settings().PERSIST_DIR) / SUMMARY_FILENAME
+
+
+def load_summary_state() -> Dict:
+    """
+    Persisted summary state:
+    {
+      "generation": int,          # index generation the summary was built for
+      "summary": str,
+      "fragments": {repo_path: {"digest": str, "fragment": str}},
+      "groups": {input_digest: group_summary}
+    }
+    """
+    try:
+        with open(_summary_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_summary_state(state: Dict):
+    path = _summary_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+async def arefresh_repo_fragments(collection: Collection, fragments: Dict) -> Tuple[Dict, bool]:
+    """
+    Map step: regenerate, concurrently, the summary fragment of every repo
+    whose prompt (its rendered repo block) changed since the fragment was
+    written; the others are reused. Returns (fragments, changed).
+    """
+    settings = get_settings()
+    llm = get_llm()
+    facts = await run_blocking(load_system_facts, collection)
+    semaphore = asyncio.Semaphore(settings.SUMMARY_CONCURRENCY)
+
+    async def summarize(repo_path: str, prompt: str) -> Dict:
+        async with semaphore:
+            check_cancelled()
+            print(f"Summarizing repo: {Path(repo_path).name}")
+            with usage_scope(stage="repo_summary", repo=Path(repo_path).name):
+                fragment = await llm.agenerate(prompt)
+        return {"digest": _digest(prompt), "fragment": fragment.strip()}
+
+    fresh = {}
+    prompts = {}
+    for repo_path, repo_facts in facts.items():
+        block = build_repo_block(
+            repo_path,
+            repo_facts,
+            token_budget=settings.REPO_CONTEXT_TOKEN_BUDGET,
+        )
+        prompt = build_repo_summary_prompt(block)
+        previous = fragments.get(repo_path)
+        if previous and previous.get("digest") == _digest(prompt):
+            fresh[repo_path] = previous
+        else:
+            prompts[repo_path] = prompt
+    stale = list(prompts)
+
+    report_progress(0.1, f"Summarizing {len(stale)} of {len(facts)} repos")
+    results = await asyncio.gather(*(summarize(p, prompts[p]) for p in stale))
+    fresh.update(zip(stale, results))
+
+    # Keep the repo order stable so reduce groups stay the same across runs.
+    fresh = {repo_path: fresh[repo_path] for repo_path in sorted(fresh)}
+    changed = bool(stale) or set(fragments) != set(fresh)
+    return fresh, changed
+
+
+def _pack_groups(texts: List[str], token_budget: int) -> List[List[str]]:
+    """
+    Split consecutive texts into groups whose combined size fits the budget.
+    Every group gets at least two texts so each level shrinks the input.
+    """
+    groups: List[List[str]] = []
+    current: List[str] = []
+    used = 0
+    for text in texts:
+        cost = estimate_tokens(text)
+        if len(current) >= 2 and used + cost > token_budget:
+            groups.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += cost
+    if current:
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        else:
+            groups.append(current)
+    return groups
+
+
+async def areduce_summaries(texts: List[str], groups: Dict, used_groups: Dict) -> List[str]:
+    """
+    Reduce steps: while the summaries do not fit one prompt, summarize groups
+    of them concurrently and repeat on the results. Each level divides the
+    number of summaries, so the depth grows with log(repos).
+
+    Group summaries are cached by the digest of their input in `groups`;
+    the ones used in this run are copied to `used_groups`.
+    """
+    settings = get_settings()
+    budget = settings.SUMMARY_LEVEL_TOKEN_BUDGET
+    llm = get_llm()
+    semaphore = asyncio.Semaphore(settings.SUMMARY_CONCURRENCY)
+
+    async def summarize(group: List[str], level: int) -> str:
+        prompt = build_group_summary_prompt(group)
+        key = _digest(prompt)
+        if key not in groups:
+            async with semaphore:
+                check_cancelled()
+                print(f"Summarizing group of {len(group)} (level {level})")
+                with usage_scope(stage="group_summary"):
+                    groups[key] = (await llm.agenerate(prompt)).strip()
+        used_groups[key] = groups[key]
+        return groups[key]
+
+    level = 1
+    report_progress(0.6, "Merging repo summaries")
+    while len(texts) > 1 and sum(estimate_tokens(t) for t in texts) > budget:
+        texts = await asyncio.gather(
+            *(summarize(group, level) for group in _pack_groups(texts, budget))
+        )
+        level += 1
+    return list(texts)
+
+
+async def _aprepare(collection: Collection) -> Tuple[Dict, bool, str]:
+    """
+    Bring the persisted fragments and group summaries up to date for the
+    current generation. Returns (state, fresh, context): fresh means
+    state["summary"] can be served as is, otherwise `context` is the input
+    of the final system summary.
+    """
+    generation = get_index_generation()
+    state = load_summary_state()
+    if state.get("generation") == generation and state.get("summary"):
+        return state, True, ""
+
+    fragments, changed = await arefresh_repo_fragments(collection, state.get("fragments", {}))
+    state["fragments"] = fragments
+    state["generation"] = generation
+
+    if not fragments:
+        state["summary"] = "No repositories found."
+        return state, True, ""
+
+    # Nothing any repo summary depends on changed: the old summary still holds.
+    if state.get("summary") and not changed:
+        return state, True, ""
+
+    used_groups: Dict = {}
+    texts = await areduce_summaries(
+        [f["fragment"] for f in fragments.values()],
+        state.get("groups", {}),
+        used_groups,
+    )
+    state["groups"] = used_groups
+    return state, False, "\n\n".join(texts)
+
+
+async def aget_system_summary(collection: Collection) -> str:
+    """
+    System summary for the current index generation, generated at most once
+    per generation and persisted in PERSIST_DIR/system_summary.json.
+    """
+    async with _get_lock():
+        state, fresh, context = await _aprepare(collection)
+
+        if not fresh:
+            with usage_scope(stage="system_summary"):
+                state["summary"] = await get_llm().agenerate(build_system_summary_prompt(context))
+
+        save_summary_state(state)
+        return state["summary"]
+
+
+async def _aprepare_stream(collection: Collection) -> Tuple[Dict, bool, str]:
+    async with _get_lock():
+        state, fresh, context = await _aprepare(collection)
+        if fresh:
+            save_summary_state(state)
+        return state, fresh, context
+
+
+async def astream_system_summary(collection: Collection) -> AsyncIterator[str]:
+    """
+    Streaming variant of aget_system_summary. A summary that is already up
+    to date is sent as a single chunk; otherwise the final step is streamed
+    and persisted once complete.
+    """
+    state, fresh, context = await _aprepare_stream(collection)
+    if fresh:
+        yield state["summary"]
+        return
+
+    chunks = scoped_iter(
+        get_llm().stream(build_system_summary_prompt(context)),
+        stage="system_summary",
+    )
+    parts = []
+    while True:
+        # The provider stream is blocking; pull it off the event loop.
+        chunk = await run_blocking(next, chunks, None)
+        if chunk is None:
+            break
+        parts.append(chunk)
+        yield chunk
+
+    state["summary"] = "".join(parts)
+    async with _get_lock():
+        save_summary_state(state)
+
+
+def get_system_summary(collection: Collection) -> str:
+    """
+    Blocking variant of aget_system_summary for jobs and scripts.
+    """
+    return run_async(aget_system_summary(collection))
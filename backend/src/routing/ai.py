@@ -1,22 +1,59 @@
 from fastapi import APIRouter, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pathlib import Path
 import json
 from fastapi import HTTPException
 from ..core.config import get_settings
 from ..graph_processing.graph_builder import build_graph
+from ..rag.query_cache import get_query_cache
+from ..rag.answer_cache import get_answer_cache
+from ..rag.sessions import get_session_store
+from ..rag.llm import get_llm, get_secondary_llm
+from ..rag.slo import slo_stats
+from ..core.usage import get_usage_recorder, read_run_report
 import sys
 import os
 
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
 sys.path.append(ROOT_DIR)
 
-from generate_summary import generate_summary
-from chatbot import answer
+from generate_summary import agenerate_summary, astream_summary
+from chatbot import answer_async, answer_with_deadline_async, answer_batch_async, chat_async, stream_answer
 
 router = APIRouter()
 
 
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events):
+    """
+    Wrap an iterator (or async iterator) of (event, data) pairs into a
+    text/event-stream response. Errors raised mid-stream are reported as an
+    "error" event, since the status code has already been sent.
+    """
+    if hasattr(events, "__aiter__"):
+        async def body():
+            try:
+                async for event, data in events:
+                    yield sse_event(event, data)
+            except Exception as e:
+                yield sse_event("error", {"detail": str(e)})
+    else:
+        def body():
+            try:
+                for event, data in events:
+                    yield sse_event(event, data)
+            except Exception as e:
+                yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @router.get("/graph")
 async def generate_graph():
@@ -40,9 +77,9 @@ async def generate_graph():
         )
     
 @router.get("/summary")
-def get_system_summary():
+async def get_system_summary():
     try:
-        summary = generate_summary()
+        summary = await agenerate_summary()
         return {"status": "success", "summary": summary}
     except Exception as e:
         raise HTTPException(
@@ -50,8 +87,22 @@ def get_system_summary():
             detail=f"Failed to generate system summary: {str(e)}"
         )
     
+@router.get("/summary/stream")
+async def stream_system_summary():
+    async def events():
+        async for token in astream_summary():
+            yield "token", token
+        yield "done", {}
+
+    return sse_response(events())
+
+
 @router.post("/ask")
 async def ask(request: Request):
+    """
+    Answer one question. With ASK_DEADLINE set, the response also carries
+    degraded, retrieval, model and elapsed_ms (see ASK_DEADLINE in config).
+    """
     try:
         body = await request.json()
         q = body.get("question")
@@ -59,8 +110,97 @@ async def ask(request: Request):
         if not q:
             return {"status": "error", "answer": "", "detail": "Missing 'question' in JSON body"}
 
-        ans = answer(q)
+        if get_settings().ASK_DEADLINE:
+            result = await answer_with_deadline_async(q)
+            return {"status": "success", **result}
+
+        ans = await answer_async(q)
         return {"status": "success", "answer": ans}
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/ask/batch")
+async def ask_batch(request: Request):
+    body = await request.json()
+    questions = body.get("questions")
+
+    if not isinstance(questions, list) or not questions:
+        raise HTTPException(status_code=400, detail="Missing 'questions' list in JSON body")
+
+    if not all(isinstance(q, str) and q for q in questions):
+        raise HTTPException(status_code=400, detail="Every question must be a non-empty string")
+
+    max_questions = get_settings().MAX_BATCH_QUESTIONS
+    if len(questions) > max_questions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {max_questions} questions per batch",
+        )
+
+    try:
+        batch = await answer_batch_async(questions)
+        return {"status": "success", **batch}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/ask/stream")
+async def ask_stream(request: Request):
+    body = await request.json()
+    q = body.get("question")
+
+    if not q:
+        raise HTTPException(status_code=400, detail="Missing 'question' in JSON body")
+
+    return sse_response(stream_answer(q))
+
+
+@router.post("/chat")
+async def chat(request: Request):
+    body = await request.json()
+    q = body.get("question")
+
+    if not q:
+        raise HTTPException(status_code=400, detail="Missing 'question' in JSON body")
+
+    try:
+        result = await chat_async(q, body.get("session_id"))
+        return {"status": "success", **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/chat/{session_id}")
+def end_chat(session_id: str):
+    if not get_session_store().delete(session_id):
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return {"status": "success"}
+
+
+@router.get("/usage")
+def get_usage():
+    return get_usage_recorder().snapshot()
+
+
+@router.get("/usage/runs/{run_id}")
+def get_run_usage(run_id: str):
+    try:
+        return read_run_report(run_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Unknown run")
+
+
+@router.get("/metrics")
+def get_metrics():
+    llm = get_llm()
+    secondary = get_secondary_llm()
+    return {
+        "llm": llm.stats() if hasattr(llm, "stats") else {},
+        "secondary_llm": secondary.stats() if hasattr(secondary, "stats") else {},
+        "ask_slo": slo_stats(),
+        "query_embedding_cache": get_query_cache().stats(),
+        "answer_cache": get_answer_cache().stats(),
+        "chat_sessions": len(get_session_store()),
+    }
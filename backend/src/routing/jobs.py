@@ -0,0 +1,208 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, WebSocket, WebSocketDisconnect, status
+from sqlalchemy.orm import Session
+from typing import List
+import asyncio
+import sys
+import os
+
+from ..core.config import get_settings
+from ..core.executor import run_blocking
+from ..core.jobs import JOB_HANDLERS, get_job_runner, register_job_handler
+from ..core.store import activate_collection, rollback_collection
+from ..core.index_state import load_index_state
+from ..core.progress import get_progress_registry, progress_phase, track_pipeline
+from ..graph_processing.graph_builder import build_graph
+from ..sqldb.db import SessionLocal, get_db
+from ..sqldb.crud import ACTIVE_JOB_STATUSES, get_job, list_jobs
+from ..sqldb.schemas import JobRead
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+sys.path.append(ROOT_DIR)
+
+from process_repos import main as index_repos
+# The same module process_repos uses: it tracks the checkpoints this
+# process owns, which only the owning module instance can clear or release.
+from src.core.checkpoint import clear_ingest_checkpoint, release_ingest_checkpoint
+from connect_repos import second_pass
+from generate_summary import generate_summary
+from gc_index import collect_garbage
+
+router = APIRouter()
+
+
+# ---------- Job handlers ----------
+
+def ingest_job(job_id: str, params: dict) -> dict:
+    # Same steps as process.py: index, then link repos over HTTP.
+    collection_name = None
+    try:
+        with track_pipeline(job_id):
+            with progress_phase(0.0, 0.85):
+                collection_name = index_repos(
+                    run_id=job_id,
+                    resume=bool(params.get("resume")),
+                    full=bool(params.get("full")),
+                )
+            with progress_phase(0.85, 1.0):
+                second_pass(collection_name)
+        activate_collection(collection_name)
+    except BaseException:
+        # Leave the run resumable by a later job in this process.
+        if collection_name is not None:
+            release_ingest_checkpoint(collection_name)
+        raise
+    clear_ingest_checkpoint(collection_name)
+    return {"run_id": job_id, "collection": collection_name}
+
+
+def link_job(job_id: str, params: dict) -> dict:
+    second_pass()
+    return {}
+
+
+def graph_job(job_id: str, params: dict) -> dict:
+    build_graph()
+    return {"path": get_settings().JSON_PATH}
+
+
+def summary_job(job_id: str, params: dict) -> dict:
+    return {"summary": generate_summary()}
+
+
+def gc_job(job_id: str, params: dict) -> dict:
+    return collect_garbage(
+        run_id=job_id,
+        compact=params.get("compact", True),
+        keep=params.get("keep"),
+        vacuum=params.get("vacuum", False),
+    )
+
+
+# Runs share the store and would each activate their own collection.
+register_job_handler("ingest", ingest_job, singleton=True)
+register_job_handler("link", link_job)
+register_job_handler("graph", graph_job)
+register_job_handler("summary", summary_job)
+# A second run would drop the first one's unfinished collection.
+register_job_handler("gc", gc_job, singleton=True)
+
+
+# ---------- Routes ----------
+
+@router.post("/jobs/{kind}", response_model=JobRead, status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(kind: str, request: Request, response: Response):
+    """
+    Queue a job. An identical job that is already queued or running is
+    returned instead, with status 200 rather than 202.
+    """
+    if kind not in JOB_HANDLERS:
+        raise HTTPException(status_code=404, detail=f"Unknown job kind '{kind}'")
+
+    body = await request.body()
+    params = await request.json() if body else {}
+    if not isinstance(params, dict):
+        raise HTTPException(status_code=400, detail="Job parameters must be a JSON object")
+
+    # Database work: keep it off the event loop.
+    job, created = await run_blocking(get_job_runner().submit, kind, params)
+    if not created:
+        response.status_code = status.HTTP_200_OK
+    return job
+
+
+@router.get("/jobs", response_model=List[JobRead])
+def get_jobs(limit: int = 50, db: Session = Depends(get_db)):
+    return list_jobs(db, limit=limit)
+
+
+@router.get("/jobs/{job_id}", response_model=JobRead)
+def get_job_status(job_id: str, db: Session = Depends(get_db)):
+    job = get_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobRead)
+def cancel_job(job_id: str):
+    job = get_job_runner().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+
+# ---------- Collections ----------
+
+@router.get("/index")
+def get_index_state():
+    return load_index_state()
+
+
+@router.post("/index/rollback")
+def rollback_index():
+    """
+    Point readers back at the most recently retired collection.
+    """
+    name = rollback_collection()
+    if name is None:
+        raise HTTPException(status_code=409, detail="No previous collection to roll back to")
+    return load_index_state()
+
+
+# ---------- Ingestion progress ----------
+
+@router.get("/progress/{run_id}")
+def get_progress(run_id: str):
+    progress = get_progress_registry().get(run_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Unknown run")
+    return progress.snapshot()
+
+
+@router.websocket("/progress/{run_id}/ws")
+async def stream_progress(websocket: WebSocket, run_id: str):
+    """
+    Push a progress snapshot (per-stage counts, throughput and ETA) every
+    PROGRESS_STREAM_INTERVAL seconds until the run ends. The pipeline only
+    bumps counters; snapshots are taken here, so slow clients never hold
+    it up. For ingest jobs the run id is the job id.
+
+    Progress lives in the server process, so runs started from the CLI
+    (process.py) cannot be followed here. The socket is closed with code
+    4404 if the run id is not a known job, or if the run has not started
+    within PROGRESS_PENDING_TIMEOUT seconds.
+    """
+    await websocket.accept()
+    settings = get_settings()
+    registry = get_progress_registry()
+    waiting_since = asyncio.get_running_loop().time()
+
+    def lookup_job():
+        with SessionLocal() as db:
+            job = get_job(db, run_id)
+            return None if job is None else job.status
+
+    try:
+        while True:
+            progress = registry.get(run_id)
+            if progress is None:
+                job_status = await run_blocking(lookup_job)
+                if job_status is None:
+                    await websocket.close(code=4404, reason="Unknown run")
+                    return
+                if job_status not in ACTIVE_JOB_STATUSES:
+                    await websocket.send_json({"run_id": run_id, "state": job_status})
+                    break
+                if asyncio.get_running_loop().time() - waiting_since > settings.PROGRESS_PENDING_TIMEOUT:
+                    await websocket.close(code=4404, reason="Run did not start")
+                    return
+                await websocket.send_json({"run_id": run_id, "state": "pending"})
+            else:
+                snapshot = progress.snapshot()
+                await websocket.send_json(snapshot)
+                if snapshot["state"] != "running":
+                    break
+            await asyncio.sleep(settings.PROGRESS_STREAM_INTERVAL)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
@@ -1,5 +1,6 @@
+from datetime import datetime
 from sqlalchemy.orm import Session
-from .models import User
+from .models import User, Job
 
 def create_user(db: Session, user):
     db_user = User(
@@ -14,3 +15,59 @@ def create_user(db: Session, user):
 
 def get_user_by_email(db: Session, email: str):
     return db.query(User).filter(User.email == email).first()
+
+
+ACTIVE_JOB_STATUSES = ("queued", "running")
+
+
+def create_job(db: Session, job_id: str, kind: str, params: dict, dedup_key: str):
+    job = Job(
+        jobID=job_id,
+        kind=kind,
+        status="queued",
+        params=params,
+        dedup_key=dedup_key,
+        active_key=dedup_key,
+        progress=0.0,
+        cancel_requested=False,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def get_job(db: Session, job_id: str):
+    return db.query(Job).filter(Job.jobID == job_id).first()
+
+def list_jobs(db: Session, limit: int = 50):
+    return db.query(Job).order_by(Job.created_at.desc()).limit(limit).all()
+
+def get_active_job(db: Session, dedup_key: str):
+    return (
+        db.query(Job)
+        .filter(Job.dedup_key == dedup_key, Job.status.in_(ACTIVE_JOB_STATUSES))
+        .first()
+    )
+
+def update_job(db: Session, job_id: str, **fields):
+    if "status" in fields and fields["status"] not in ACTIVE_JOB_STATUSES:
+        fields["active_key"] = None
+    db.query(Job).filter(Job.jobID == job_id).update(fields)
+    db.commit()
+
+def fail_active_jobs(db: Session, error: str) -> int:
+    count = (
+        db.query(Job)
+        .filter(Job.status.in_(ACTIVE_JOB_STATUSES))
+        .update(
+            {
+                "status": "failed",
+                "error": error,
+                "finished_at": datetime.utcnow(),
+                "active_key": None,
+            },
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return count
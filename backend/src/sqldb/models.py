@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, JSON
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, ForeignKey, JSON, Float, Text, Boolean, DateTime
 from sqlalchemy.orm import relationship
 from .db import Base
 
@@ -34,3 +35,25 @@ class WorksOn(Base):
 
     user_rel = relationship("User", back_populates="works_on")
     project_rel = relationship("Project", back_populates="works_on")
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    jobID = Column(String(32), primary_key=True)
+    kind = Column(String(20), nullable=False, index=True)
+    # queued | running | succeeded | failed | cancelled
+    status = Column(String(20), nullable=False, index=True)
+    dedup_key = Column(String(64), nullable=False, index=True)
+    # dedup_key while queued or running, NULL once finished: the database
+    # allows one active job per key, across workers and processes
+    active_key = Column(String(64), nullable=True, unique=True)
+    params = Column(JSON, nullable=False)
+    progress = Column(Float, nullable=False, default=0.0)
+    message = Column(String(255), nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
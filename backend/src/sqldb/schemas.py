@@ -1,3 +1,5 @@
+from datetime import datetime
+from typing import Optional
 from pydantic import BaseModel
 
 class UserCreate(BaseModel):
@@ -12,3 +14,21 @@ class UserRead(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class JobRead(BaseModel):
+    jobID: str
+    kind: str
+    status: str
+    params: dict
+    progress: float
+    message: Optional[str] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    cancel_requested: bool
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,148 @@
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+def _git(repo: Path, *args: str) -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "-C", str(repo), *args],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout
+
+
+def is_git_repo(repo: Path) -> bool:
+    """
+    True if `repo` is the top level of its own git work tree (a folder
+    that merely sits inside another checkout does not count).
+    """
+    toplevel = _git(repo, "rev-parse", "--show-toplevel")
+    return toplevel is not None and Path(toplevel.strip()).resolve() == Path(repo).resolve()
+
+
+def _hash_file(repo: Path, rel: str) -> Optional[str]:
+    if not (repo / rel).is_file():
+        return None
+    output = _git(repo, "hash-object", "--", rel)
+    return output.strip() if output else None
+
+
+def _status_paths(repo: Path) -> Tuple[List[str], List[str]]:
+    """
+    (all paths with uncommitted changes, untracked paths) from `git status`.
+    """
+    output = _git(repo, "status", "--porcelain=v1", "-z", "--untracked-files=all")
+    if output is None:
+        return [], []
+
+    paths, untracked = [], []
+    tokens = output.split("\0")
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        i += 1
+        if len(token) < 4:
+            continue
+        code, path = token[:2], token[3:]
+        paths.append(path)
+        if code == "??":
+            untracked.append(path)
+        if "R" in code or "C" in code:
+            # Renames / copies are followed by their source path.
+            paths.append(tokens[i])
+            i += 1
+    return paths, untracked
+
+
+def repo_state(repo: Path) -> Optional[Dict]:
+    """
+    What an index of `repo` built now corresponds to:
+    {"commit": HEAD, "dirty": {path: blob hash, or None if deleted}}
+    for every path with uncommitted changes. None if it is not a git repo.
+    """
+    if not is_git_repo(repo):
+        return None
+    head = _git(repo, "rev-parse", "HEAD")
+    if head is None:
+        return None
+
+    paths, _ = _status_paths(repo)
+    return {
+        "commit": head.strip(),
+        "dirty": {path: _hash_file(repo, path) for path in paths},
+    }
+
+
+def _parse_name_status(output: str) -> Tuple[List[str], List[Tuple[str, str, int]]]:
+    """
+    Parse `git diff --name-status -z` output into (paths, renames), where a
+    rename is (old, new, similarity).
+    """
+    paths, renames = [], []
+    tokens = output.split("\0")
+    i = 0
+    while i < len(tokens) and tokens[i]:
+        status = tokens[i]
+        i += 1
+        if status[0] in ("R", "C"):
+            old, new = tokens[i], tokens[i + 1]
+            i += 2
+            if status[0] == "R":
+                renames.append((old, new, int(status[1:] or 0)))
+            else:
+                paths.append(new)
+        else:
+            paths.append(tokens[i])
+            i += 1
+    return paths, renames
+
+
+def detect_changes(repo: Path, previous: Optional[Dict]) -> Optional[Dict]:
+    """
+    Files of `repo` that changed since the state recorded by repo_state():
+    commits since the recorded one (`git diff --name-status`) plus the
+    working tree (`git status`).
+
+    Returns {"changed": [absolute paths], "renamed": [(old, new)]}, where
+    "renamed" only holds exact renames whose content is unchanged, or None
+    when git cannot tell (not a repo, nothing recorded, unknown commit).
+    """
+    if not previous or not previous.get("commit") or not is_git_repo(repo):
+        return None
+    commit = previous["commit"]
+    if _git(repo, "cat-file", "-e", f"{commit}^{{commit}}") is None:
+        return None
+
+    # Against the work tree, so staged and unstaged edits are included.
+    output = _git(repo, "diff", "--name-status", "-M", "-z", commit)
+    if output is None:
+        return None
+    paths, renames = _parse_name_status(output)
+
+    _, untracked = _status_paths(repo)
+    dirty = previous.get("dirty", {})
+
+    candidates = set(paths) | set(untracked) | set(dirty)
+    renamed = []
+    for old, new, similarity in renames:
+        if similarity == 100 and old not in dirty and new not in dirty:
+            renamed.append((old, new))
+        else:
+            candidates.update((old, new))
+
+    # Paths that were dirty when last indexed and still have that content.
+    changed = [
+        path for path in candidates
+        if path not in dirty or _hash_file(repo, path) != dirty[path]
+    ]
+
+    root = Path(repo).resolve()
+    return {
+        "changed": sorted(str(root / path) for path in changed),
+        "renamed": [(str(root / old), str(root / new)) for old, new in renamed],
+    }
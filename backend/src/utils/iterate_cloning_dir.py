@@ -50,12 +50,21 @@ def iter_files(cloning_dir: str | Path):
                 yield file_path
 
 
-def iter_chroma_entries(collection, batch_size=100):
+def iter_chroma_entries(
+    collection,
+    batch_size=100,
+    include=("documents", "metadatas"),
+):
+    """
+    Page through the whole collection. Ids are always returned by Chroma,
+    so only the extra fields are requested.
+    """
+    include = list(include)
     offset = 0
 
     while True:
         batch = collection.get(
-            include=["documents", "metadatas", "ids"],
+            include=include,
             limit=batch_size,
             offset=offset,
         )
@@ -66,8 +75,9 @@ def iter_chroma_entries(collection, batch_size=100):
         for i in range(len(batch["ids"])):
             yield {
                 "id": batch["ids"][i],
-                "document": batch["documents"][i],
-                "metadata": batch["metadatas"][i],
+                "document": batch["documents"][i] if "documents" in include else None,
+                "metadata": batch["metadatas"][i] if "metadatas" in include else None,
+                "embedding": batch["embeddings"][i] if "embeddings" in include else None,
             }
 
         offset += batch_size
@@ -4,6 +4,11 @@ from ..rag.llm import get_llm
 from pathlib import Path
 import json
 from ..core.config import get_settings
+from ..rag.context_packing import context_block_metadata
+from ..rag.tokens import estimate_tokens
+from ..core.usage import usage_scope
+from ..core.progress import emit_progress
+from ..rag.structured import DESCRIPTION_SCHEMA, PACKED_DESCRIPTION_SCHEMA, StructuredOutputError, validate
 
 
 ENTRYPOINT_FILENAMES = {
@@ -23,6 +28,17 @@ def relpath(p, root):
     return p.replace(root.rstrip("/") + "/", "./")
 
 
+def repo_of(path) -> str | None:
+    """
+    Name of the repository (top-level folder of CLONING_DIR) a path belongs to.
+    """
+    try:
+        rel = Path(path).resolve().relative_to(Path(get_settings().CLONING_DIR).resolve())
+    except ValueError:
+        return None
+    return rel.parts[0] if rel.parts else None
+
+
 def get_connections(file):
     lang = detect_language(file)
 
@@ -71,16 +87,133 @@ def get_description(file_path: str) -> dict:
     {code}
     """
 
-    response = llm.generate(prompt)
+    settings = get_settings()
+    return llm.generate_json(
+        prompt,
+        DESCRIPTION_SCHEMA,
+        max_retries=settings.STRUCTURED_MAX_RETRIES,
+    )
+
+
+def _pack_small_files(sources: dict, budget: int, max_files: int) -> list[list[str]]:
+    """
+    Group files (in order) so each group's code fits the token budget.
+    """
+    groups = []
+    current = []
+    used = 0
+
+    for path, code in sources.items():
+        tokens = estimate_tokens(code)
+        if current and (used + tokens > budget or len(current) >= max_files):
+            groups.append(current)
+            current = []
+            used = 0
+        current.append(path)
+        used += tokens
+
+    if current:
+        groups.append(current)
+
+    return groups
+
+
+def _describe_packed(paths: list[str], sources: dict) -> dict:
+    """
+    Describe several small files with one LLM call.
+
+    Returns {path: {"short", "detailed"}} for every entry that came back
+    valid; files missing from the result are left to the caller.
+    """
+    llm = get_llm()
+    settings = get_settings()
+
+    labels = {relpath(p, settings.CLONING_DIR): p for p in paths}
+    files_block = "\n\n".join(
+        f"=== FILE: {label} ===\n{sources[path]}"
+        for label, path in labels.items()
+    )
 
+    prompt = f"""
+    You are a senior software engineer analyzing several small source code files.
+    
+    Return a STRICT JSON object with a single field "files": an array with
+    exactly one object per file. Each object has:
+    - "path": the file path exactly as written in its FILE header
+    - "short": exactly ONE sentence describing the file’s purpose at a high level
+    - "detailed": a clear, structured explanation of what the file does (max 150 words)
+    
+    Rules:
+    - Describe each file on its own; do NOT mix up files.
+    - Do NOT repeat the code.
+    - Do NOT include markdown.
+    - Do NOT include information not inferable from the code.
+    - The "short" field must be suitable for architecture-level summaries.
+    
+    FILES:
+    {files_block}
+    """
+
+    # No re-ask here: files the packed answer misses are retried one by one.
     try:
-        return json.loads(response)
-    except json.JSONDecodeError:
-        # Fallback safety (important for hackathons)
-        return {
-            "short": response.strip().split(".")[0] + ".",
-            "detailed": response.strip(),
-        }
+        packed = llm.generate_json(prompt, {"files": list}, max_retries=0)
+    except StructuredOutputError:
+        return {}
+
+    results = {}
+    for item in packed["files"]:
+        try:
+            validate(item, PACKED_DESCRIPTION_SCHEMA["files"][0])
+        except StructuredOutputError:
+            continue
+        path = labels.get(item["path"])
+        if path is None or path in results:
+            continue
+        results[path] = {"short": item["short"], "detailed": item["detailed"]}
+
+    return results
+
+
+def get_descriptions(file_paths: list) -> dict:
+    """
+    Describe many files, packing small ones into shared prompts.
+
+    Files above SMALL_FILE_TOKENS get their own call. Small files are packed
+    under PACK_TOKEN_BUDGET; any file the packed answer does not cover
+    correctly falls back to a single-file call.
+
+    Files whose description still fails validation are left out of the
+    result (and reported) instead of being stored with a garbage summary.
+    """
+    settings = get_settings()
+
+    sources = {}
+    single = []
+    results = {}
+
+    for file_path in file_paths:
+        path = Path(file_path)
+        if not path.exists():
+            raise FileNotFoundError(f"File not found: {file_path}")
+        code = path.read_text(encoding="utf-8", errors="ignore")
+
+        if estimate_tokens(code) > settings.SMALL_FILE_TOKENS:
+            single.append(str(file_path))
+        else:
+            sources[str(file_path)] = code
+
+    for group in _pack_small_files(sources, settings.PACK_TOKEN_BUDGET, settings.PACK_MAX_FILES):
+        packed = _describe_packed(group, sources) if len(group) > 1 else {}
+        results.update(packed)
+        single.extend(path for path in group if path not in packed)
+
+    for path in single:
+        try:
+            results[path] = get_description(path)
+        except StructuredOutputError as e:
+            print(f"Skipping {path}: invalid description output ({e})")
+
+    return {str(p): results[str(p)] for p in file_paths if str(p) in results}
 
 
 def add_to_base(
@@ -120,10 +253,6 @@ def add_to_base(
     if node_type == "file" and connections is not None:
         filename = path.name
         role = "entrypoint" if filename in ENTRYPOINT_FILENAMES else "module"
-        print(1)
-        print(connections.get("http_calls", []))
-        print(2)
-        print(connections.get("symbols_used", []))
         metadata.update({
             "role": role,
             "language": connections.get("language"),
@@ -135,8 +264,13 @@ def add_to_base(
             "repo_http": json.dumps([])
         })
 
-    # --- Store in Chroma ---
-    collection.add(
+    # --- Pre-rendered context block for query-time packing ---
+    metadata.update(
+        context_block_metadata(node_type, str(path), detailed_description, metadata)
+    )
+
+    # --- Store in Chroma (upsert, so re-runs and resumes are idempotent) ---
+    collection.upsert(
         ids=[str(path)],
         documents=[detailed_description],
         embeddings=[embedding],
@@ -150,7 +284,12 @@ def flush_file_buffer(collection, buffer, embedder):
         item["description"]["detailed"] for item in buffer
     ]
 
-    detailed_embeddings = embedder.embed(detailed_texts)
+    repos = {repo_of(item["file"]) for item in buffer}
+    repo = repos.pop() if len(repos) == 1 else None
+
+    with usage_scope(stage="file_embedding", repo=repo):
+        detailed_embeddings = embedder.embed(detailed_texts)
+    emit_progress("embedded", len(buffer))
 
     for item, embedding in zip(buffer, detailed_embeddings):
         add_to_base(
@@ -161,6 +300,7 @@ def flush_file_buffer(collection, buffer, embedder):
             connections=item["connections"],
             path=item["file"],
         )
+    emit_progress("written", len(buffer))
 
 
 def process_directory(collection, dir_path: str):
@@ -200,6 +340,11 @@ def process_directory(collection, dir_path: str):
         # Empty directory → skip
         return
 
+    with usage_scope(stage="dir_summary", repo=repo_of(dir_path)):
+        _summarize_directory(collection, dir_path, short_children)
+
+
+def _summarize_directory(collection, dir_path: str, short_children: list):
     llm = get_llm()
     embedder = get_embedder()
 
@@ -221,16 +366,15 @@ def process_directory(collection, dir_path: str):
     {chr(10).join(f"- {s}" for s in short_children)}
     """
 
-    response = llm.generate(prompt)
-
     try:
-        desc = json.loads(response)
-    except Exception:
-        # Safety fallback
-        desc = {
-            "short": short_children[0],
-            "detailed": response.strip(),
-        }
+        desc = llm.generate_json(
+            prompt,
+            DESCRIPTION_SCHEMA,
+            max_retries=get_settings().STRUCTURED_MAX_RETRIES,
+        )
+    except StructuredOutputError as e:
+        print(f"Skipping directory {dir_path}: invalid summary output ({e})")
+        return
 
     # ---------- Embed ONLY detailed description ----------
     embedding = embedder.embed(desc["detailed"])[0]
@@ -1,13 +1,9 @@
-from chromadb import PersistentClient
-from src.core.config import get_settings
+from src.core.store import get_collection
 import json
 
 
 def print_all_entries_with_embeddings():
-    settings = get_settings()
-
-    client = PersistentClient(path=settings.PERSIST_DIR)
-    collection = client.get_collection(name=settings.COLLECTION_NAME)
+    collection = get_collection()
 
     results = collection.get(
         include=["documents", "metadatas", "embeddings"]
@@ -0,0 +1,400 @@
+import argparse
+import os
+import threading
+import time
+import traceback
+from pathlib import Path
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    # Optional: without watchdog, CLONING_DIR is polled instead.
+    FileSystemEventHandler = object
+    Observer = None
+
+from connect_repos import relink
+from process_repos import _indexed_nodes, apply_changes, find_changes, repo_states
+from src.core.config import get_settings
+from src.core.index_state import bump_index_generation, get_index_generation
+from src.core.store import (
+    building_collections,
+    collection_info,
+    collection_write_lock,
+    get_collection,
+    update_collection_info,
+)
+from src.core.usage import new_run_id, usage_scope
+from src.rag.embedder import get_embedder
+from src.rag.graph_expansion import build_adjacency_map
+from src.rag.lexical_index import build_lexical_index
+from src.utils.process_file import flush_file_buffer, get_connections, get_descriptions, process_directory, repo_of
+
+
+def _ignored(path: str) -> bool:
+    return ".git" in Path(path).parts
+
+
+class ChangeBuffer:
+    """
+    Paths reported by the watcher, collected until a burst of changes is
+    over: no new change for `debounce` seconds, or `max_delay` seconds
+    after the first one so a steady stream still gets indexed.
+    """
+
+    def __init__(self, debounce: float, max_delay: float):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._changed = set()
+        # new path -> path before the first move in this batch
+        self._renamed = {}
+        self._first = None
+        self._last = None
+
+    def _touch(self):
+        now = time.monotonic()
+        if self._first is None:
+            self._first = now
+        self._last = now
+
+    def add(self, path: str):
+        if _ignored(path):
+            return
+        with self._lock:
+            self._changed.add(path)
+            self._touch()
+
+    def rename(self, old: str, new: str):
+        if _ignored(old) or _ignored(new):
+            self.add(old)
+            self.add(new)
+            return
+        with self._lock:
+            # a -> b -> c within one batch is a single move a -> c
+            self._renamed[new] = self._renamed.pop(old, old)
+            self._touch()
+
+    def ready(self) -> bool:
+        with self._lock:
+            if self._first is None:
+                return False
+            now = time.monotonic()
+            return now - self._last >= self.debounce or now - self._first >= self.max_delay
+
+    def requeue(self, changed, renamed):
+        """
+        Put back a batch that could not be indexed, ahead of the changes
+        collected since.
+        """
+        with self._lock:
+            moves = {new: old for old, new in renamed}
+            for new, old in self._renamed.items():
+                moves[new] = moves.pop(old, old)
+            self._renamed = moves
+            self._changed |= set(changed)
+            self._touch()
+
+    def drain(self):
+        with self._lock:
+            changed = self._changed
+            renamed = [(old, new) for new, old in self._renamed.items() if old != new]
+            self._changed = set()
+            self._renamed = {}
+            self._first = self._last = None
+        return changed, renamed
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, buffer: ChangeBuffer):
+        super().__init__()
+        self.buffer = buffer
+
+    def on_any_event(self, event):
+        if event.event_type == "moved":
+            self.buffer.rename(event.src_path, event.dest_path)
+        elif event.event_type in ("created", "deleted") or (
+            event.event_type == "modified" and not event.is_directory
+        ):
+            self.buffer.add(event.src_path)
+
+
+def _snapshot(root: Path) -> dict:
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != ".git"]
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files[path] = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def _diff_snapshots(buffer: ChangeBuffer, before: dict, after: dict):
+    """
+    Feed the difference of two scans into `buffer`. A path that vanished
+    and one that appeared with the same inode are reported as a move.
+    """
+    removed = {before[path][0]: path for path in before.keys() - after.keys()}
+    for path in after.keys() - before.keys():
+        old = removed.pop(after[path][0], None)
+        if old is not None:
+            buffer.rename(old, path)
+            if after[path][1:] != before[old][1:]:
+                buffer.add(path)
+        else:
+            buffer.add(path)
+    for path in removed.values():
+        buffer.add(path)
+    for path in before.keys() & after.keys():
+        if before[path] != after[path]:
+            buffer.add(path)
+
+
+def index_files(collection, files) -> int:
+    """
+    Describe, embed and upsert `files`. Returns how many were written.
+    """
+    settings = get_settings()
+    connections = {}
+    by_repo = {}
+    for file in files:
+        try:
+            file_connections = get_connections(file)
+        except OSError:
+            continue
+        if file_connections["language"] == "unknown":
+            continue
+        connections[str(file)] = file_connections
+        by_repo.setdefault(repo_of(file), []).append(file)
+
+    buffer = []
+    for repo, repo_files in by_repo.items():
+        with usage_scope(stage="file_description", repo=repo):
+            descriptions = get_descriptions(repo_files)
+        for path, description in descriptions.items():
+            buffer.append({
+                "file": Path(path),
+                "description": description,
+                "connections": connections[path],
+            })
+
+    embedder = get_embedder()
+    for start in range(0, len(buffer), settings.BATCH_SIZE):
+        flush_file_buffer(collection, buffer[start:start + settings.BATCH_SIZE], embedder)
+    return len(buffer)
+
+
+class BuildInProgress(Exception):
+    """A collection that will replace the active one is being built."""
+
+
+class ActiveIndex:
+    """
+    What the watcher keeps between batches so that a batch costs what it
+    touches, not the size of the collection: the metadata of every node of
+    the active collection, updated with the watcher's own writes and read
+    again only when another writer changed the collection, and the BM25
+    index and adjacency map, which are rebuilt from a full scan at most
+    once per `rebuild_interval`.
+    """
+
+    def __init__(self, rebuild_interval: float):
+        self.rebuild_interval = rebuild_interval
+        self.name = None
+        self.generation = None
+        self.nodes = {}
+        self.stale_artifacts = False
+        self.last_rebuild = time.monotonic()
+
+    def load(self, collection) -> dict:
+        # Other in-place writers bump the generation under the same lock.
+        generation = get_index_generation()
+        if collection.name != self.name or generation != self.generation:
+            self.nodes = _indexed_nodes(collection)
+            self.name = collection.name
+            self.generation = generation
+        return self.nodes
+
+    def refresh(self, collection, ids):
+        ids = list(dict.fromkeys(ids))
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            entries = collection.get(ids=batch, include=["metadatas"])
+            found = dict(zip(entries["ids"], entries["metadatas"]))
+            for doc_id in batch:
+                if doc_id in found:
+                    self.nodes[doc_id] = found[doc_id] or {}
+                else:
+                    self.nodes.pop(doc_id, None)
+
+    def rebuild_due(self) -> bool:
+        return self.stale_artifacts and time.monotonic() - self.last_rebuild >= self.rebuild_interval
+
+    def rebuild(self):
+        """
+        Rebuild the BM25 index and adjacency map of the active collection
+        after the batches written since the last rebuild.
+        """
+        with collection_write_lock():
+            collection = get_collection()
+            if collection.name == self.name:
+                build_lexical_index(collection)
+                build_adjacency_map(collection)
+                # Answers cached since the batch were found without them.
+                if get_index_generation() == self.generation:
+                    self.generation = bump_index_generation()
+                else:
+                    bump_index_generation()
+        self.stale_artifacts = False
+        self.last_rebuild = time.monotonic()
+
+
+def index_batch(index: ActiveIndex, changed, renamed, record_commits: bool = True):
+    """
+    Bring the active collection up to date with one batch of changes, in
+    place: only the affected files are described and embedded, only their
+    ancestor directories summarized, and only links from or to them
+    recomputed. Readers pick the result up through the index generation;
+    the BM25 index and adjacency map follow at the next index.rebuild().
+
+    Raises BuildInProgress, without writing anything, while a collection
+    that will replace the active one is being built: the write would be
+    lost when it is activated.
+
+    With record_commits, the git state of the repos is recorded so the next
+    process.py run starts from here.
+    """
+    started = time.perf_counter()
+    with collection_write_lock():
+        building = building_collections()
+        if building:
+            raise BuildInProgress(", ".join(building))
+
+        commits = repo_states()
+        collection = get_collection()
+        nodes = index.load(collection)
+
+        with usage_scope(run_id=f"watch-{new_run_id()}"):
+            files, dirs = apply_changes(collection, changed, renamed, indexed=nodes)
+            written = index_files(collection, files)
+            for dir_path in dirs:
+                process_directory(collection, dir_path)
+        index.refresh(collection, [str(p) for p in files + dirs])
+
+        touched = set(changed) | {str(f) for f in files} | {p for pair in renamed for p in pair}
+        relinked = relink(touched, collection, metadatas=nodes, adjacency=False)
+
+        if record_commits:
+            update_collection_info(collection.name, commits=commits)
+        index.generation = bump_index_generation()
+        index.stale_artifacts = True
+
+    print(
+        f"Indexed {written} files, {len(renamed)} moves, {len(dirs)} dirs, "
+        f"{relinked} relinked in {time.perf_counter() - started:.1f}s (generation {index.generation})"
+    )
+
+
+def catch_up(buffer: ChangeBuffer) -> bool:
+    """
+    Queue what changed since the commits the active collection records, so
+    the first watched batch does not record commits past changes that were
+    never indexed. Returns False when there is nothing to start from.
+    """
+    previous = collection_info().get("commits")
+    if previous is None:
+        print("The active collection records no commits; run process.py to record them")
+        return False
+
+    changed, renamed = find_changes(get_collection(), previous)
+    print(f"Catching up: {len(changed)} changed, {len(renamed)} moved")
+    if changed or renamed:
+        buffer.requeue(changed, renamed)
+    return True
+
+
+def watch():
+    """
+    Follow CLONING_DIR and index changes as they happen, using inotify
+    through watchdog when it is installed and polling otherwise. Changes
+    made while it was not running are indexed first (see catch_up).
+    """
+    settings = get_settings()
+    root = Path(settings.CLONING_DIR).resolve()
+    buffer = ChangeBuffer(settings.WATCH_DEBOUNCE, settings.WATCH_MAX_DELAY)
+    index = ActiveIndex(settings.WATCH_REBUILD_INTERVAL)
+
+    observer = None
+    snapshot = None
+    if Observer is not None:
+        observer = Observer()
+        observer.schedule(_EventHandler(buffer), str(root), recursive=True)
+        observer.start()
+        print(f"Watching {root}")
+    else:
+        snapshot = _snapshot(root)
+        print(f"watchdog is not installed, polling {root} every {settings.WATCH_POLL_INTERVAL}s")
+
+    tick = min(0.5, settings.WATCH_DEBOUNCE / 2) or 0.1
+    last_poll = time.monotonic()
+    waiting_for = None
+    try:
+        # Started after the watcher, so changes made meanwhile are not lost.
+        # Until the index has reached the recorded commits, and after a
+        # failed batch, the recorded commits stay where they were so the
+        # next process.py run still picks up the changes that were missed.
+        try:
+            record_commits = catch_up(buffer)
+        except Exception:
+            traceback.print_exc()
+            record_commits = False
+
+        while True:
+            time.sleep(tick)
+
+            if snapshot is not None and time.monotonic() - last_poll >= settings.WATCH_POLL_INTERVAL:
+                last_poll = time.monotonic()
+                current = _snapshot(root)
+                _diff_snapshots(buffer, snapshot, current)
+                snapshot = current
+
+            if index.rebuild_due():
+                try:
+                    index.rebuild()
+                except Exception:
+                    traceback.print_exc()
+
+            if not buffer.ready():
+                continue
+
+            changed, renamed = buffer.drain()
+            try:
+                index_batch(index, changed, renamed, record_commits)
+                waiting_for = None
+            except BuildInProgress as e:
+                # Applied to the collection that replaces the active one.
+                buffer.requeue(changed, renamed)
+                if str(e) != waiting_for:
+                    waiting_for = str(e)
+                    print(f"Waiting for the build of {waiting_for} to finish")
+            except Exception:
+                traceback.print_exc()
+                record_commits = False
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+        if index.stale_artifacts:
+            index.rebuild()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index changes in CLONING_DIR continuously.")
+    parser.parse_args()
+    watch()